@@ -0,0 +1,295 @@
+import csv
+import json
+import uuid
+from collections import Counter
+from decimal import Decimal
+
+from pydantic import ValidationError
+from sqlalchemy import select, update, text, func, or_, any_, bindparam
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import cache
+from app.category_counts import apply_category_deltas, category_change
+from app.database import AsyncSessionLocal
+from app.models import Book
+from app.schemas import BookCreate, BulkBookUpdate
+from app.serialization import dumps
+
+# Rows validated and written per COPY + upsert round
+CHUNK_SIZE = 5000
+# Errors echoed back in the import summary (all are counted)
+MAX_REPORTED_ERRORS = 100
+# Rows fetched per server-side cursor round trip during export
+EXPORT_BATCH_SIZE = 1000
+# Rows locked and updated per transaction during bulk updates
+UPDATE_CHUNK_SIZE = 1000
+
+IMPORT_COLUMNS = (
+    "id", "title", "author", "isbn", "description", "price",
+    "stock_quantity", "category", "publisher", "published_date",
+)
+NULLABLE_FIELDS = ("description", "category", "publisher", "published_date")
+UPSERT_COLUMNS = [c for c in IMPORT_COLUMNS if c not in ("id", "isbn")]
+
+STAGING_DDL = text(
+    "CREATE TEMP TABLE IF NOT EXISTS books_staging "
+    "(LIKE books INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+)
+UPSERT_SQL = text(
+    f"INSERT INTO books ({', '.join(IMPORT_COLUMNS)}) "
+    f"SELECT {', '.join(IMPORT_COLUMNS)} FROM books_staging "
+    "ON CONFLICT (isbn) DO UPDATE SET "
+    + ", ".join(f"{c} = EXCLUDED.{c}" for c in UPSERT_COLUMNS)
+    + ", updated_at = now() "
+    "RETURNING id, (xmax = 0) AS inserted"
+)
+
+
+# ----------------------
+# Parsing: async byte chunks -> records
+# ----------------------
+async def iter_lines(chunks):
+    """Split an async stream of bytes into lines, still undecoded."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if buffer:
+        yield buffer.rstrip(b"\r")
+
+
+# Lines are decoded one at a time so a badly encoded line is reported as an
+# invalid row instead of aborting the import midway
+async def iter_ndjson(lines):
+    line_no = 0
+    async for raw in lines:
+        line_no += 1
+        try:
+            line = raw.decode("utf-8")
+        except UnicodeDecodeError as exc:
+            yield line_no, exc
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as exc:
+            yield line_no, exc
+
+
+async def iter_csv(lines):
+    """Yield (line_no, row dict); quoted fields may span lines."""
+    header = None
+    pending, start, line_no = "", 0, 0
+    async for raw in lines:
+        line_no += 1
+        if not pending:
+            start = line_no
+        try:
+            line = raw.decode("utf-8")
+        except UnicodeDecodeError as exc:
+            # The whole record the line belongs to is dropped
+            pending = ""
+            yield start, exc
+            continue
+        pending = f"{pending}\n{line}" if pending else line
+        # An odd quote count means a quoted field continues on the next line
+        if pending.count('"') % 2:
+            continue
+        record, pending = pending, ""
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        # Empty CSV cells mean "not provided"
+        yield start, {k: (v if v != "" else None) for k, v in zip(header, values)}
+    if pending:
+        yield start, ValueError("Unterminated quoted field")
+
+
+# ----------------------
+# Import: validate in chunks, COPY into staging, upsert on isbn
+# ----------------------
+def _validate_row(row: dict) -> BookCreate:
+    # Optional columns may be absent from a file; empty values mean "not provided"
+    values = {name: None for name in NULLABLE_FIELDS}
+    values.update({k: v for k, v in row.items() if v is not None})
+    return BookCreate(**values)
+
+
+def _to_record(book: BookCreate):
+    values = book.model_dump()
+    values["id"] = uuid.uuid4()
+    values["price"] = Decimal(str(values["price"]))
+    return tuple(values[c] for c in IMPORT_COLUMNS)
+
+
+async def _upsert_chunk(db: AsyncSession, books):
+    # Last row wins when a chunk repeats an isbn; ON CONFLICT cannot touch a row twice
+    by_isbn = {book.isbn: book for book in books}
+
+    await db.execute(STAGING_DDL)
+    conn = await db.connection()
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "books_staging",
+        records=[_to_record(b) for b in by_isbn.values()],
+        columns=IMPORT_COLUMNS,
+    )
+    # Category counters: new categories in, categories of overwritten rows out
+    deltas = Counter(book.category for book in by_isbn.values())
+    previous = await db.execute(text(
+        "SELECT b.category FROM books b JOIN books_staging s ON s.isbn = b.isbn FOR UPDATE OF b"
+    ))
+    deltas.subtract(row.category for row in previous)
+
+    result = await db.execute(UPSERT_SQL)
+    rows = result.all()
+    await apply_category_deltas(db, deltas)
+    await db.commit()
+
+    updated_ids = [row.id for row in rows if not row.inserted]
+    await cache.invalidate_books(updated_ids)
+    inserted = len(rows) - len(updated_ids)
+    return inserted, len(updated_ids)
+
+
+async def import_books(db: AsyncSession, lines, fmt: str = "ndjson"):
+    """
+    Stream rows from an async iterator of lines into the catalog. Each chunk
+    commits independently; invalid rows are skipped and reported.
+    """
+    records = iter_csv(lines) if fmt == "csv" else iter_ndjson(lines)
+    summary = {"processed": 0, "inserted": 0, "updated": 0, "error_count": 0, "errors": []}
+
+    def record_error(line_no, message):
+        summary["error_count"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+            summary["errors"].append({"line": line_no, "error": message})
+
+    chunk = []
+    async for line_no, row in records:
+        summary["processed"] += 1
+        if isinstance(row, Exception):
+            record_error(line_no, str(row))
+            continue
+        try:
+            chunk.append(_validate_row(row))
+        except (ValidationError, TypeError, AttributeError) as exc:
+            record_error(line_no, str(exc))
+            continue
+        if len(chunk) >= CHUNK_SIZE:
+            inserted, updated = await _upsert_chunk(db, chunk)
+            summary["inserted"] += inserted
+            summary["updated"] += updated
+            chunk = []
+
+    if chunk:
+        inserted, updated = await _upsert_chunk(db, chunk)
+        summary["inserted"] += inserted
+        summary["updated"] += updated
+    return summary
+
+
+# ----------------------
+# Bulk update: set-based UPDATE over a filter or id list, in id-ordered chunks
+# ----------------------
+def _new_value(field: str, op: str, value):
+    column = getattr(Book, field)
+    if field != "price":
+        return value
+    amount = Decimal(str(value))
+    if op == "multiply":
+        return func.round(column * amount, 2)
+    if op == "add":
+        return column + amount
+    return amount
+
+
+def _bulk_targets(request: BulkBookUpdate):
+    query = select(Book.id, Book.category)
+    if request.ids is not None:
+        ids_param = bindparam("ids", value=request.ids, type_=postgresql.ARRAY(postgresql.UUID(as_uuid=True)))
+        return query.where(Book.id == any_(ids_param))
+    conditions = request.filter
+    if conditions.category is not None:
+        query = query.where(Book.category == conditions.category)
+    if conditions.author is not None:
+        query = query.where(Book.author == conditions.author)
+    if conditions.min_price is not None:
+        query = query.where(Book.price >= conditions.min_price)
+    if conditions.max_price is not None:
+        query = query.where(Book.price <= conditions.max_price)
+    return query
+
+
+async def bulk_update_books(db: AsyncSession, request: BulkBookUpdate):
+    """
+    Apply the operations to every matching book. Each chunk locks its rows in
+    id order, runs one UPDATE ... RETURNING and commits, so locks are held
+    briefly and concurrent writers cannot deadlock against it. Rows already
+    at the target value, or whose price would go negative, are left alone;
+    updated < matched counts them. Caches are invalidated once at the end.
+    """
+    values = {op.field: _new_value(op.field, op.op, op.value) for op in request.operations}
+    # Skipping no-op rows keeps them out of the change feed and the caches
+    conditions = [or_(*(getattr(Book, field).is_distinct_from(value) for field, value in values.items()))]
+    if "price" in values:
+        conditions.append(values["price"] >= 0)
+
+    targets = _bulk_targets(request).order_by(Book.id).limit(UPDATE_CHUNK_SIZE).with_for_update()
+    summary = {"matched": 0, "updated": 0}
+    updated_ids = []
+    last_id = None
+    while True:
+        query = targets if last_id is None else targets.where(Book.id > last_id)
+        locked = (await db.execute(query)).all()
+        if not locked:
+            break
+        last_id = locked[-1].id
+        previous = {row.id: row.category for row in locked}
+
+        ids_param = bindparam("chunk_ids", value=list(previous), type_=postgresql.ARRAY(postgresql.UUID(as_uuid=True)))
+        result = await db.execute(
+            update(Book)
+            .where(Book.id == any_(ids_param), *conditions)
+            .values(**values)
+            .returning(Book.id, Book.category)
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+        deltas = Counter()
+        for row in rows:
+            deltas.update(category_change(previous[row.id], row.category))
+        await apply_category_deltas(db, deltas)
+        await db.commit()
+
+        summary["matched"] += len(locked)
+        summary["updated"] += len(rows)
+        updated_ids.extend(row.id for row in rows)
+    await db.rollback()
+
+    if updated_ids:
+        await cache.invalidate_books(updated_ids)
+    return summary
+
+
+# ----------------------
+# Export: server-side cursor -> NDJSON
+# ----------------------
+async def export_books_ndjson():
+    """
+    Yield the catalog as NDJSON, one batch of lines at a time. Opens its own
+    session because the response streams after request dependencies close.
+    """
+    columns = [c for c in Book.__table__.columns]
+    query = select(*columns).order_by(Book.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            yield b"".join(dumps(row._asdict()) + b"\n" for row in rows)
@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import json
+import uuid
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from app.serialization import dumps, loads
+from app.config import (
+    REDIS_HOST, REDIS_PORT, REDIS_DB,
+    CACHE_ENABLED, CACHE_LOCK_TIMEOUT_MS,
+)
+
+redis_client = redis.Redis(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    decode_responses=True
+)
+
+# ----------------------
+# Key layout
+# ----------------------
+# books:book:{id}:version          -> counter bumped on every write to the book
+# books:book:{id}:v{version}       -> one book; a bump orphans it, so a load
+#                                     that raced the write cannot re-cache
+#                                     stale data under the live key
+# books:catalog:version            -> counter bumped on every catalog write
+# books:v{version}:{name}:{digest} -> list pages / categories; a version bump
+#                                     orphans them and TTL reclaims the memory
+# {key}:lock                       -> random token of the worker loading key
+CATALOG_VERSION_KEY = "books:catalog:version"
+LOCK_POLL_SECONDS = 0.05
+
+# Delete the lock only while it still holds our token: once it has expired
+# and another worker took it over, that worker's lock is left alone
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.lock_waits = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "lock_waits": self.lock_waits,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+stats = CacheStats()
+
+# Loads currently running in this worker, keyed by cache key
+_inflight = {}
+
+
+def _book_ref(book_id) -> str:
+    # Path ids arrive as typed, bulk ids as UUIDs: key both the same way
+    try:
+        return str(uuid.UUID(str(book_id)))
+    except ValueError:
+        return str(book_id)
+
+
+def book_version_key(book_id) -> str:
+    return f"books:book:{_book_ref(book_id)}:version"
+
+
+async def book_key(book_id):
+    """Build the book's version-scoped key, or None when Redis is unavailable."""
+    if not CACHE_ENABLED:
+        return None
+    try:
+        version = await redis_client.get(book_version_key(book_id)) or 0
+    except RedisError:
+        stats.errors += 1
+        return None
+    return f"books:book:{_book_ref(book_id)}:v{version}"
+
+
+async def catalog_key(name: str, params: dict):
+    """Build a version-scoped key, or None when Redis is unavailable."""
+    if not CACHE_ENABLED:
+        return None
+    try:
+        version = await redis_client.get(CATALOG_VERSION_KEY) or 0
+    except RedisError:
+        stats.errors += 1
+        return None
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    return f"books:v{version}:{name}:{digest}"
+
+
+async def get_or_load(key, loader, ttl: int):
+    """Like get_or_load_raw, but decodes the JSON."""
+    return loads(await get_or_load_raw(key, loader, ttl))
+
+
+async def get_or_load_raw(key, loader, ttl: int):
+    """
+    Return the cached JSON text for key, or await loader(), serialize its
+    result and cache it. Concurrent misses for the same key share one load:
+    in-process through a shared future, across workers through a short
+    Redis lock.
+    """
+    if key is None or not CACHE_ENABLED:
+        return dumps(await loader())
+
+    try:
+        cached = await redis_client.get(key)
+    except RedisError:
+        stats.errors += 1
+        return dumps(await loader())
+
+    if cached is not None:
+        stats.hits += 1
+        return cached
+    stats.misses += 1
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        value = await _load_locked(key, loader, ttl)
+        future.set_result(value)
+        return value
+    except Exception as exc:
+        future.set_exception(exc)
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+    finally:
+        if not future.done():
+            future.cancel()
+        _inflight.pop(key, None)
+
+
+async def _load_locked(key, loader, ttl: int):
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    try:
+        acquired = await redis_client.set(lock_key, token, nx=True, px=CACHE_LOCK_TIMEOUT_MS)
+    except RedisError:
+        stats.errors += 1
+        return dumps(await loader())
+
+    if not acquired:
+        # Another worker is loading: wait for its value instead of piling on
+        stats.lock_waits += 1
+        waited = 0.0
+        while waited * 1000 < CACHE_LOCK_TIMEOUT_MS:
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+            waited += LOCK_POLL_SECONDS
+            try:
+                cached = await redis_client.get(key)
+            except RedisError:
+                stats.errors += 1
+                break
+            if cached is not None:
+                return cached
+        return dumps(await loader())
+
+    try:
+        value = dumps(await loader())
+        try:
+            await redis_client.set(key, value, ex=ttl)
+        except RedisError:
+            stats.errors += 1
+        return value
+    finally:
+        try:
+            await redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+        except RedisError:
+            stats.errors += 1
+
+
+# ----------------------
+# Invalidation (O(1), no key scans)
+# ----------------------
+async def bump_catalog_version():
+    if not CACHE_ENABLED:
+        return
+    try:
+        await redis_client.incr(CATALOG_VERSION_KEY)
+    except RedisError:
+        stats.errors += 1
+
+
+async def invalidate_book(book_id):
+    await invalidate_books([book_id])
+
+
+async def invalidate_books(book_ids):
+    if not CACHE_ENABLED:
+        return
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for book_id in book_ids:
+                pipe.incr(book_version_key(book_id))
+            pipe.incr(CATALOG_VERSION_KEY)
+            await pipe.execute()
+    except RedisError:
+        stats.errors += 1
@@ -0,0 +1,102 @@
+import asyncio
+from collections import Counter
+
+from sqlalchemy import select, text, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import cache
+from app.database import AsyncSessionLocal
+from app.models import Book, CategoryCount
+
+# Any constant works; it only has to be unique among this app's advisory locks
+RECONCILE_LOCK_ID = 31_001
+
+
+# ----------------------
+# Transactional counter updates
+# ----------------------
+async def apply_category_deltas(db: AsyncSession, deltas):
+    """
+    Add deltas ({category: +n/-n}) to the counters inside the caller's
+    transaction. Rows are upserted in name order so concurrent writers
+    touching several categories lock them in the same order.
+    """
+    rows = [
+        {"category": category, "book_count": delta}
+        for category, delta in sorted(Counter(deltas).items())
+        if category and delta
+    ]
+    if not rows:
+        return
+    stmt = insert(CategoryCount).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CategoryCount.category],
+        set_={"book_count": CategoryCount.book_count + stmt.excluded.book_count},
+    )
+    await db.execute(stmt)
+
+
+def category_change(old_category, new_category):
+    """Deltas for one book moving from old_category to new_category."""
+    deltas = Counter()
+    if old_category != new_category:
+        if old_category:
+            deltas[old_category] -= 1
+        if new_category:
+            deltas[new_category] += 1
+    return deltas
+
+
+# ----------------------
+# Drift reconciliation
+# ----------------------
+async def reconcile_category_counts(db: AsyncSession):
+    """
+    Recount books per category and fix counters that drifted. Returns the
+    number of corrected rows, or None when another worker holds the job.
+    """
+    locked = await db.execute(text(f"SELECT pg_try_advisory_xact_lock({RECONCILE_LOCK_ID})"))
+    if not locked.scalar():
+        await db.rollback()
+        return None
+
+    # Blocks counter writers until commit, so the recount sees every
+    # transaction that touched a counter before it
+    await db.execute(text("LOCK TABLE category_counts IN SHARE ROW EXCLUSIVE MODE"))
+
+    actual = select(Book.category, func.count().label("book_count")).where(
+        Book.category.isnot(None)
+    ).group_by(Book.category)
+    stmt = insert(CategoryCount).from_select(["category", "book_count"], actual)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CategoryCount.category],
+        set_={"book_count": stmt.excluded.book_count},
+        where=CategoryCount.book_count != stmt.excluded.book_count,
+    )
+    fixed = (await db.execute(stmt)).rowcount
+
+    emptied = await db.execute(text(
+        "UPDATE category_counts SET book_count = 0 "
+        "WHERE book_count <> 0 AND NOT EXISTS "
+        "(SELECT 1 FROM books WHERE books.category = category_counts.category)"
+    ))
+    await db.commit()
+
+    corrected = fixed + emptied.rowcount
+    if corrected:
+        await cache.bump_catalog_version()
+    return corrected
+
+
+async def run_reconciliation(interval: int):
+    """Background loop: reconcile now, then every interval seconds."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                fixed = await reconcile_category_counts(session)
+            if fixed:
+                print(f"Category counts reconciled: {fixed} rows corrected")
+        except Exception as e:
+            print(f"Category count reconciliation failed: {e}")
+        await asyncio.sleep(interval)
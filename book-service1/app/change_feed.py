@@ -0,0 +1,253 @@
+import asyncio
+from datetime import timedelta
+
+import asyncpg
+from fastapi import HTTPException
+from sqlalchemy import select, delete, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import DATABASE_DSN
+from app.database import AsyncSessionLocal
+from app.models import Book, BookChange
+from app.schemas import BookOut
+
+# A seq missing from book_changes either rolled back or belongs to a
+# transaction that has not committed yet. Readers move past it but keep it
+# in their cursor and look for it again on every read; one that has not
+# appeared GAP_TIMEOUT after it was first seen is taken for a rollback.
+GAP_TIMEOUT = timedelta(minutes=10)
+# Gap ranges a cursor tracks at most; past that the oldest are given up
+MAX_GAPS = 100
+# How far below the head a cursor taken at the head looks for gaps
+HEAD_GAP_LOOKBACK = 1000
+# Upper bound on a single wait, so awaited gaps are re-checked
+WAIT_SLICE_SECONDS = 1.0
+
+BOOK_COLUMNS = [getattr(Book, name).label(f"b_{name}") for name in BookOut.model_fields]
+
+
+class ChangeNotifier:
+    """
+    LISTENs on the book_changes channel over a dedicated connection and
+    wakes every waiting long-poll request. Without the listener, waits
+    degrade to short sleeps.
+    """
+
+    def __init__(self):
+        self._event = asyncio.Event()
+        self._conn = None
+
+    async def start(self):
+        try:
+            self._conn = await asyncpg.connect(DATABASE_DSN)
+            await self._conn.add_listener("book_changes", self._on_notify)
+        except Exception as e:
+            print(f"Change feed listener unavailable, falling back to polling: {e}")
+            self._conn = None
+
+    async def stop(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    def _on_notify(self, *args):
+        # Swap in a fresh event so later waiters block until the next notify
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def wait(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+notifier = ChangeNotifier()
+
+
+class ChangeCursor:
+    """
+    A reader's position in book_changes: every seq up to seq has been read,
+    except the gap ranges, which are still awaited. As text it is "seq", or
+    "seq:lo-hi@t,..." with t the epoch second a range was first seen.
+    """
+
+    def __init__(self, seq: int = 0, gaps=None):
+        self.seq = seq
+        self.gaps = list(gaps or [])  # [lo, hi, first seen], ascending
+
+    @classmethod
+    def parse(cls, text: str):
+        try:
+            head, _, tail = text.partition(":")
+            gaps = []
+            for part in filter(None, tail.split(",")):
+                span, _, seen = part.partition("@")
+                lo, _, hi = span.partition("-")
+                gaps.append([int(lo), int(hi), int(seen)])
+            cursor = cls(int(head), sorted(gaps))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # Each gap becomes a clause in pending(), so accept only what accept()
+        # could have produced: at most MAX_GAPS disjoint ranges below seq
+        if cursor.seq < 0 or len(cursor.gaps) > MAX_GAPS:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        previous_hi = 0
+        for lo, hi, _ in cursor.gaps:
+            if not previous_hi < lo <= hi < cursor.seq:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            previous_hi = hi
+        return cursor
+
+    def __str__(self):
+        if not self.gaps:
+            return str(self.seq)
+        return f"{self.seq}:" + ",".join(f"{lo}-{hi}@{seen}" for lo, hi, seen in self.gaps)
+
+    def pending(self):
+        """Condition on BookChange.seq for the rows this cursor has not read."""
+        return or_(
+            BookChange.seq > self.seq,
+            *[BookChange.seq.between(lo, hi) for lo, hi, _ in self.gaps],
+        )
+
+    def accept(self, seq: int, now: int) -> bool:
+        """Record seq as read; True when it fills a gap, i.e. arrived late."""
+        for i, (lo, hi, seen) in enumerate(self.gaps):
+            if lo <= seq <= hi:
+                # Splitting a range adds one, so the cap applies here too
+                self.gaps[i:i + 1] = [g for g in ([lo, seq - 1, seen], [seq + 1, hi, seen]) if g[0] <= g[1]]
+                del self.gaps[:-MAX_GAPS]
+                return True
+        if seq > self.seq + 1:
+            self.gaps.append([self.seq + 1, seq - 1, now])
+            del self.gaps[:-MAX_GAPS]
+        self.seq = max(self.seq, seq)
+        return False
+
+    def expire(self, now: int, oldest: int = None):
+        """Give up gaps older than GAP_TIMEOUT or pruned from the feed."""
+        cutoff = now - GAP_TIMEOUT.total_seconds()
+        self.gaps = [
+            g for g in self.gaps
+            if g[2] > cutoff and (oldest is None or g[1] >= oldest)
+        ]
+
+
+async def clock(db: AsyncSession) -> int:
+    """The database's wall clock in epoch seconds, for gap first-seen times."""
+    result = await db.execute(select(func.extract("epoch", func.clock_timestamp())))
+    return int(result.scalar())
+
+
+async def _head(db: AsyncSession) -> int:
+    result = await db.execute(select(func.coalesce(func.max(BookChange.seq), 0)))
+    return result.scalar()
+
+
+async def _oldest(db: AsyncSession):
+    result = await db.execute(select(func.min(BookChange.seq)))
+    return result.scalar()
+
+
+async def head_cursor(db: AsyncSession) -> ChangeCursor:
+    """
+    A cursor at the current head that still awaits the seqs missing just
+    below it, which may belong to transactions that have not committed.
+    """
+    head = await _head(db)
+    start = max(head - HEAD_GAP_LOOKBACK, (await _oldest(db) or 1) - 1, 0)
+    seqs = await db.execute(
+        select(BookChange.seq).where(BookChange.seq > start).order_by(BookChange.seq)
+    )
+    now = await clock(db)
+    cursor = ChangeCursor(start)
+    for seq in seqs.scalars():
+        cursor.accept(seq, now)
+    return cursor
+
+
+async def _read_batch(db: AsyncSession, cursor: ChangeCursor, limit: int):
+    oldest = await _oldest(db)
+    if oldest is not None and cursor.seq < oldest - 1:
+        raise HTTPException(status_code=410, detail="Cursor expired; resync and restart from the current head")
+
+    result = await db.execute(
+        select(BookChange.seq, BookChange.op, BookChange.book_id, BookChange.changed_at, *BOOK_COLUMNS)
+        .outerjoin(Book, Book.id == BookChange.book_id)
+        .where(cursor.pending())
+        .order_by(BookChange.seq)
+        .limit(limit)
+    )
+    rows = result.all()
+    now = await clock(db)
+
+    changes = []
+    for row in rows:
+        book = None
+        if row.b_id is not None:
+            book = {name: getattr(row, f"b_{name}") for name in BookOut.model_fields}
+        op = row.op
+        if cursor.accept(row.seq, now):
+            # Out of seq order: report the book's current state instead, so
+            # a late tombstone cannot undo a newer write already delivered
+            op = "upsert" if book is not None else "delete"
+        changes.append({
+            "seq": row.seq,
+            "op": op,
+            "book_id": row.book_id,
+            "changed_at": row.changed_at,
+            "book": book if op == "upsert" else None,
+        })
+    cursor.expire(now, oldest)
+    return {"changes": changes, "next_cursor": str(cursor)}
+
+
+async def read_changes(db: AsyncSession, since: str = None, limit: int = 500, wait: float = 0):
+    """
+    Return changes after the since cursor, in seq order apart from late
+    arrivals: changes whose transaction committed after a later seq had
+    already been read come first, carrying the book's current state.
+    Upserts carry the book's current state, or null when it has since been
+    deleted; deletes are tombstones. Without since, only the current head
+    cursor is returned: take it, export the catalog, then follow the feed
+    from that cursor. With wait > 0 an empty read blocks up to wait seconds
+    for new changes.
+    """
+    if since is None:
+        return {"changes": [], "next_cursor": str(await head_cursor(db))}
+
+    cursor = ChangeCursor.parse(since)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        batch = await _read_batch(db, cursor, limit)
+        remaining = deadline - loop.time()
+        if batch["changes"] or remaining <= 0:
+            return batch
+        # Don't sit idle in a transaction while waiting
+        await db.rollback()
+        await notifier.wait(min(remaining, WAIT_SLICE_SECONDS))
+
+
+async def prune_changes(db: AsyncSession, retention_days: int):
+    """Delete changes older than the retention window, keeping the newest row."""
+    head = await _head(db)
+    result = await db.execute(
+        delete(BookChange).where(
+            BookChange.changed_at < func.now() - timedelta(days=retention_days),
+            BookChange.seq < head,
+        )
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def run_pruning(retention_days: int, interval: int = 3600):
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                await prune_changes(session, retention_days)
+        except Exception as e:
+            print(f"Change feed pruning failed: {e}")
+        await asyncio.sleep(interval)
@@ -26,3 +26,34 @@ REDIS_DB = 0
 
 # GCP Pub/Sub
 GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID", "bookhub-service-project")
+
+# Cache
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+BOOK_CACHE_TTL = int(os.getenv("BOOK_CACHE_TTL", 300))
+LIST_CACHE_TTL = int(os.getenv("LIST_CACHE_TTL", 60))
+CACHE_LOCK_TIMEOUT_MS = int(os.getenv("CACHE_LOCK_TIMEOUT_MS", 5000))
+
+# Category counters: seconds between drift reconciliation runs (0 disables)
+CATEGORY_RECONCILE_INTERVAL = int(os.getenv("CATEGORY_RECONCILE_INTERVAL", 3600))
+
+# In-process catalog snapshot for list queries (off by default)
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "false").lower() == "true"
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv("SNAPSHOT_REFRESH_INTERVAL", 5))
+SNAPSHOT_FULL_RELOAD_INTERVAL = float(os.getenv("SNAPSHOT_FULL_RELOAD_INTERVAL", 600))
+
+# Change feed
+DATABASE_DSN = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+CHANGE_FEED_MAX_WAIT = int(os.getenv("CHANGE_FEED_MAX_WAIT", 30))
+CHANGE_RETENTION_DAYS = int(os.getenv("CHANGE_RETENTION_DAYS", 7))
+
+# Autocomplete index
+SUGGEST_ENABLED = os.getenv("SUGGEST_ENABLED", "true").lower() == "true"
+SUGGEST_REFRESH_INTERVAL = float(os.getenv("SUGGEST_REFRESH_INTERVAL", 2))
+SUGGEST_FULL_RELOAD_INTERVAL = float(os.getenv("SUGGEST_FULL_RELOAD_INTERVAL", 3600))
+
+# Similar-books index: built offline by build_similar.py, memory-mapped by workers
+SIMILAR_INDEX_DIR = os.getenv("SIMILAR_INDEX_DIR", "data/similar")
+SIMILAR_RELOAD_INTERVAL = float(os.getenv("SIMILAR_RELOAD_INTERVAL", 60))
+
+# Hot-item stock: seconds between writebacks of Redis shard totals to Postgres
+HOT_STOCK_WRITEBACK_INTERVAL = float(os.getenv("HOT_STOCK_WRITEBACK_INTERVAL", 5))
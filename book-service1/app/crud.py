@@ -1,9 +1,22 @@
+import json
+from typing import List
+from uuid import UUID
+from datetime import date
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc, asc, or_
+from sqlalchemy import (
+    select, update, func, desc, asc, or_, tuple_, literal, literal_column, text, case, any_, bindparam
+)
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
-from app.models import Book, Category
-from app.schemas import BookCreate, BookUpdate, BookOut
+from fastapi.encoders import jsonable_encoder
+from app import cache, hot_stock, snapshot
+from app.category_counts import apply_category_deltas, category_change
+from app.config import BOOK_CACHE_TTL, LIST_CACHE_TTL
+from app.models import Book, Category, CategoryCount, PUBLISHED_DATE_SORT_KEY
+from app.schemas import BookCreate, BookUpdate, BookOut, StockAdjustment
+from app.pagination import encode_cursor, decode_cursor
+from app.serialization import dumps
 
 # ----------------------
 # Create Book
@@ -13,62 +26,231 @@ async def create_book(db: AsyncSession, book_data: BookCreate):
 
     db.add(new_book)
     try:
+        await apply_category_deltas(db, category_change(None, new_book.category))
         await db.commit()
         await db.refresh(new_book)
-        return BookOut.from_orm(new_book)
     except IntegrityError:
         await db.rollback()
         raise HTTPException(status_code=400, detail="ISBN already exists")
 
+    await cache.bump_catalog_version()
+    return BookOut.from_orm(new_book)
+
 # ----------------------
 # Get Book by ID
 # ----------------------
 async def get_book(db: AsyncSession, book_id: str):
-    result = await db.execute(select(Book).where(Book.id == book_id))
-    book = result.scalar_one_or_none()
-    if not book:
-        raise HTTPException(status_code=404, detail="Book not found")
-    return BookOut.from_orm(book)
+    async def load():
+        result = await db.execute(select(Book).where(Book.id == book_id))
+        book = result.scalar_one_or_none()
+        if not book:
+            raise HTTPException(status_code=404, detail="Book not found")
+        return jsonable_encoder(BookOut.from_orm(book))
+
+    data = await cache.get_or_load(await cache.book_key(book_id), load, BOOK_CACHE_TTL)
+    return BookOut(**data)
+
+# ----------------------
+# Get Many Books by ID
+# ----------------------
+BOOK_FIELDS = tuple(BookOut.model_fields)
+MAX_BATCH_IDS = 500
+
+
+async def get_books_by_ids(db: AsyncSession, book_ids: List[UUID], fields: List[str] = None):
+    fields = list(fields or BOOK_FIELDS)
+    unknown = [f for f in fields if f not in BOOK_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    # Keep first-seen order, drop duplicates
+    book_ids = list(dict.fromkeys(book_ids))
+    if len(book_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+
+    # id is always selected so rows can be matched back to the request
+    columns = [Book.id] + [getattr(Book, f) for f in fields if f != "id"]
+    ids_param = bindparam("ids", value=book_ids, type_=postgresql.ARRAY(postgresql.UUID(as_uuid=True)))
+    result = await db.execute(select(*columns).where(Book.id == any_(ids_param)))
+    found = {row.id: dict(row._mapping) for row in result}
+
+    return jsonable_encoder({
+        "items": [found[book_id] for book_id in book_ids if book_id in found],
+        "missing": [book_id for book_id in book_ids if book_id not in found],
+    })
+
 
 # ----------------------
 # Update Book
 # ----------------------
 async def update_book(db: AsyncSession, book_id: str, update_data: BookUpdate):
-    result = await db.execute(select(Book).where(Book.id == book_id))
+    # Locked so concurrent category changes take their deltas from the
+    # committed row, not the same stale one
+    result = await db.execute(select(Book).where(Book.id == book_id).with_for_update())
     book = result.scalar_one_or_none()
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
 
-    for key, value in update_data.dict(exclude_unset=True).items():
+    old_category = book.category
+    changes = update_data.dict(exclude_unset=True)
+    if book.hot_stock and "stock_quantity" in changes:
+        raise HTTPException(status_code=409, detail="Stock of a hot-item book is managed in Redis; disable hot-item mode first")
+    for key, value in changes.items():
         setattr(book, key, value)
 
+    await apply_category_deltas(db, category_change(old_category, book.category))
     await db.commit()
     await db.refresh(book)
+    await cache.invalidate_book(book_id)
     return BookOut.from_orm(book)
 
 # ----------------------
 # Delete Book
 # ----------------------
 async def delete_book(db: AsyncSession, book_id: str):
-    result = await db.execute(select(Book).where(Book.id == book_id))
+    result = await db.execute(select(Book).where(Book.id == book_id).with_for_update())
     book = result.scalar_one_or_none()
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
 
     await db.delete(book)
+    await apply_category_deltas(db, category_change(book.category, None))
+    await db.commit()
+    snapshot.catalog.discard(book_id)
+    await cache.invalidate_book(book_id)
+
+# ----------------------
+# Adjust Stock (atomic)
+# ----------------------
+async def adjust_stock(db: AsyncSession, book_id: str, quantity_change: int):
+    # Hot-stock keys are built from the canonical form, as the UUID-typed
+    # batch and hot-stock routes produce it
+    try:
+        book_id = str(UUID(book_id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Book not found")
+    shards = (await hot_stock.hot_shards([book_id])).get(book_id)
+    if shards:
+        level = await hot_stock.adjust(db, book_id, quantity_change, shards)
+        if level is not None:
+            book = await get_book(db, book_id)
+            return book.model_copy(update={"stock_quantity": level})
+
+    # Single conditional UPDATE: the check and the write cannot interleave.
+    # Hot books are skipped: their Postgres stock is only a mirror.
+    new_quantity = func.coalesce(Book.stock_quantity, 0) + quantity_change
+    result = await db.execute(
+        update(Book)
+        .where(Book.id == book_id, new_quantity >= 0, Book.hot_stock.is_(False))
+        .values(stock_quantity=new_quantity)
+        .returning(Book)
+        .execution_options(synchronize_session=False)
+    )
+    book = result.scalar_one_or_none()
+    if not book:
+        await db.rollback()
+        exists = await db.execute(select(Book.hot_stock).where(Book.id == book_id))
+        hot = exists.scalar_one_or_none()
+        if hot is None:
+            raise HTTPException(status_code=404, detail="Book not found")
+        if hot:
+            # Switched on meanwhile, or Redis unreachable: never fall back to the mirror
+            raise HTTPException(status_code=503, detail="Hot-item stock is temporarily unavailable")
+        raise HTTPException(status_code=400, detail="Insufficient stock")
+
+    await db.commit()
+    await cache.invalidate_book(book_id)
+    return BookOut.from_orm(book)
+
+
+# ----------------------
+# Adjust Stock for Many Books (all-or-nothing)
+# ----------------------
+async def adjust_stock_batch(db: AsyncSession, adjustments: List[StockAdjustment]):
+    deltas = {}
+    for adj in adjustments:
+        deltas[adj.book_id] = deltas.get(adj.book_id, 0) + adj.quantity_change
+    # Hot books move in Redis first; undone if the Postgres part fails
+    shards = await hot_stock.hot_shards(deltas)
+    hot_levels, undo_hot = await hot_stock.adjust_many(
+        db, {book_id: deltas[book_id] for book_id in shards}, shards
+    )
+    book_ids = sorted(book_id for book_id in deltas if book_id not in shards)
+
+    try:
+        levels = await _adjust_stock_rows(db, book_ids, deltas)
+    except Exception:
+        await undo_hot()
+        raise
+    levels.update(hot_levels)
+    return {"items": [
+        {"book_id": book_id, "stock_quantity": levels[book_id]} for book_id in sorted(levels)
+    ]}
+
+
+async def _adjust_stock_rows(db: AsyncSession, book_ids: List[UUID], deltas: dict):
+    if not book_ids:
+        return {}
+
+    # Lock rows in id order so concurrent batches cannot deadlock
+    result = await db.execute(
+        select(Book.id, Book.stock_quantity, Book.hot_stock)
+        .where(Book.id.in_(book_ids))
+        .order_by(Book.id)
+        .with_for_update()
+    )
+    rows = result.all()
+    current = {row.id: row.stock_quantity or 0 for row in rows}
+
+    missing = [str(book_id) for book_id in book_ids if book_id not in current]
+    if missing:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail={"message": "Book not found", "book_ids": missing})
+
+    if any(row.hot_stock for row in rows):
+        await db.rollback()
+        raise HTTPException(status_code=503, detail="Hot-item stock is temporarily unavailable")
+
+    insufficient = [str(book_id) for book_id in book_ids if current[book_id] + deltas[book_id] < 0]
+    if insufficient:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail={"message": "Insufficient stock", "book_ids": insufficient})
+
+    row_deltas = {book_id: deltas[book_id] for book_id in book_ids}
+    result = await db.execute(
+        update(Book)
+        .where(Book.id.in_(book_ids))
+        .values(stock_quantity=func.coalesce(Book.stock_quantity, 0) + case(row_deltas, value=Book.id))
+        .returning(Book.id, Book.stock_quantity)
+        .execution_options(synchronize_session=False)
+    )
+    levels = {row.id: row.stock_quantity for row in result}
     await db.commit()
 
+    await cache.invalidate_books(book_ids)
+    return levels
+
+
 # ----------------------
 # List Books with Filters & Pagination
 # ----------------------
-async def list_books_filtered(
-    db: AsyncSession, page: int = 1, limit: int = 20,
-    category: str = None, author: str = None, search: str = None,
-    min_price: float = None, max_price: float = None,
-    sort_by: str = "title", sort_order: str = "asc"
-):
-    query = select(Book)
+SORT_KEYS = {
+    "title": Book.title,
+    "price": Book.price,
+    "published_date": PUBLISHED_DATE_SORT_KEY,
+}
+
+# Core columns for list pages: rows skip ORM hydration and the identity map
+LIST_COLUMNS = [getattr(Book, name) for name in BookOut.model_fields]
+
+# Upper bound for total="capped": counting stops after this many rows
+COUNT_CAP = 10000
+
 
+def _apply_filters(
+    query, category: str = None, author: str = None, search: str = None,
+    min_price: float = None, max_price: float = None
+):
     if category:
         query = query.where(Book.category.ilike(f"%{category}%"))
     if author:
@@ -80,10 +262,80 @@ async def list_books_filtered(
         query = query.where(Book.price >= min_price)
     if max_price is not None:
         query = query.where(Book.price <= max_price)
+    return query
+
+
+async def _estimate_count(db: AsyncSession, query) -> int:
+    # Planner row estimate: no rows are read, accuracy depends on ANALYZE stats
+    compiled = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    sql = str(compiled).replace(":", "\\:")
+    result = await db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def _count_books(db: AsyncSession, query, total_mode: str):
+    """Return (total, is_exact) for the filtered query, or (None, False)."""
+    if total_mode == "exact":
+        result = await db.execute(select(func.count()).select_from(query.subquery()))
+        return result.scalar() or 0, True
+    if total_mode == "estimate":
+        return await _estimate_count(db, query), False
+    if total_mode == "capped":
+        capped = query.with_only_columns(Book.id).limit(COUNT_CAP + 1)
+        result = await db.execute(select(func.count()).select_from(capped.subquery()))
+        total = result.scalar() or 0
+        return min(total, COUNT_CAP), total <= COUNT_CAP
+    return None, False
+
+
+async def list_books_filtered(
+    db: AsyncSession, page: int = 1, limit: int = 20,
+    category: str = None, author: str = None, search: str = None,
+    min_price: float = None, max_price: float = None,
+    sort_by: str = "title", sort_order: str = "asc"
+):
+    """Return the page already serialized to JSON, ready to send as-is."""
+    # Snapshot mode answers everything but free-text search in memory
+    if snapshot.catalog.ready and not search:
+        return dumps(snapshot.catalog.query(
+            page, limit, category, author, min_price, max_price, sort_by, sort_order
+        ))
+
+    params = {
+        "page": page, "limit": limit, "category": category, "author": author,
+        "search": search, "min_price": min_price, "max_price": max_price,
+        "sort_by": sort_by, "sort_order": sort_order,
+    }
+    key = await cache.catalog_key("list", params)
+    return await cache.get_or_load_raw(
+        key, lambda: _list_books_page(db, **params), LIST_CACHE_TTL
+    )
+
+
+def _list_query(
+    category: str = None, author: str = None, search: str = None,
+    min_price: float = None, max_price: float = None,
+    sort_by: str = "title", sort_order: str = "asc"
+):
+    """Filtered, ordered list query; tests/test_query_plans.py checks its plans."""
+    query = _apply_filters(select(*LIST_COLUMNS), category, author, search, min_price, max_price)
 
     sort_col = getattr(Book, sort_by, Book.title)
-    sort_col = desc(sort_col) if sort_order.lower() == "desc" else asc(sort_col)
-    query = query.order_by(sort_col)
+    if sort_order.lower() == "desc":
+        return query.order_by(desc(sort_col), desc(Book.id))
+    return query.order_by(asc(sort_col), asc(Book.id))
+
+
+async def _list_books_page(
+    db: AsyncSession, page: int, limit: int,
+    category: str, author: str, search: str,
+    min_price: float, max_price: float,
+    sort_by: str, sort_order: str
+):
+    query = _list_query(category, author, search, min_price, max_price, sort_by, sort_order)
 
     # Pagination
     total_result = await db.execute(select(func.count()).select_from(query.subquery()))
@@ -92,27 +344,185 @@ async def list_books_filtered(
     offset = (page - 1) * limit
     query = query.offset(offset).limit(limit)
     result = await db.execute(query)
-    items = result.scalars().all()
-
-    # ✅ Convert to Pydantic
-    items_out = [BookOut.from_orm(b) for b in items]
+    items = [row._asdict() for row in result]
 
     pages = (total + limit - 1) // limit
-    return {"items": items_out, "total": total, "page": page, "limit": limit, "pages": pages}
+    return {"items": items, "total": total, "page": page, "limit": limit, "pages": pages}
+
+
+# ----------------------
+# List Books with Keyset (Cursor) Pagination
+# ----------------------
+def _sort_value(row, sort_by: str):
+    if sort_by == "published_date":
+        return row.published_date or date.min
+    return getattr(row, sort_by)
+
+
+async def list_books_keyset(
+    db: AsyncSession, cursor: str = None, limit: int = 20,
+    category: str = None, author: str = None, search: str = None,
+    min_price: float = None, max_price: float = None,
+    sort_by: str = "title", sort_order: str = "asc", total_mode: str = "none"
+):
+    params = {
+        "cursor": cursor, "limit": limit, "category": category, "author": author,
+        "search": search, "min_price": min_price, "max_price": max_price,
+        "sort_by": sort_by, "sort_order": sort_order, "total_mode": total_mode,
+    }
+    key = await cache.catalog_key("keyset", params)
+    return await cache.get_or_load_raw(
+        key, lambda: _list_books_after_cursor(db, **params), LIST_CACHE_TTL
+    )
+
+
+async def _list_books_after_cursor(
+    db: AsyncSession, cursor: str, limit: int,
+    category: str, author: str, search: str,
+    min_price: float, max_price: float,
+    sort_by: str, sort_order: str, total_mode: str
+):
+    filtered = _apply_filters(select(*LIST_COLUMNS), category, author, search, min_price, max_price)
+    sort_key = SORT_KEYS.get(sort_by, Book.title)
+    descending = sort_order.lower() == "desc"
+
+    query = filtered
+    if cursor:
+        last_key, last_id = decode_cursor(cursor, sort_by, sort_order)
+        position = tuple_(sort_key, Book.id)
+        boundary = tuple_(literal(last_key, sort_key.type), literal(last_id, Book.id.type))
+        query = query.where(position < boundary if descending else position > boundary)
+
+    if descending:
+        query = query.order_by(desc(sort_key), desc(Book.id))
+    else:
+        query = query.order_by(asc(sort_key), asc(Book.id))
+
+    # Fetch one extra row to learn whether another page exists
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(sort_by, sort_order, _sort_value(last, sort_by), last.id)
+
+    response = {
+        "items": [row._asdict() for row in rows],
+        "limit": limit,
+        "next_cursor": next_cursor,
+    }
+    if total_mode != "none":
+        total, exact = await _count_books(db, filtered, total_mode)
+        response["total"] = total
+        response["total_exact"] = exact
+    return response
+
+
+# ----------------------
+# Facet Counts for the Active Filters
+# ----------------------
+# Price histogram bucket edges; bucket i covers [edge[i-1], edge[i])
+PRICE_BUCKET_EDGES = (10, 20, 50, 100)
+# Values returned per category/author facet, by descending count
+FACET_LIMIT = 20
+
+# Rendered as literals so GROUPING() and GROUP BY see identical expressions
+PRICE_BUCKET = func.width_bucket(
+    Book.price,
+    literal_column(f"ARRAY[{', '.join(str(e) for e in PRICE_BUCKET_EDGES)}]::numeric[]"),
+)
+FACET_COLUMNS = {
+    "category": Book.category,
+    "author": Book.author,
+    "price": PRICE_BUCKET,
+}
+
+
+async def get_facets(
+    db: AsyncSession, facets: List[str],
+    category: str = None, author: str = None, search: str = None,
+    min_price: float = None, max_price: float = None
+):
+    params = {
+        "facets": sorted(facets), "category": category, "author": author,
+        "search": search, "min_price": min_price, "max_price": max_price,
+    }
+    key = await cache.catalog_key("facets", params)
+    return await cache.get_or_load(key, lambda: _compute_facets(db, **params), LIST_CACHE_TTL)
+
+
+async def _compute_facets(
+    db: AsyncSession, facets: List[str],
+    category: str, author: str, search: str,
+    min_price: float, max_price: float
+):
+    # One pass over the filtered rows: GROUPING SETS yields one row group per
+    # facet, and GROUPING(col) = 0 tells which facet a row belongs to
+    columns = [FACET_COLUMNS[f] for f in facets]
+    query = select(
+        *[col.label(name) for name, col in zip(facets, columns)],
+        *[func.grouping(col).label(f"grouping_{name}") for name, col in zip(facets, columns)],
+        func.count().label("count"),
+    ).group_by(func.grouping_sets(*columns))
+    query = _apply_filters(query, category, author, search, min_price, max_price)
+    result = await db.execute(query)
+
+    buckets = {name: [] for name in facets}
+    for row in result:
+        for name in facets:
+            if getattr(row, f"grouping_{name}") == 0:
+                buckets[name].append((getattr(row, name), row.count))
+                break
+
+    out = {}
+    for name, values in buckets.items():
+        if name == "price":
+            out[name] = [_price_bucket(index, count) for index, count in sorted(values)]
+        else:
+            values.sort(key=lambda v: (-v[1], v[0] is None, v[0] or ""))
+            out[name] = [{"value": value, "count": count} for value, count in values[:FACET_LIMIT]]
+    return out
+
+
+def _price_bucket(index: int, count: int):
+    # width_bucket: 0 below the first edge, len(edges) at or above the last
+    edges = PRICE_BUCKET_EDGES
+    return {
+        "min": edges[index - 1] if index > 0 else 0,
+        "max": edges[index] if index < len(edges) else None,
+        "count": count,
+    }
+
 
 # ----------------------
 # Get Categories with Book Counts
 # ----------------------
 async def get_categories_with_count(db: AsyncSession):
+    key = await cache.catalog_key("categories", {})
+    return await cache.get_or_load(key, lambda: _load_categories(db), LIST_CACHE_TTL)
+
+
+async def _load_categories(db: AsyncSession):
     query = (
         select(
             Category.id,
             Category.name,
             Category.description,
-            func.count(Book.id).label("book_count")
+            func.coalesce(CategoryCount.book_count, 0).label("book_count")
         )
-        .join(Book, Book.category == Category.name, isouter=True)
-        .group_by(Category.id)
+        .join(CategoryCount, CategoryCount.category == Category.name, isouter=True)
     )
     result = await db.execute(query)
-    return result.all()
+    return [
+        {
+            "id": str(c.id),
+            "name": c.name,
+            "description": c.description,
+            "book_count": c.book_count
+        }
+        for c in result.all()
+    ]
+
@@ -0,0 +1,301 @@
+import asyncio
+import random
+
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+from sqlalchemy import select, update, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import cache
+from app.cache import redis_client
+from app.database import AsyncSessionLocal
+from app.models import Book
+
+# ----------------------
+# Key layout
+# ----------------------
+# books:stock:{id}:shards -> shard count; its presence is what routes a
+#                            book's stock changes to Redis
+# books:stock:{id}:{n}    -> available units held by shard n
+#
+# Every shard only ever moves by a Lua script that refuses to go below zero,
+# so the sum of the shards can never be oversold. Postgres keeps a mirror in
+# stock_quantity, refreshed by the writeback loop. Shard keys carry no hash
+# tag so a Redis Cluster spreads one book's shards over several nodes.
+
+# Any constant works; it only has to be unique among this app's advisory locks
+WRITEBACK_LOCK_ID = 31_002
+# Shard count when the service re-seeds a book on its own
+DEFAULT_SHARDS = 8
+
+# Takes up to ARGV[1] units; returns what was taken, -1 once the shard is gone
+RESERVE_SCRIPT = redis_client.register_script("""
+local available = redis.call('GET', KEYS[1])
+if not available then return -1 end
+local take = math.min(tonumber(available), tonumber(ARGV[1]))
+if take > 0 then redis.call('DECRBY', KEYS[1], take) end
+return take
+""")
+
+# Returns units to a shard; -1 once the shard is gone
+RELEASE_SCRIPT = redis_client.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+return redis.call('INCRBY', KEYS[1], ARGV[1])
+""")
+
+
+def shards_key(book_id) -> str:
+    return f"books:stock:{book_id}:shards"
+
+
+def shard_key(book_id, shard: int) -> str:
+    return f"books:stock:{book_id}:{shard}"
+
+
+def _unavailable():
+    return HTTPException(status_code=503, detail="Hot-item stock is temporarily unavailable")
+
+
+# ----------------------
+# Request path
+# ----------------------
+async def hot_shards(book_ids):
+    """{book_id: shard count} for the ids currently in hot-item mode."""
+    book_ids = list(book_ids)
+    if not book_ids:
+        return {}
+    try:
+        counts = await redis_client.mget([shards_key(book_id) for book_id in book_ids])
+    except RedisError:
+        # Postgres refuses flagged books on its own, so falling through is safe
+        return {}
+    return {book_id: int(count) for book_id, count in zip(book_ids, counts) if count is not None}
+
+
+async def level(book_id, shards: int) -> int:
+    values = await redis_client.mget([shard_key(book_id, n) for n in range(shards)])
+    return sum(int(v) for v in values if v is not None)
+
+
+async def _give_back(db: AsyncSession, book_id, taken):
+    # Units taken from shards that vanished meanwhile belong to Postgres now
+    orphaned = 0
+    for shard, units in taken:
+        if await RELEASE_SCRIPT(keys=[shard_key(book_id, shard)], args=[units]) < 0:
+            orphaned += units
+    if orphaned:
+        await db.execute(
+            update(Book).where(Book.id == book_id)
+            .values(stock_quantity=Book.stock_quantity + orphaned)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def adjust(db: AsyncSession, book_id, quantity_change: int, shards: int):
+    """
+    Apply a stock change to a hot book's shards and return the new level,
+    or None when hot-item mode was switched off underneath the request (the
+    caller then retries against Postgres). Raises 400 on insufficient stock.
+    """
+    start = random.randrange(shards)
+    try:
+        if quantity_change >= 0:
+            if await RELEASE_SCRIPT(keys=[shard_key(book_id, start)], args=[quantity_change]) < 0:
+                return None
+            return await level(book_id, shards)
+
+        # Walk the shards from a random one, taking what each can spare
+        wanted, taken, gone = -quantity_change, [], False
+        for i in range(shards):
+            shard = (start + i) % shards
+            units = await RESERVE_SCRIPT(keys=[shard_key(book_id, shard)], args=[wanted])
+            if units < 0:
+                gone = True
+                break
+            if units:
+                taken.append((shard, units))
+                wanted -= units
+                if not wanted:
+                    return await level(book_id, shards)
+
+        await _give_back(db, book_id, taken)
+    except RedisError:
+        raise _unavailable()
+    if gone:
+        return None
+    raise HTTPException(status_code=400, detail="Insufficient stock")
+
+
+async def adjust_many(db: AsyncSession, deltas: dict, shards: dict):
+    """
+    All-or-nothing adjust() over several hot books. Returns {book_id: level}
+    plus an undo coroutine function for when the caller's own step fails;
+    on error, undoes what was already applied and raises.
+    """
+    applied, levels = [], {}
+
+    async def undo():
+        for book_id, change in reversed(applied):
+            await adjust(db, book_id, -change, shards[book_id])
+
+    for book_id in sorted(deltas):
+        try:
+            new_level = await adjust(db, book_id, deltas[book_id], shards[book_id])
+        except HTTPException as exc:
+            await undo()
+            if exc.status_code == 400:
+                raise HTTPException(status_code=400, detail={"message": "Insufficient stock", "book_ids": [str(book_id)]})
+            raise
+        if new_level is None:
+            await undo()
+            raise HTTPException(status_code=409, detail="Hot-item mode changed during the request, retry")
+        applied.append((book_id, deltas[book_id]))
+        levels[book_id] = new_level
+    return levels, undo
+
+
+# ----------------------
+# Switching a book in and out of hot-item mode
+# ----------------------
+async def _seed(book_id, stock: int, shards: int):
+    base, extra = divmod(stock, shards)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.mset({shard_key(book_id, n): base + (n < extra) for n in range(shards)})
+        # Set last: the shards must hold stock before anyone is routed to them
+        pipe.set(shards_key(book_id), shards)
+        await pipe.execute()
+
+
+async def _drain(book_id) -> int:
+    """Unroute the book and collect what its shards still hold."""
+    shards = int(await redis_client.get(shards_key(book_id)) or 0)
+    # Unroute first, then drain: a reservation either lands in a shard
+    # before GETDEL counts it, or finds the shard gone and retries on Postgres
+    await redis_client.delete(shards_key(book_id))
+    stock = 0
+    for n in range(shards):
+        stock += int(await redis_client.getdel(shard_key(book_id, n)) or 0)
+    return stock
+
+
+async def _lock_book(db: AsyncSession, book_id):
+    # The row lock holds back Postgres-path writers and the writeback loop
+    result = await db.execute(select(Book).where(Book.id == book_id).with_for_update())
+    book = result.scalar_one_or_none()
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return book
+
+
+async def enable(db: AsyncSession, book_id, shards: int):
+    """Move the book's stock from Postgres into Redis shards."""
+    book = await _lock_book(db, book_id)
+    if book.hot_stock:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Book is already in hot-item mode")
+
+    stock = book.stock_quantity or 0
+    try:
+        await _seed(book_id, stock, shards)
+    except RedisError:
+        await db.rollback()
+        raise _unavailable()
+
+    book.hot_stock = True
+    try:
+        await db.commit()
+    except Exception:
+        # Buyers may already have reserved from the shards: keep what they took
+        await db.rollback()
+        remaining = await _drain(book_id)
+        await db.execute(
+            update(Book).where(Book.id == book_id)
+            .values(stock_quantity=Book.stock_quantity - (stock - remaining))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        raise
+    await cache.invalidate_book(book_id)
+    return {"book_id": book_id, "hot_stock": True, "shards": shards, "stock_quantity": stock}
+
+
+async def disable(db: AsyncSession, book_id):
+    """Collapse the shards back into stock_quantity and route changes to Postgres."""
+    book = await _lock_book(db, book_id)
+    if not book.hot_stock:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Book is not in hot-item mode")
+
+    try:
+        stock = await _drain(book_id)
+    except RedisError:
+        await db.rollback()
+        raise _unavailable()
+
+    book.stock_quantity = stock
+    book.hot_stock = False
+    try:
+        await db.commit()
+    except Exception:
+        await _seed(book_id, stock, DEFAULT_SHARDS)
+        raise
+    await cache.invalidate_book(book_id)
+    return {"book_id": book_id, "hot_stock": False, "shards": 0, "stock_quantity": stock}
+
+
+# ----------------------
+# Writeback and reconciliation
+# ----------------------
+async def write_back(db: AsyncSession):
+    """
+    Copy shard totals of hot books into stock_quantity. Books whose keys are
+    gone while still flagged mean Redis lost its data; they are re-seeded
+    from the last written-back value, which can only be exact if Redis
+    persists (AOF) at least as often as this runs. Returns the number of
+    rows changed, or None when another worker holds the job.
+    """
+    locked = await db.execute(text(f"SELECT pg_try_advisory_xact_lock({WRITEBACK_LOCK_ID})"))
+    if not locked.scalar():
+        await db.rollback()
+        return None
+
+    # Rows being switched on or off right now are skipped until next round
+    result = await db.execute(
+        select(Book.id, Book.stock_quantity)
+        .where(Book.hot_stock.is_(True))
+        .with_for_update(skip_locked=True)
+    )
+    rows = result.all()
+    shards = await hot_shards(row.id for row in rows)
+
+    changed = []
+    for row in rows:
+        if row.id not in shards:
+            print(f"Hot stock for book {row.id} missing from Redis; re-seeding from {row.stock_quantity}")
+            await _seed(row.id, row.stock_quantity or 0, DEFAULT_SHARDS)
+            continue
+        current = await level(row.id, shards[row.id])
+        if current != row.stock_quantity:
+            await db.execute(
+                update(Book).where(Book.id == row.id)
+                .values(stock_quantity=current)
+                .execution_options(synchronize_session=False)
+            )
+            changed.append(row.id)
+    await db.commit()
+
+    if changed:
+        await cache.invalidate_books(changed)
+    return len(changed)
+
+
+async def run_writeback(interval: float):
+    """Background loop: write hot stock back every interval seconds."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                await write_back(session)
+        except Exception as e:
+            print(f"Hot stock writeback failed: {e}")
+        await asyncio.sleep(interval)
@@ -1,18 +1,66 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+import asyncio
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import get_db, engine
-from app import models, crud, schemas, dependencies
+from app.database import get_db
+from app import (
+    crud, schemas, dependencies, cache, bulk, category_counts, snapshot, serialization,
+    change_feed, suggest, similar, hot_stock,
+)
+from app.config import (
+    CATEGORY_RECONCILE_INTERVAL, CHANGE_FEED_MAX_WAIT, CHANGE_RETENTION_DAYS,
+    SNAPSHOT_ENABLED, SNAPSHOT_REFRESH_INTERVAL, SNAPSHOT_FULL_RELOAD_INTERVAL,
+    SUGGEST_ENABLED, SUGGEST_REFRESH_INTERVAL, SUGGEST_FULL_RELOAD_INTERVAL,
+    SIMILAR_RELOAD_INTERVAL, HOT_STOCK_WRITEBACK_INTERVAL,
+)
 
 app = FastAPI(title="Books Service")
 
 
 # -----------------------------------------------------
-# Startup: Create tables
+# Startup: background jobs (schema is migrated by init_db.py)
 # -----------------------------------------------------
 @app.on_event("startup")
 async def startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(models.Base.metadata.create_all)
+    if CATEGORY_RECONCILE_INTERVAL > 0:
+        app.state.reconcile_task = asyncio.create_task(
+            category_counts.run_reconciliation(CATEGORY_RECONCILE_INTERVAL)
+        )
+
+    app.state.hot_stock_task = asyncio.create_task(
+        hot_stock.run_writeback(HOT_STOCK_WRITEBACK_INTERVAL)
+    )
+
+    await change_feed.notifier.start()
+    app.state.prune_task = asyncio.create_task(change_feed.run_pruning(CHANGE_RETENTION_DAYS))
+
+    if SUGGEST_ENABLED:
+        app.state.suggest_task = asyncio.create_task(
+            suggest.run_refresh(SUGGEST_REFRESH_INTERVAL, SUGGEST_FULL_RELOAD_INTERVAL)
+        )
+
+    app.state.similar_task = asyncio.create_task(
+        similar.run_reload(SIMILAR_RELOAD_INTERVAL)
+    )
+
+    if SNAPSHOT_ENABLED:
+        app.state.snapshot_task = asyncio.create_task(
+            snapshot.run_refresh(SNAPSHOT_REFRESH_INTERVAL, SNAPSHOT_FULL_RELOAD_INTERVAL)
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    for name in (
+        "reconcile_task", "snapshot_task", "prune_task", "suggest_task", "similar_task",
+        "hot_stock_task",
+    ):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    await change_feed.notifier.stop()
+    await cache.redis_client.aclose()
 
 
 # -----------------------------------------------------
@@ -23,17 +71,90 @@ async def startup():
 @app.get("/api/v1/books/categories")
 async def get_categories(db: AsyncSession = Depends(get_db)):
     categories = await crud.get_categories_with_count(db)
-    return {
-        "categories": [
-            {
-                "id": str(c.id),
-                "name": c.name,
-                "description": c.description,
-                "book_count": c.book_count
-            }
-            for c in categories
-        ]
-    }
+    return {"categories": categories}
+
+
+# Cache hit ratio for this worker
+@app.get("/api/v1/books/cache/stats")
+async def get_cache_stats(_=Depends(dependencies.admin_required)):
+    return cache.stats.as_dict()
+
+
+# In-process catalog snapshot size and freshness for this worker
+@app.get("/api/v1/books/snapshot/stats")
+async def get_snapshot_stats(_=Depends(dependencies.admin_required)):
+    return snapshot.catalog.stats()
+
+
+# -----------------------------------------------------
+# AUTOCOMPLETE: served from the in-memory prefix index
+# -----------------------------------------------------
+@app.get("/api/v1/books/suggest")
+async def suggest_books(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=25)
+):
+    if not suggest.index.ready:
+        raise HTTPException(status_code=503, detail="Suggestions are not available yet")
+    return {"suggestions": suggest.index.suggest(q, limit)}
+
+
+# -----------------------------------------------------
+# SIMILAR BOOKS: neighbors precomputed by build_similar.py
+# -----------------------------------------------------
+@app.get("/api/v1/books/{book_id}/similar")
+async def get_similar_books(
+    book_id: UUID,
+    limit: int = Query(10, ge=1, le=similar.TOP_K),
+    db: AsyncSession = Depends(get_db)
+):
+    if not similar.index.ready:
+        raise HTTPException(status_code=503, detail="Similar books are not available yet")
+    return await similar.similar_books(db, book_id, limit)
+
+
+# -----------------------------------------------------
+# CHANGE FEED: inserts, updates and tombstones after a cursor
+# -----------------------------------------------------
+@app.get("/api/v1/books/changes")
+async def get_changes(
+    since: str = Query(None, description="next_cursor of the previous read"),
+    limit: int = Query(500, ge=1, le=1000),
+    wait: int = Query(0, ge=0, le=CHANGE_FEED_MAX_WAIT),
+    db: AsyncSession = Depends(get_db)
+):
+    result = await change_feed.read_changes(db, since, limit, wait)
+    return Response(content=serialization.dumps(result), media_type="application/json")
+
+
+# -----------------------------------------------------
+# MULTI-GET: many books by id in one query
+# -----------------------------------------------------
+def _split_csv(value: str):
+    return [part.strip() for part in value.split(",") if part.strip()] if value else None
+
+
+@app.get("/api/v1/books:batch")
+async def get_books_batch(
+    ids: str = Query(..., description="Comma-separated book ids"),
+    fields: str = Query(None, description="Comma-separated fields to return"),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        book_ids = [UUID(i) for i in _split_csv(ids) or []]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid book id")
+    if not book_ids:
+        raise HTTPException(status_code=400, detail="ids must not be empty")
+    return await crud.get_books_by_ids(db, book_ids, _split_csv(fields))
+
+
+@app.post("/api/v1/books:batch")
+async def post_books_batch(
+    request: schemas.BookBatchRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    return await crud.get_books_by_ids(db, request.ids, request.fields)
 
 
 # -----------------------------------------------------
@@ -50,11 +171,32 @@ async def list_books(
     max_price: float = Query(None, ge=0),
     sort_by: str = Query("title", regex="^(price|title|published_date)$"),
     sort_order: str = Query("asc", regex="^(asc|desc)$"),
+    paginate: str = Query("page", regex="^(page|cursor)$"),
+    cursor: str = Query(None),
+    total: str = Query("none", regex="^(exact|estimate|capped|none)$"),
+    facets: str = Query(None, regex="^(category|author|price)(,(category|author|price))*$"),
     db: AsyncSession = Depends(get_db)
 ):
-    return await crud.list_books_filtered(
-        db, page, limit, category, author, search, min_price, max_price, sort_by, sort_order
-    )
+    # Keyset pagination: opt in with paginate=cursor or by passing a cursor
+    if paginate == "cursor" or cursor:
+        result = await crud.list_books_keyset(
+            db, cursor, limit, category, author, search, min_price, max_price,
+            sort_by, sort_order, total
+        )
+    else:
+        result = await crud.list_books_filtered(
+            db, page, limit, category, author, search, min_price, max_price, sort_by, sort_order
+        )
+
+    # List pages arrive pre-serialized; only facet requests need decoding
+    if facets:
+        body = serialization.loads(result)
+        body["facets"] = await crud.get_facets(
+            db, list(dict.fromkeys(facets.split(","))),
+            category, author, search, min_price, max_price
+        )
+        result = serialization.dumps(body)
+    return Response(content=result, media_type="application/json")
 
 
 # -----------------------------------------------------
@@ -93,9 +235,58 @@ async def delete_book(
     return
 
 
+# Bulk import: CSV or NDJSON request body, upserted on isbn
+@app.post("/api/v1/books/import")
+async def import_books(
+    request: Request,
+    format: str = Query("ndjson", regex="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_db),
+    _=Depends(dependencies.admin_required)
+):
+    return await bulk.import_books(db, bulk.iter_lines(request.stream()), format)
+
+
+# Bulk update: reprice or re-tag every book matching a filter or id list
+@app.patch("/api/v1/books/bulk", response_model=schemas.BulkBookUpdateOut)
+async def bulk_update_books(
+    request: schemas.BulkBookUpdate,
+    db: AsyncSession = Depends(get_db),
+    _=Depends(dependencies.admin_required)
+):
+    return await bulk.bulk_update_books(db, request)
+
+
+# Bulk export: whole catalog as streamed NDJSON
+@app.get("/api/v1/books/export")
+async def export_books(_=Depends(dependencies.admin_required)):
+    return StreamingResponse(bulk.export_books_ndjson(), media_type="application/x-ndjson")
+
+
 # -----------------------------------------------------
 # INTERNAL STOCK UPDATE ROUTE
 # -----------------------------------------------------
+@app.patch("/api/v1/books/stock/batch", response_model=schemas.BatchStockOut)
+async def update_stock_batch(
+    batch: schemas.BatchStockUpdate,
+    db: AsyncSession = Depends(get_db),
+    _=Depends(dependencies.internal_required)
+):
+    return await crud.adjust_stock_batch(db, batch.items)
+
+
+# Admin: move a flash-sale book's stock into Redis shards, or back
+@app.put("/api/v1/books/{book_id}/hot-stock", response_model=schemas.HotStockOut)
+async def set_hot_stock(
+    book_id: UUID,
+    request: schemas.HotStockUpdate,
+    db: AsyncSession = Depends(get_db),
+    _=Depends(dependencies.admin_required)
+):
+    if request.enabled:
+        return await hot_stock.enable(db, book_id, request.shards)
+    return await hot_stock.disable(db, book_id)
+
+
 @app.patch("/api/v1/books/{book_id}/stock", response_model=schemas.BookOut)
 async def update_stock(
     book_id: str,
@@ -103,16 +294,7 @@ async def update_stock(
     db: AsyncSession = Depends(get_db),
     _=Depends(dependencies.internal_required)
 ):
-    book = await crud.get_book(db, book_id)
-    new_quantity = book.stock_quantity + stock.quantity_change
-
-    if new_quantity < 0:
-        raise HTTPException(status_code=400, detail="Insufficient stock")
-
-    book.stock_quantity = new_quantity
-    await db.commit()
-    await db.refresh(book)
-    return book
+    return await crud.adjust_stock(db, book_id, stock.quantity_change)
 
 
 # -----------------------------------------------------
@@ -1,5 +1,8 @@
 import uuid
-from sqlalchemy import Column, String, Text, DECIMAL, Integer, Date, DateTime
+from sqlalchemy import (
+    Column, String, Text, DECIMAL, Integer, BigInteger, Boolean, Date, DateTime, Index, Identity,
+    literal_column, false,
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import UUID
@@ -21,6 +24,33 @@ class Book(Base):
     published_date = Column(Date)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+    # Hot-item mode: live stock is in Redis shards, stock_quantity is a mirror
+    hot_stock = Column(Boolean, nullable=False, default=False, server_default=false())
+
+
+# Sort key for published_date: NULLs are folded to a sentinel so (key, id)
+# row comparisons stay total. The expression must match the index below
+# exactly, hence a literal instead of a bound parameter.
+PUBLISHED_DATE_SORT_KEY = func.coalesce(Book.published_date, literal_column("DATE '0001-01-01'"))
+
+# Keyset pagination indexes: one per sortable column, with id as tiebreak
+Index("ix_books_title_id", Book.title, Book.id)
+Index("ix_books_price_id", Book.price, Book.id)
+Index("ix_books_published_date_id", PUBLISHED_DATE_SORT_KEY, Book.id)
+
+# List query indexes (migration 0003): ILIKE '%term%' filters need trigram
+# GIN indexes; offset pages sort by the raw published_date
+Index("ix_books_title_trgm", Book.title, postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"})
+Index("ix_books_author_trgm", Book.author, postgresql_using="gin", postgresql_ops={"author": "gin_trgm_ops"})
+Index("ix_books_category_trgm", Book.category, postgresql_using="gin", postgresql_ops={"category": "gin_trgm_ops"})
+Index(
+    "ix_books_description_trgm", Book.description,
+    postgresql_using="gin", postgresql_ops={"description": "gin_trgm_ops"},
+)
+Index("ix_books_published_date_raw_id", Book.published_date, Book.id)
+Index("ix_books_updated_at", Book.updated_at)
+# Hot-item writeback scans only the flagged handful (migration 0004)
+Index("ix_books_hot_stock", Book.id, postgresql_where=Book.hot_stock)
 
 
 class Category(Base):
@@ -29,3 +59,23 @@ class Category(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = Column(String, unique=True, nullable=False)
     description = Column(Text)
+
+
+class CategoryCount(Base):
+    __tablename__ = "category_counts"
+
+    # Keyed by name: books reference categories by their name string
+    category = Column(String, primary_key=True)
+    book_count = Column(Integer, nullable=False, default=0)
+
+
+# Rows are written by the books_change_feed trigger (migration 0002), so
+# set-based UPDATEs and bulk upserts are captured too
+class BookChange(Base):
+    __tablename__ = "book_changes"
+
+    # Feed cursor: allocated in insert order, may have gaps from rollbacks
+    seq = Column(BigInteger, Identity(), primary_key=True)
+    book_id = Column(UUID(as_uuid=True), nullable=False)
+    op = Column(String, nullable=False)  # "upsert" or "delete" (tombstone)
+    changed_at = Column(DateTime(timezone=True), server_default=func.clock_timestamp(), nullable=False)
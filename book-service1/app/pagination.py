@@ -0,0 +1,53 @@
+import base64
+import json
+from datetime import date
+from decimal import Decimal
+from uuid import UUID
+
+from fastapi import HTTPException
+
+# ----------------------
+# Opaque keyset cursors
+# ----------------------
+# A cursor is base64url(JSON) holding the sort column, direction, the last
+# row's sort key and its id. Clients must treat it as an opaque token.
+
+def _encode_value(sort_by: str, value):
+    if value is None:
+        return None
+    if sort_by == "price":
+        return str(value)
+    if sort_by == "published_date":
+        return value.isoformat()
+    return value
+
+
+def _decode_value(sort_by: str, value):
+    if sort_by == "price":
+        return Decimal(value)
+    if sort_by == "published_date":
+        return date.fromisoformat(value)
+    return str(value)
+
+
+def encode_cursor(sort_by: str, sort_order: str, last_key, last_id) -> str:
+    payload = {
+        "s": sort_by,
+        "o": sort_order,
+        "k": _encode_value(sort_by, last_key),
+        "id": str(last_id),
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str):
+    """Return (sort_key, id) for a cursor issued with the same sort."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload["s"] != sort_by or payload["o"] != sort_order:
+            raise ValueError("sort mismatch")
+        return _decode_value(sort_by, payload["k"]), UUID(payload["id"])
+    except (ValueError, KeyError, TypeError, ArithmeticError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
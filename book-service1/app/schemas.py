@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional, Union
 from datetime import date, datetime
 from uuid import UUID
 
@@ -28,6 +28,79 @@ class BookUpdate(BaseModel):
 class StockUpdate(BaseModel):
     quantity_change: int
 
+class BookBatchRequest(BaseModel):
+    ids: List[UUID] = Field(..., min_length=1, max_length=500)
+    fields: Optional[List[str]] = None
+
+class StockAdjustment(BaseModel):
+    book_id: UUID
+    quantity_change: int
+
+class BatchStockUpdate(BaseModel):
+    items: List[StockAdjustment] = Field(..., min_length=1, max_length=500)
+
+class StockLevel(BaseModel):
+    book_id: UUID
+    stock_quantity: int
+
+class BatchStockOut(BaseModel):
+    items: List[StockLevel]
+
+class HotStockUpdate(BaseModel):
+    enabled: bool
+    shards: int = Field(8, ge=1, le=64)
+
+class HotStockOut(BaseModel):
+    book_id: UUID
+    hot_stock: bool
+    shards: int
+    stock_quantity: int
+
+class BulkBookFilter(BaseModel):
+    # Exact matches: a write must not catch "Science Fiction" when asked for "Fiction"
+    category: Optional[str] = None
+    author: Optional[str] = None
+    min_price: Optional[float] = Field(None, ge=0)
+    max_price: Optional[float] = Field(None, ge=0)
+
+class BulkBookOperation(BaseModel):
+    field: Literal["price", "category", "publisher", "description"]
+    op: Literal["set", "multiply", "add"] = "set"
+    value: Union[float, str, None]
+
+    @model_validator(mode="after")
+    def check_value(self):
+        if self.field == "price":
+            if not isinstance(self.value, float):
+                raise ValueError("price operations need a numeric value")
+            if self.op != "add" and self.value < 0:
+                raise ValueError(f"price {self.op} value must not be negative")
+        elif self.op != "set":
+            raise ValueError(f"{self.field} only supports set")
+        elif isinstance(self.value, float):
+            raise ValueError(f"{self.field} needs a string value")
+        return self
+
+class BulkBookUpdate(BaseModel):
+    ids: Optional[List[UUID]] = Field(None, min_length=1, max_length=10000)
+    filter: Optional[BulkBookFilter] = None
+    operations: List[BulkBookOperation] = Field(..., min_length=1)
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("Give exactly one of ids or filter")
+        if self.filter is not None and not self.filter.model_dump(exclude_none=True):
+            raise ValueError("filter needs at least one condition")
+        fields = [operation.field for operation in self.operations]
+        if len(fields) != len(set(fields)):
+            raise ValueError("At most one operation per field")
+        return self
+
+class BulkBookUpdateOut(BaseModel):
+    matched: int
+    updated: int
+
 class BookOut(BaseModel):
     id: UUID
     title: str
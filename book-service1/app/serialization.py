@@ -0,0 +1,19 @@
+from decimal import Decimal
+
+import orjson
+
+
+def _default(value):
+    # orjson handles UUID, date and datetime natively; NUMERIC columns arrive as Decimal
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def dumps(value) -> bytes:
+    # OPT_UTC_Z writes UTC as "Z", matching Pydantic's datetime output
+    return orjson.dumps(value, default=_default, option=orjson.OPT_UTC_Z)
+
+
+def loads(data):
+    return orjson.loads(data)
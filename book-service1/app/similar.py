@@ -0,0 +1,374 @@
+import asyncio
+import json
+import math
+import os
+import shutil
+import time
+import zlib
+from collections import Counter
+from functools import lru_cache
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import select, func, bindparam, any_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import change_feed, crud
+from app.config import SIMILAR_INDEX_DIR
+from app.models import Book, BookChange
+from app.suggest import normalize
+
+# Hashed feature space; collisions are tolerated in exchange for a dense,
+# fixed-width matrix that needs no vocabulary
+DIM = 512
+TOP_K = 20
+FIELD_WEIGHTS = {"title": 2.0, "description": 1.0, "author": 1.5, "category": 1.5}
+MIN_WORD_LENGTH = 3
+# Upper bound on one similarity block (query rows x catalog, float32)
+BLOCK_BYTES = 64 << 20
+# Past this share of changed books an incremental run costs about as much as
+# a full one and leaves more holes, so rebuild from scratch
+FULL_REBUILD_RATIO = 0.2
+# Index versions kept on disk; older ones may still be mapped by a worker
+KEEP_VERSIONS = 2
+CURRENT = "current"
+FEATURE_COLUMNS = (Book.id, Book.title, Book.author, Book.description, Book.category)
+
+
+# ----------------------
+# Features: hashed, field-weighted TF-IDF
+# ----------------------
+@lru_cache(maxsize=1 << 18)
+def _hash(token: str):
+    h = zlib.crc32(token.encode("utf-8"))
+    # Signed hashing: colliding tokens cancel out on average instead of piling up
+    return h % DIM, (1.0 if h & 0x80000000 else -1.0)
+
+
+def _features(title, author, description, category):
+    """Sparse (buckets, values) for one book, before IDF."""
+    weights = Counter()
+    for field, text in (("title", title), ("description", description)):
+        words = [w for w in normalize(text or "").split(" ") if len(w) >= MIN_WORD_LENGTH]
+        for word, count in Counter(words).items():
+            weights[word] += FIELD_WEIGHTS[field] * (1 + math.log(count))
+    # Author and category only match as a whole
+    if author:
+        weights[f"author:{normalize(author)}"] += FIELD_WEIGHTS["author"]
+    if category:
+        weights[f"category:{normalize(category)}"] += FIELD_WEIGHTS["category"]
+
+    buckets = np.empty(len(weights), dtype=np.int32)
+    values = np.empty(len(weights), dtype=np.float32)
+    for i, (token, weight) in enumerate(weights.items()):
+        buckets[i], sign = _hash(token)
+        values[i] = sign * weight
+    return buckets, values
+
+
+def _idf(features):
+    df = np.zeros(DIM, dtype=np.float64)
+    for buckets, _ in features:
+        df[np.unique(buckets)] += 1
+    return (np.log((1 + len(features)) / (1 + df)) + 1).astype(np.float32)
+
+
+def _vectorize(features, idf):
+    vectors = np.zeros((len(features), DIM), dtype=np.float32)
+    for row, (buckets, values) in zip(vectors, features):
+        np.add.at(row, buckets, values)
+    vectors *= idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+# ----------------------
+# Neighbors: blocked matrix multiplication
+# ----------------------
+def _top_k(queries, corpus, k: int, self_rows=None):
+    """
+    The k most similar corpus rows for every query row, best first, as
+    (indices, scores). Missing neighbors are -1. self_rows gives each
+    query's own corpus row, which is never returned.
+    """
+    indices = np.full((len(queries), k), -1, dtype=np.int32)
+    scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    if not len(queries) or not len(corpus):
+        return indices, scores
+
+    kk = min(k, len(corpus))
+    block = max(1, BLOCK_BYTES // (4 * len(corpus)))
+    for start in range(0, len(queries), block):
+        sims = queries[start:start + block] @ corpus.T
+        rows = np.arange(len(sims))
+        if self_rows is not None:
+            sims[rows, self_rows[start:start + block]] = -np.inf
+        part = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+        part_scores = sims[rows[:, None], part]
+        order = np.argsort(-part_scores, axis=1)
+        indices[start:start + block, :kk] = np.take_along_axis(part, order, axis=1)
+        scores[start:start + block, :kk] = np.take_along_axis(part_scores, order, axis=1)
+
+    # Books sharing no features are not neighbors
+    indices[scores <= 0] = -1
+    scores[scores <= 0] = -np.inf
+    return indices, scores
+
+
+def _merge(indices, scores, more_indices, more_scores, k: int):
+    """Row-wise best k of two neighbor lists with disjoint candidates."""
+    all_indices = np.concatenate([indices, more_indices], axis=1)
+    all_scores = np.concatenate([scores, more_scores], axis=1)
+    order = np.argsort(-all_scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(all_indices, order, axis=1), np.take_along_axis(all_scores, order, axis=1)
+
+
+def _id_keys(book_ids):
+    # Raw UUID bytes compare in the same order as the UUIDs themselves.
+    # "S" arrays drop trailing NULs, consistently on both sides of a lookup.
+    return np.array([book_id.bytes for book_id in book_ids], dtype="S16")
+
+
+def _to_uuid(key) -> UUID:
+    return UUID(bytes=bytes(key).ljust(16, b"\0"))
+
+
+# ----------------------
+# Offline build
+# ----------------------
+async def _read_books(db: AsyncSession, book_ids=None):
+    query = select(*FEATURE_COLUMNS).execution_options(yield_per=5000)
+    if book_ids is not None:
+        ids_param = bindparam("ids", value=list(book_ids), type_=postgresql.ARRAY(postgresql.UUID(as_uuid=True)))
+        query = query.where(Book.id == any_(ids_param))
+    ids, features = [], []
+    result = await db.stream(query)
+    async for row in result:
+        ids.append(row.id)
+        features.append(_features(row.title, row.author, row.description, row.category))
+    return ids, features
+
+
+def _open(path: str, with_vectors: bool = False):
+    """Memory-map an index version directory; nothing is read up front."""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    files = ["ids", "neighbors", "scores"] + (["vectors", "idf"] if with_vectors else [])
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in files}
+    return meta, arrays
+
+
+def _write(base: str, meta: dict, arrays: dict):
+    """Write a new index version and atomically point CURRENT at it."""
+    version = f"v{time.time_ns()}"
+    path = os.path.join(base, version)
+    os.makedirs(path)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    link = os.path.join(base, f".{CURRENT}.tmp")
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(version, link)
+    os.replace(link, os.path.join(base, CURRENT))
+
+    versions = sorted(d for d in os.listdir(base) if d.startswith("v"))
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(base, old), ignore_errors=True)
+
+
+def _build_full(ids, features):
+    order = np.argsort(_id_keys(ids), kind="stable")
+    features = [features[i] for i in order]
+    idf = _idf(features)
+    vectors = _vectorize(features, idf)
+    neighbors, scores = _top_k(vectors, vectors, TOP_K, self_rows=np.arange(len(vectors)))
+    return {
+        "ids": _id_keys([ids[i] for i in order]),
+        "vectors": vectors,
+        "idf": idf,
+        "neighbors": neighbors,
+        "scores": scores,
+    }
+
+
+def _build_incremental(previous: dict, touched, ids, features):
+    """
+    Re-vectorize the touched books and patch neighbor lists instead of
+    redoing the whole catalog. IDF weights are kept from the last full build.
+    Neighbors that were deleted leave a hole until the next full build.
+    """
+    old_ids = previous["ids"]
+    keep = np.flatnonzero(~np.isin(old_ids, _id_keys(touched)))
+    changed_keys = _id_keys(ids)
+    changed_vectors = _vectorize(features, previous["idf"])
+
+    all_keys = np.concatenate([old_ids[keep], changed_keys])
+    order = np.argsort(all_keys, kind="stable")
+    position = np.empty(len(order), dtype=np.int32)
+    position[order] = np.arange(len(order), dtype=np.int32)
+    vectors = np.concatenate([previous["vectors"][keep], changed_vectors])[order]
+
+    # Old row -> new row, -1 for books that were touched
+    remap = np.full(len(old_ids) + 1, -1, dtype=np.int32)
+    remap[keep] = position[:len(keep)]
+    changed_rows = position[len(keep):]
+    kept_rows = position[:len(keep)]
+
+    # Kept books: surviving neighbors plus the best of the changed books
+    old_neighbors = np.asarray(previous["neighbors"][keep])
+    neighbors = remap[old_neighbors]  # -1 indexes the trailing -1 slot
+    scores = np.where(neighbors >= 0, previous["scores"][keep], -np.inf).astype(np.float32)
+    candidates, candidate_scores = _top_k(vectors[kept_rows], vectors[changed_rows], TOP_K)
+    candidates = np.where(candidates >= 0, changed_rows[candidates], -1)
+    neighbors, scores = _merge(neighbors, scores, candidates, candidate_scores, TOP_K)
+
+    all_neighbors = np.full((len(vectors), TOP_K), -1, dtype=np.int32)
+    all_scores = np.full((len(vectors), TOP_K), -np.inf, dtype=np.float32)
+    all_neighbors[kept_rows], all_scores[kept_rows] = neighbors, scores
+    # Changed books: scored against the whole catalog
+    all_neighbors[changed_rows], all_scores[changed_rows] = _top_k(
+        vectors[changed_rows], vectors, TOP_K, self_rows=changed_rows
+    )
+    return {
+        "ids": all_keys[order],
+        "vectors": vectors,
+        "idf": previous["idf"],
+        "neighbors": all_neighbors,
+        "scores": all_scores,
+    }
+
+
+async def build(db: AsyncSession, base: str, full: bool = False):
+    """
+    Build the similar-books index under base. Incremental unless asked for a
+    full build, there is no compatible previous version, or too much changed.
+    """
+    started = time.monotonic()
+
+    previous = None
+    current = os.path.join(base, CURRENT)
+    if not full and os.path.exists(current):
+        meta, arrays = _open(current, with_vectors=True)
+        if meta["dim"] == DIM and meta["top_k"] == TOP_K:
+            previous = (meta, arrays)
+
+    touched = []
+    if previous is not None:
+        # Indexes built before cursors were stored only have their head seq
+        cursor = change_feed.ChangeCursor.parse(
+            previous[0].get("change_cursor", str(previous[0]["change_seq"]))
+        )
+        read_up_to = cursor.seq
+        changes = await db.execute(
+            select(BookChange.seq, BookChange.book_id)
+            .where(cursor.pending())
+            .order_by(BookChange.seq)
+        )
+        now = await change_feed.clock(db)
+        touched = set()
+        for seq, book_id in changes:
+            cursor.accept(seq, now)
+            touched.add(book_id)
+        touched = list(touched)
+        oldest = await db.execute(select(func.min(BookChange.seq)))
+        oldest = oldest.scalar()
+        cursor.expire(now, oldest)
+        # The feed was pruned past our cursor, so some changes are lost
+        if oldest is not None and read_up_to < oldest - 1:
+            previous = None
+        elif len(touched) > FULL_REBUILD_RATIO * max(previous[0]["books"], 1):
+            previous = None
+
+    if previous is None:
+        mode = "full"
+        # Taken before the books are read, so nothing committed in between is missed
+        cursor = await change_feed.head_cursor(db)
+        ids, features = await _read_books(db)
+        arrays = _build_full(ids, features)
+    else:
+        mode = "incremental"
+        ids, features = await _read_books(db, touched) if touched else ([], [])
+        arrays = _build_incremental(previous[1], touched, ids, features)
+
+    meta = {
+        "books": len(arrays["ids"]),
+        "dim": DIM,
+        "top_k": TOP_K,
+        "change_seq": cursor.seq,
+        "change_cursor": str(cursor),
+        "mode": mode,
+        "built_at": time.time(),
+    }
+    os.makedirs(base, exist_ok=True)
+    _write(base, meta, arrays)
+    return {**meta, "reindexed": len(ids), "seconds": round(time.monotonic() - started, 2)}
+
+
+# ----------------------
+# Serving: memory-mapped, shared by every worker through the page cache
+# ----------------------
+class SimilarIndex:
+    def __init__(self, base: str):
+        self.base = base
+        self.version = None
+        self.meta = {}
+        self._ids = self._neighbors = self._scores = None
+
+    @property
+    def ready(self):
+        return self.version is not None
+
+    def reload(self):
+        """Switch to the newest built version, if it changed. Returns True on switch."""
+        current = os.path.join(self.base, CURRENT)
+        if not os.path.exists(current):
+            return False
+        version = os.path.realpath(current)
+        if version == self.version:
+            return False
+        meta, arrays = _open(version)
+        self._ids, self._neighbors, self._scores = arrays["ids"], arrays["neighbors"], arrays["scores"]
+        self.meta, self.version = meta, version
+        return True
+
+    def neighbors(self, book_id: UUID):
+        """[(book_id, score)] best first, or None when the book is not indexed."""
+        key = _id_keys([book_id])[0]
+        row = int(np.searchsorted(self._ids, key))
+        if row == len(self._ids) or self._ids[row] != key:
+            return None
+        return [
+            (_to_uuid(self._ids[i]), float(s))
+            for i, s in zip(self._neighbors[row], self._scores[row])
+            if i >= 0
+        ]
+
+
+index = SimilarIndex(SIMILAR_INDEX_DIR)
+
+
+async def similar_books(db: AsyncSession, book_id: UUID, limit: int):
+    neighbors = index.neighbors(book_id)
+    if neighbors is None:
+        return {"items": [], "indexed": False}
+    scores = {str(neighbor): score for neighbor, score in neighbors}
+    # Neighbors deleted since the build come back as missing and are skipped
+    books = await crud.get_books_by_ids(db, [neighbor for neighbor, _ in neighbors])
+    items = [{**book, "score": round(scores[book["id"]], 4)} for book in books["items"][:limit]]
+    return {"items": items, "indexed": True}
+
+
+async def run_reload(interval: float):
+    """Background loop picking up versions written by build_similar.py."""
+    while True:
+        try:
+            if index.reload():
+                print(f"Similar-books index loaded: {index.meta['books']} books ({index.meta['mode']})")
+        except Exception as e:
+            print(f"Similar-books index reload failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,279 @@
+import asyncio
+import sys
+import time
+from datetime import timedelta
+from uuid import UUID
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import change_feed
+from app.database import AsyncSessionLocal
+from app.models import Book, BookChange
+from app.schemas import BookOut
+
+# Rows changed inside this window before the watermark are re-read on every
+# refresh: updated_at is the writer's transaction start, so a slow transaction
+# can commit a timestamp older than rows we have already seen.
+WATERMARK_OVERLAP = timedelta(seconds=30)
+
+# Sentinel ordinal for a NULL published_date: sorts last ascending and first
+# descending, the same as Postgres' default NULL placement
+NULL_DATE = np.iinfo(np.int32).max
+
+SNAPSHOT_COLUMNS = [getattr(Book, name) for name in BookOut.model_fields]
+
+
+class CatalogSnapshot:
+    """
+    Read-only columnar copy of the catalog held by one worker.
+
+    Filterable and sortable fields live in NumPy arrays; strings repeated
+    across books (category, author) are stored once and referenced by code.
+    Full rows are kept JSON-ready so a page is returned without hydration.
+    Title order follows Python code points, which may differ from the
+    database collation for non-ASCII titles.
+
+    The arrays are rebuilt in a worker thread and swapped in whole, at most
+    once per refresh; queries keep using the previous build meanwhile.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.watermark = None
+        self.cursor = change_feed.ChangeCursor()
+        self.loaded_at = 0.0
+        self._rows = {}
+        # Books discarded since the rows of the build in progress were taken
+        self._discarded = set()
+        self._dirty = False
+        self._columns = _Columns([])
+
+    # ------------------ loading ------------------
+    async def load(self, db: AsyncSession):
+        """Replace the snapshot with a full read of the catalog."""
+        rows = {}
+        watermark = None
+        # Tombstones after this cursor are applied by refresh()
+        cursor = await change_feed.head_cursor(db)
+        result = await db.stream(select(*SNAPSHOT_COLUMNS).execution_options(yield_per=5000))
+        async for row in result:
+            rows[row.id] = jsonable_encoder(dict(row._mapping))
+            if row.updated_at and (watermark is None or row.updated_at > watermark):
+                watermark = row.updated_at
+        self._rows = rows
+        self.watermark = watermark
+        self.cursor = cursor
+        self.loaded_at = time.monotonic()
+        await self._rebuild()
+        self.ready = True
+
+    async def refresh(self, db: AsyncSession):
+        """Apply rows changed since the watermark. Returns the number applied."""
+        if not self.ready:
+            await self.load(db)
+            return len(self._rows)
+
+        query = select(*SNAPSHOT_COLUMNS)
+        if self.watermark is not None:
+            query = query.where(Book.updated_at > self.watermark - WATERMARK_OVERLAP)
+        result = await db.execute(query)
+
+        changed = 0
+        for row in result:
+            data = jsonable_encoder(dict(row._mapping))
+            if self._rows.get(row.id) != data:
+                self._rows[row.id] = data
+                changed += 1
+            if row.updated_at and (self.watermark is None or row.updated_at > self.watermark):
+                self.watermark = row.updated_at
+
+        # Deletes leave no updated_at behind; take them from the change feed.
+        # Every op is read so the cursor sees the gaps, but upserts are
+        # covered by the watermark unless they committed late
+        feed = await db.execute(
+            select(BookChange.seq, BookChange.op, BookChange.book_id)
+            .where(self.cursor.pending())
+            .order_by(BookChange.seq)
+        )
+        now = await change_feed.clock(db)
+        late = set()
+        for seq, op, book_id in feed:
+            if self.cursor.accept(seq, now):
+                late.add(book_id)
+            elif op == "delete" and self._rows.pop(book_id, None) is not None:
+                changed += 1
+        self.cursor.expire(now)
+
+        # A change that committed late may predate the watermark overlap too:
+        # re-read those books in their current state
+        if late:
+            current = await db.execute(select(*SNAPSHOT_COLUMNS).where(Book.id.in_(late)))
+            found = {row.id: jsonable_encoder(dict(row._mapping)) for row in current}
+            for book_id in late:
+                data = found.get(book_id)
+                if data is None:
+                    changed += self._rows.pop(book_id, None) is not None
+                elif self._rows.get(book_id) != data:
+                    self._rows[book_id] = data
+                    changed += 1
+
+        if changed or self._dirty:
+            await self._rebuild()
+        return changed
+
+    def discard(self, book_id):
+        """Hide a book deleted by this worker without waiting for a refresh."""
+        book_id = UUID(str(book_id))
+        if self._rows.pop(book_id, None) is not None:
+            self._discarded.add(book_id)
+            self._columns.hide(book_id)
+            # Compacted away by the next refresh
+            self._dirty = True
+
+    async def _rebuild(self):
+        self._discarded = set()
+        self._dirty = False
+        columns = await asyncio.to_thread(_Columns, list(self._rows.values()))
+        for book_id in self._discarded:
+            columns.hide(book_id)
+        self._columns = columns
+
+    # ------------------ querying ------------------
+    def query(
+        self, page: int = 1, limit: int = 20,
+        category: str = None, author: str = None,
+        min_price: float = None, max_price: float = None,
+        sort_by: str = "title", sort_order: str = "asc"
+    ):
+        """Same filters, ordering and response shape as the SQL page path."""
+        c = self._columns
+        mask = c.live.copy()
+        if category:
+            mask &= _contains(c.category_codes, c.categories, category)
+        if author:
+            mask &= _contains(c.author_codes, c.authors, author)
+        if min_price is not None:
+            mask &= c.price >= min_price
+        if max_price is not None:
+            mask &= c.price <= max_price
+
+        matches = np.flatnonzero(mask)
+        sort_key = {
+            "price": c.price,
+            "published_date": c.published,
+        }.get(sort_by, c.title_rank)
+        # lexsort sorts by the last key first; id breaks ties as in SQL
+        order = np.lexsort((c.id_rank[matches], sort_key[matches]))
+        if sort_order.lower() == "desc":
+            order = order[::-1]
+
+        total = int(matches.size)
+        offset = (page - 1) * limit
+        selected = matches[order[offset:offset + limit]]
+        return {
+            "items": [c.records[i] for i in selected],
+            "total": total,
+            "page": page,
+            "limit": limit,
+            "pages": (total + limit - 1) // limit,
+        }
+
+    def stats(self):
+        c = self._columns
+        arrays = (
+            c.price, c.stock, c.published, c.category_codes,
+            c.author_codes, c.title_rank, c.id_rank, c.live,
+        )
+        return {
+            "ready": self.ready,
+            "books": len(self._rows),
+            "categories": len(c.categories),
+            "authors": len(c.authors),
+            "array_bytes": int(sum(a.nbytes for a in arrays)),
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+        }
+
+
+class _Columns:
+    """One immutable build of the arrays, apart from the live mask."""
+
+    def __init__(self, records):
+        n = len(records)
+        self.records = records
+        self.index = {r["id"]: i for i, r in enumerate(records)}
+        self.live = np.ones(n, dtype=bool)
+        self.price = np.fromiter((r["price"] for r in records), dtype=np.float64, count=n)
+        self.stock = np.fromiter((r["stock_quantity"] or 0 for r in records), dtype=np.int32, count=n)
+        self.published = np.fromiter(
+            (_date_ordinal(r["published_date"]) for r in records), dtype=np.int32, count=n
+        )
+        self.category_codes, self.categories = _encode(r["category"] for r in records)
+        self.author_codes, self.authors = _encode(r["author"] for r in records)
+
+        # Sort ranks: comparing int32 ranks is far cheaper than comparing strings
+        self.title_rank = _rank([r["title"] for r in records])
+        self.id_rank = _rank([r["id"] for r in records])
+
+    def hide(self, book_id: UUID):
+        # records hold jsonable ids, i.e. strings
+        i = self.index.get(str(book_id))
+        if i is not None:
+            self.live[i] = False
+
+
+def _date_ordinal(value):
+    if value is None:
+        return NULL_DATE
+    return np.datetime64(value, "D").astype(np.int64).item()
+
+
+def _encode(values):
+    """Dictionary-encode strings: int32 codes plus the interned value table."""
+    table, lookup, codes = [], {}, []
+    for value in values:
+        if value is None:
+            codes.append(-1)
+            continue
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(table)
+            table.append(sys.intern(value))
+        codes.append(code)
+    return np.asarray(codes, dtype=np.int32), table
+
+
+def _rank(values):
+    order = sorted(range(len(values)), key=values.__getitem__)
+    ranks = np.empty(len(values), dtype=np.int32)
+    ranks[order] = np.arange(len(values), dtype=np.int32)
+    return ranks
+
+
+def _contains(codes, table, needle: str):
+    # Case-insensitive substring match, like ILIKE '%needle%', done once per
+    # distinct value and then broadcast over the code array
+    needle = needle.lower()
+    hits = [code for code, value in enumerate(table) if needle in value.lower()]
+    return np.isin(codes, hits)
+
+
+catalog = CatalogSnapshot()
+
+
+async def run_refresh(interval: float, full_reload_interval: float):
+    """Background loop keeping this worker's snapshot current."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                # Periodic full reloads repair anything the incremental path
+                # missed, e.g. a tombstone committed behind the cursor
+                if time.monotonic() - catalog.loaded_at >= full_reload_interval:
+                    await catalog.load(session)
+                else:
+                    await catalog.refresh(session)
+        except Exception as e:
+            print(f"Catalog snapshot refresh failed: {e}")
+        await asyncio.sleep(interval)
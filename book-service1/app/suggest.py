@@ -0,0 +1,245 @@
+import asyncio
+import heapq
+import re
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import change_feed
+from app.database import AsyncSessionLocal
+from app.models import Book, BookChange
+
+# Prefixes this short match too many keys to scan per keystroke; each keeps a
+# precomputed buffer of its best keys, updated on writes and rescanned only
+# when removals shrink it below TOP_PER_SHORT_PREFIX
+SHORT_PREFIX = 2
+TOP_PER_SHORT_PREFIX = 25
+SHORT_BUFFER = 4 * TOP_PER_SHORT_PREFIX
+# Keys examined at most for longer prefixes
+SCAN_LIMIT = 2000
+# Words of a title that start their own key, so "prag" finds "The Pragmatic Programmer"
+MAX_TITLE_WORDS = 6
+CHANGE_BATCH = 5000
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    """Casefold, strip accents and collapse punctuation to single spaces."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_WORD.sub(" ", stripped.casefold()).strip()
+
+
+def _short_prefixes(key: str):
+    return {key[:n] for n in range(1, min(len(key), SHORT_PREFIX) + 1)}
+
+
+def _descending(entry):
+    score, key = entry
+    return (-score, key)
+
+
+def _prefix_end(prefix: str) -> str:
+    # Smallest string greater than every string starting with prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class SuggestIndex:
+    """
+    Prefix index over normalized titles and author names, held per worker.
+
+    Keys live in one sorted list of (key, book_id, kind) tuples, so a prefix
+    lookup is two bisects plus a bounded scan. Writes arrive through the
+    change feed and are applied with insort/removal instead of a rebuild.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.cursor = change_feed.ChangeCursor()
+        self.loaded_at = 0.0
+        self._keys = []
+        self._books = {}  # book_id -> (title, author, score, keys)
+        self._short = {}  # short prefix -> best (score, key) entries, best first
+        self._complete = set()  # short prefixes whose buffer holds every key
+
+    # ------------------ building ------------------
+    def _book_keys(self, book_id: str, title: str, author: str):
+        keys = []
+        title_norm = normalize(title or "")
+        words = title_norm.split(" ")
+        for i in range(min(len(words), MAX_TITLE_WORDS)):
+            suffix = " ".join(words[i:])
+            if suffix:
+                keys.append((suffix, book_id, "title"))
+        author_norm = normalize(author or "")
+        if author_norm:
+            keys.append((author_norm, book_id, "author"))
+            surname = author_norm.rsplit(" ", 1)[-1]
+            if surname != author_norm:
+                keys.append((surname, book_id, "author"))
+        return keys
+
+    async def load(self, db: AsyncSession):
+        cursor = await change_feed.head_cursor(db)
+
+        books, keys = {}, []
+        result = await db.stream(
+            select(Book.id, Book.title, Book.author, Book.stock_quantity)
+            .execution_options(yield_per=5000)
+        )
+        async for row in result:
+            book_id = str(row.id)
+            book_keys = self._book_keys(book_id, row.title, row.author)
+            books[book_id] = (row.title, row.author, row.stock_quantity or 0, book_keys)
+            keys.extend(book_keys)
+        keys.sort()
+
+        self._books, self._keys = books, keys
+        self._short, self._complete = {}, set()
+        for prefix in {p for key in keys for p in _short_prefixes(key[0])}:
+            self._rescan_short_prefix(prefix)
+        self.cursor = cursor
+        self.loaded_at = time.monotonic()
+        self.ready = True
+
+    def _remove(self, book_id: str):
+        book = self._books.get(book_id)
+        if book is None:
+            return
+        score, book_keys = book[2], book[3]
+        # Every key goes before any rescan: a rescan ranks the keys left in
+        # range, and those must not include this book's
+        for key in book_keys:
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+        rescan = set()
+        for key in book_keys:
+            for prefix in _short_prefixes(key[0]):
+                buffer = self._short.get(prefix)
+                if buffer and (score, key) in buffer:
+                    buffer.remove((score, key))
+                    if len(buffer) < TOP_PER_SHORT_PREFIX and prefix not in self._complete:
+                        rescan.add(prefix)
+        del self._books[book_id]
+        for prefix in rescan:
+            self._rescan_short_prefix(prefix)
+
+    def _add(self, book_id: str, title: str, author: str, stock: int):
+        score = stock or 0
+        book_keys = self._book_keys(book_id, title, author)
+        self._books[book_id] = (title, author, score, book_keys)
+        for key in book_keys:
+            insort(self._keys, key)
+            for prefix in _short_prefixes(key[0]):
+                buffer = self._short.setdefault(prefix, [])
+                if not buffer:
+                    self._complete.add(prefix)
+                entry = (score, key)
+                # A buffer is the exact top of its prefix range, so an entry
+                # ranking below its last one can only belong to a complete one
+                if prefix in self._complete or _descending(entry) < _descending(buffer[-1]):
+                    insort(buffer, entry, key=_descending)
+                    if len(buffer) > SHORT_BUFFER:
+                        del buffer[SHORT_BUFFER:]
+                        self._complete.discard(prefix)
+
+    def _rescan_short_prefix(self, prefix: str):
+        lo = bisect_left(self._keys, (prefix,))
+        hi = bisect_left(self._keys, (_prefix_end(prefix),))
+        self._short[prefix] = self._ranked(lo, hi, SHORT_BUFFER)
+        if hi - lo <= SHORT_BUFFER:
+            self._complete.add(prefix)
+        else:
+            self._complete.discard(prefix)
+
+    def _ranked(self, lo: int, hi: int, n: int):
+        # Best-stocked n (score, key) entries of self._keys[lo:hi], best first
+        entries = ((self._books[k[1]][2], k) for k in self._keys[lo:hi])
+        return heapq.nsmallest(n, entries, key=_descending)
+
+    async def refresh(self, db: AsyncSession):
+        """Apply catalog changes the cursor has not read. Returns how many were applied."""
+        if not self.ready:
+            await self.load(db)
+            return len(self._books)
+
+        result = await db.execute(
+            select(BookChange.seq, BookChange.op, BookChange.book_id,
+                   Book.title, Book.author, Book.stock_quantity)
+            .outerjoin(Book, Book.id == BookChange.book_id)
+            .where(self.cursor.pending())
+            .order_by(BookChange.seq)
+            .limit(CHANGE_BATCH)
+        )
+        now = await change_feed.clock(db)
+        applied = 0
+        # Late rows need no special case: the book is re-read in its current state
+        for row in result:
+            book_id = str(row.book_id)
+            self._remove(book_id)
+            # Joined columns are null once the book is gone, whatever the op
+            if row.op == "upsert" and row.title is not None:
+                self._add(book_id, row.title, row.author, row.stock_quantity)
+            self.cursor.accept(row.seq, now)
+            applied += 1
+        self.cursor.expire(now)
+        return applied
+
+    # ------------------ querying ------------------
+    def _top(self, scored, limit: int):
+        # One suggestion per distinct text, best-stocked first
+        seen, top = set(), []
+        for _, key in scored:
+            title, author, _, _ = self._books[key[1]]
+            text = title if key[2] == "title" else author
+            if (key[2], text) in seen:
+                continue
+            seen.add((key[2], text))
+            top.append(key)
+            if len(top) == limit:
+                break
+        return top
+
+    def suggest(self, q: str, limit: int = 10):
+        prefix = normalize(q)
+        if not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX:
+            scored = self._short.get(prefix, [])
+        else:
+            lo = bisect_left(self._keys, (prefix,))
+            hi = min(bisect_left(self._keys, (_prefix_end(prefix),)), lo + SCAN_LIMIT)
+            scored = self._ranked(lo, hi, limit * 4)
+        keys = self._top(scored, limit)
+
+        suggestions = []
+        for _, book_id, kind in keys:
+            title, author, _, _ = self._books[book_id]
+            suggestions.append({
+                "text": title if kind == "title" else author,
+                "kind": kind,
+                "book_id": book_id if kind == "title" else None,
+            })
+        return suggestions
+
+
+index = SuggestIndex()
+
+
+async def run_refresh(interval: float, full_reload_interval: float):
+    """Background loop applying the change feed to this worker's index."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                if time.monotonic() - index.loaded_at >= full_reload_interval:
+                    await index.load(session)
+                else:
+                    await index.refresh(session)
+        except Exception as e:
+            print(f"Suggest index refresh failed: {e}")
+        await asyncio.sleep(interval)
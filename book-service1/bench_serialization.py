@@ -0,0 +1,89 @@
+"""
+Per-item cost of building a list page: the old ORM path against core rows
+serialized with orjson.
+
+    python bench_serialization.py --items 100 --rounds 2000
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+
+from app.crud import LIST_COLUMNS
+from app.models import Book
+from app.schemas import BookOut
+from app.serialization import dumps
+
+
+def make_rows(n: int):
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": uuid.uuid4(),
+            "title": f"Book title number {i}",
+            "author": f"Author {i % 50}",
+            "isbn": f"978-{i:010d}",
+            "description": "A reasonably sized description of the book " * 3,
+            "price": Decimal("19.99"),
+            "stock_quantity": i % 40,
+            "category": "Fiction",
+            "publisher": "Publisher",
+            "published_date": date(2001, 1, 1),
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(n)
+    ]
+
+
+def rows_as_result(rows):
+    """Build real SQLAlchemy Row objects, as a core select would return."""
+    from sqlalchemy.engine.result import SimpleResultMetaData, IteratorResult
+
+    keys = [c.key for c in LIST_COLUMNS]
+    metadata = SimpleResultMetaData(keys)
+    return lambda: IteratorResult(metadata, iter([tuple(r[k] for k in keys) for r in rows])).all()
+
+
+def orm_path(rows):
+    # Before: hydrate entities, BookOut.from_orm each, then FastAPI's
+    # jsonable_encoder + json.dumps for response_model=dict
+    books = [Book(**r) for r in rows]
+    items = [BookOut.from_orm(b) for b in books]
+    payload = {"items": items, "total": len(items), "page": 1, "limit": len(items), "pages": 1}
+    return json.dumps(jsonable_encoder(payload)).encode()
+
+
+def core_path(fetch_rows):
+    # After: core rows straight to bytes
+    items = [row._asdict() for row in fetch_rows()]
+    payload = {"items": items, "total": len(items), "page": 1, "limit": len(items), "pages": 1}
+    return dumps(payload)
+
+
+def measure(label, fn, rounds, items):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    per_item = (time.perf_counter() - start) / (rounds * items)
+    print(f"{label:<6} {per_item * 1e6:8.2f} us/item")
+    return per_item
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=500)
+    args = parser.parse_args()
+
+    rows = make_rows(args.items)
+    fetch_rows = rows_as_result(rows)
+    assert json.loads(orm_path(rows)) == json.loads(core_path(fetch_rows))
+
+    before = measure("orm", lambda: orm_path(rows), args.rounds, args.items)
+    after = measure("core", lambda: core_path(fetch_rows), args.rounds, args.items)
+    print(f"speedup {before / after:.1f}x")
@@ -0,0 +1,115 @@
+"""
+Compare list queries served from the in-process catalog snapshot with the
+SQL path.
+
+    python bench_snapshot.py --books 200000          # snapshot only, synthetic data
+    python bench_snapshot.py --sql                   # snapshot loaded from, and
+                                                     # compared against, DATABASE_URL
+"""
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import date, timedelta
+
+from app.snapshot import CatalogSnapshot
+
+QUERIES = [
+    {},
+    {"category": "fiction"},
+    {"min_price": 10, "max_price": 30, "sort_by": "price"},
+    {"author": "smith", "sort_by": "published_date", "sort_order": "desc"},
+    {"category": "science", "min_price": 20, "page": 5},
+]
+
+CATEGORIES = ["Fiction", "Programming", "Science", "History", "Poetry", "Travel", "Cooking", "Art"]
+SURNAMES = ["Smith", "Jones", "Martin", "Garcia", "Chen", "Okafor", "Novak", "Silva"]
+
+
+def synthetic_rows(n: int):
+    rng = random.Random(42)
+    rows = {}
+    for i in range(n):
+        book_id = uuid.UUID(int=rng.getrandbits(128))
+        published = date(1950, 1, 1) + timedelta(days=rng.randrange(27000))
+        rows[book_id] = {
+            "id": str(book_id),
+            "title": f"Book {rng.randrange(10 ** 9):09d}",
+            "author": f"{rng.choice('ABCDEFGHIJ')}. {rng.choice(SURNAMES)} {i % 5000}",
+            "isbn": f"978-{i:010d}",
+            "description": None,
+            "price": round(rng.uniform(5, 120), 2),
+            "stock_quantity": rng.randrange(200),
+            "category": rng.choice(CATEGORIES),
+            "publisher": None,
+            "published_date": published.isoformat() if rng.random() > 0.05 else None,
+            "created_at": None,
+            "updated_at": None,
+        }
+    return rows
+
+
+def run(label: str, fn, seconds: float):
+    calls, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for q in QUERIES:
+            fn(q)
+            calls += 1
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {calls / elapsed:>10.0f} qps  {elapsed / calls * 1e6:>9.1f} us/query")
+
+
+async def arun(label: str, fn, seconds: float):
+    calls, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for q in QUERIES:
+            await fn(q)
+            calls += 1
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {calls / elapsed:>10.0f} qps  {elapsed / calls * 1e6:>9.1f} us/query")
+
+
+async def main(args):
+    snapshot = CatalogSnapshot()
+    tracemalloc.start()
+    if args.sql:
+        from app.database import AsyncSessionLocal
+        async with AsyncSessionLocal() as session:
+            await snapshot.load(session)
+    else:
+        snapshot._rows = synthetic_rows(args.books)
+        await snapshot._rebuild()
+        snapshot.ready = True
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = snapshot.stats()
+    print(f"books: {stats['books']}  arrays: {stats['array_bytes'] / 2 ** 20:.1f} MiB  "
+          f"total python heap: {current / 2 ** 20:.1f} MiB")
+
+    run("snapshot", lambda q: snapshot.query(**q), args.seconds)
+
+    if args.sql:
+        from app import crud
+        from app.database import AsyncSessionLocal
+
+        async def sql_query(q):
+            params = {
+                "page": 1, "limit": 20, "category": None, "author": None, "search": None,
+                "min_price": None, "max_price": None, "sort_by": "title", "sort_order": "asc",
+            }
+            params.update(q)
+            async with AsyncSessionLocal() as session:
+                await crud._list_books_page(session, **params)
+
+        await arun("sql", sql_query, args.seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--sql", action="store_true", help="load from and compare against Postgres")
+    asyncio.run(main(parser.parse_args()))
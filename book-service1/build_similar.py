@@ -0,0 +1,30 @@
+"""
+Build the similar-books index read by GET /api/v1/books/{id}/similar.
+
+    python build_similar.py            # incremental: books changed since the last run
+    python build_similar.py --full     # re-vectorize the whole catalog
+
+Run it from cron or a scheduler; workers pick up the new version within
+SIMILAR_RELOAD_INTERVAL seconds. SIMILAR_INDEX_DIR must be shared with them.
+"""
+import argparse
+import asyncio
+import json
+
+from app.config import SIMILAR_INDEX_DIR
+from app.database import AsyncSessionLocal
+from app.similar import build
+
+
+async def main(path: str, full: bool):
+    async with AsyncSessionLocal() as session:
+        summary = await build(session, path, full)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the similar-books index")
+    parser.add_argument("--path", default=SIMILAR_INDEX_DIR)
+    parser.add_argument("--full", action="store_true", help="Rebuild from scratch")
+    args = parser.parse_args()
+    asyncio.run(main(args.path, args.full))
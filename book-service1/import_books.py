@@ -0,0 +1,36 @@
+import argparse
+import asyncio
+import json
+
+from app.bulk import import_books
+from app.database import AsyncSessionLocal
+
+READ_SIZE = 1 << 20
+
+
+async def read_lines(path: str):
+    # Reads in fixed-size blocks so the file is never fully loaded
+    with open(path, "rb") as f:
+        buffer = b""
+        while block := f.read(READ_SIZE):
+            buffer += block
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield line.decode("utf-8").rstrip("\r")
+        if buffer:
+            yield buffer.decode("utf-8").rstrip("\r")
+
+
+async def main(path: str, fmt: str):
+    async with AsyncSessionLocal() as session:
+        summary = await import_books(session, read_lines(path), fmt)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import books from CSV or NDJSON")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "ndjson"], default=None)
+    args = parser.parse_args()
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    asyncio.run(main(args.path, fmt))
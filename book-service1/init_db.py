@@ -1,19 +1,43 @@
 import asyncio
+import os
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from app.models import Base, Book, Category
+from sqlalchemy.dialects.postgresql import insert
+from app.category_counts import apply_category_deltas
+from app.models import Book, Category
 from app.config import DATABASE_URL
+from collections import Counter
 from datetime import date
 
+# Revision every schema built by create_all has; 0002 adds whatever is missing
+BASELINE_REVISION = "0001"
+
 engine = create_async_engine(DATABASE_URL, echo=True)
 AsyncSessionLocal = sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
 
-async def init_db():
-    async with engine.begin() as conn:
-        print("Creating tables...")
-        await conn.run_sync(Base.metadata.create_all)
-        print("Tables created!")
 
+async def has_unversioned_schema():
+    """True for a database built by create_all before migrations existed."""
+    async with engine.connect() as conn:
+        tables = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+    await engine.dispose()
+    return "books" in tables and "alembic_version" not in tables
+
+
+def migrate():
+    config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+    if asyncio.run(has_unversioned_schema()):
+        print(f"Existing schema found, stamping revision {BASELINE_REVISION}")
+        command.stamp(config, BASELINE_REVISION)
+    print("Running migrations...")
+    command.upgrade(config, "head")
+    print("Schema up to date!")
+
+
+async def init_db():
     async with AsyncSessionLocal() as session:
         # Sample categories
         categories = [
@@ -21,12 +45,9 @@ async def init_db():
             {"name": "Fiction", "description": "Fiction and literature"},
             {"name": "Science", "description": "Science and research books"},
         ]
-        for c in categories:
-            existing = await session.execute(
-                Category.__table__.select().where(Category.name == c["name"])
-            )
-            if not existing.scalar_one_or_none():
-                session.add(Category(**c))
+        await session.execute(
+            insert(Category).values(categories).on_conflict_do_nothing(index_elements=["name"])
+        )
 
         # Sample books
         books = [
@@ -64,15 +85,17 @@ async def init_db():
                 "published_date": date(1949, 6, 8),
             },
         ]
-        for b in books:
-            existing = await session.execute(
-                Book.__table__.select().where(Book.isbn == b["isbn"])
-            )
-            if not existing.scalar_one_or_none():
-                session.add(Book(**b))
+        # Count only the rows actually inserted, as every other writer does
+        inserted = await session.execute(
+            insert(Book).values(books).on_conflict_do_nothing(index_elements=["isbn"])
+            .returning(Book.category)
+        )
+        await apply_category_deltas(session, Counter(row.category for row in inserted))
 
         await session.commit()
         print("Sample data inserted!")
 
 if __name__ == "__main__":
+    # Alembic runs its own event loop, so it goes before the seeding loop
+    migrate()
     asyncio.run(init_db())
@@ -0,0 +1,48 @@
+"""Baseline: the original books and categories tables
+
+Every database created by metadata.create_all before migrations existed has
+at least this; init_db.py stamps them at this revision instead of running
+it. Whatever later create_all runs added on top is (re)created by 0002.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "books",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("author", sa.String(), nullable=False),
+        sa.Column("isbn", sa.String(), nullable=False, unique=True),
+        sa.Column("description", sa.Text()),
+        sa.Column("price", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("stock_quantity", sa.Integer()),
+        sa.Column("category", sa.String()),
+        sa.Column("publisher", sa.String()),
+        sa.Column("published_date", sa.Date()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+
+    op.create_table(
+        "categories",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False, unique=True),
+        sa.Column("description", sa.Text()),
+    )
+
+
+def downgrade():
+    op.drop_table("categories")
+    op.drop_table("books")
@@ -0,0 +1,90 @@
+"""Keyset indexes, category counters and the change feed
+
+These were created by metadata.create_all before migrations existed, so a
+stamped database may already have any of them, depending on the version it
+was created or last started with. Every step is therefore skipped when its
+object exists; the trigger is simply replaced.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = sa.inspect(op.get_bind()).get_table_names()
+
+    op.create_index("ix_books_title_id", "books", ["title", "id"], if_not_exists=True)
+    op.create_index("ix_books_price_id", "books", ["price", "id"], if_not_exists=True)
+    op.create_index(
+        "ix_books_published_date_id", "books",
+        [sa.text("coalesce(published_date, DATE '0001-01-01')"), "id"],
+        if_not_exists=True,
+    )
+
+    if "category_counts" not in existing:
+        op.create_table(
+            "category_counts",
+            sa.Column("category", sa.String(), primary_key=True),
+            sa.Column("book_count", sa.Integer(), nullable=False),
+        )
+        # Counters are only ever adjusted by deltas, so they start from the
+        # current catalog
+        op.execute("""
+            INSERT INTO category_counts (category, book_count)
+            SELECT category, count(*) FROM books
+            WHERE category IS NOT NULL
+            GROUP BY category
+        """)
+
+    if "book_changes" not in existing:
+        op.create_table(
+            "book_changes",
+            sa.Column("seq", sa.BigInteger(), sa.Identity(), primary_key=True),
+            sa.Column("book_id", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("op", sa.String(), nullable=False),
+            sa.Column(
+                "changed_at", sa.DateTime(timezone=True),
+                server_default=sa.func.clock_timestamp(), nullable=False,
+            ),
+        )
+
+    # Every write to books, including set-based UPDATEs and bulk upserts, lands
+    # in book_changes inside the writer's transaction. pg_notify wakes long-poll
+    # readers once that transaction commits.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION record_book_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO book_changes (book_id, op) VALUES (OLD.id, 'delete');
+            ELSE
+                INSERT INTO book_changes (book_id, op) VALUES (NEW.id, 'upsert');
+            END IF;
+            PERFORM pg_notify('book_changes', '');
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE TRIGGER books_change_feed
+            AFTER INSERT OR UPDATE OR DELETE ON books
+            FOR EACH ROW EXECUTE FUNCTION record_book_change()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS books_change_feed ON books")
+    op.execute("DROP FUNCTION IF EXISTS record_book_change()")
+    op.drop_table("book_changes")
+    op.drop_table("category_counts")
+    op.drop_index("ix_books_published_date_id", table_name="books")
+    op.drop_index("ix_books_price_id", table_name="books")
+    op.drop_index("ix_books_title_id", table_name="books")
@@ -0,0 +1,52 @@
+"""Indexes for the list query shapes
+
+category, author, search (title or description) are ILIKE '%term%' filters,
+which only trigram GIN indexes can serve. Price ranges and the title and
+price sorts use the (column, id) indexes from 0002; offset pages sort by
+the raw published_date, which needs its own index next to the coalesced
+keyset one. updated_at drives the snapshot watermark.
+
+Built CONCURRENTLY so the upgrade does not block writes on a live catalog.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+TRIGRAM_INDEXES = {
+    "ix_books_title_trgm": "title",
+    "ix_books_author_trgm": "author",
+    "ix_books_category_trgm": "category",
+    "ix_books_description_trgm": "description",
+}
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        for name, column in TRIGRAM_INDEXES.items():
+            op.create_index(
+                name, "books", [column], postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+                postgresql_concurrently=True, if_not_exists=True,
+            )
+        op.create_index(
+            "ix_books_published_date_raw_id", "books", ["published_date", "id"],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            "ix_books_updated_at", "books", ["updated_at"],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in [*TRIGRAM_INDEXES, "ix_books_published_date_raw_id", "ix_books_updated_at"]:
+            op.drop_index(name, table_name="books", postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,29 @@
+"""Per-book hot-item stock flag
+
+Adding a column with a constant default is a metadata-only change, so this
+does not rewrite books.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "books",
+        sa.Column("hot_stock", sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+    op.create_index("ix_books_hot_stock", "books", ["id"], postgresql_where=sa.text("hot_stock"))
+
+
+def downgrade():
+    op.drop_index("ix_books_hot_stock", table_name="books")
+    op.drop_column("books", "hot_stock")
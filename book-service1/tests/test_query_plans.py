@@ -0,0 +1,146 @@
+"""
+Plan regression tests for the list endpoint's query shapes.
+
+Runs against the database configured by DB_* (use a disposable one: it is
+migrated to head and seeded with synthetic books):
+
+    RUN_PLAN_TESTS=1 python -m pytest tests/test_query_plans.py
+
+Each shape must be served by the index meant for it, checked by name. Plans
+are taken with enable_seqscan off so the choice does not hinge on the size
+of the seeded table; without the right index the planner then falls back to
+a full walk of some other index, which the name check catches.
+"""
+import asyncio
+import itertools
+import json
+import os
+
+import pytest
+
+if os.getenv("RUN_PLAN_TESTS") != "1":
+    pytest.skip("set RUN_PLAN_TESTS=1 to run plan tests against a database", allow_module_level=True)
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import DATABASE_URL
+from app.crud import _list_query
+
+SEED_BOOKS = 20000
+
+SEED_SQL = text(f"""
+    INSERT INTO books (id, title, author, isbn, description, price, stock_quantity,
+                       category, publisher, published_date)
+    SELECT gen_random_uuid(),
+           'Title ' || g,
+           'Author ' || (g % 2000),
+           'plan-test-' || g,
+           'Description ' || md5(g::text),
+           (g % 9000) / 100.0 + 1,
+           g % 50,
+           (ARRAY['Fiction', 'Science', 'Programming', 'History'])[g % 4 + 1],
+           'Publisher ' || (g % 40),
+           CASE WHEN g % 20 = 0 THEN NULL ELSE DATE '1950-01-01' + (g % 25000) END
+    FROM generate_series(1, {SEED_BOOKS}) AS g
+    ON CONFLICT (isbn) DO NOTHING
+""")
+
+SEARCH_INDEXES = {"ix_books_title_trgm", "ix_books_description_trgm"}
+
+# Filter params, and the index sets that can serve the filter: a plan passes
+# when it uses every index of at least one set. search ORs title and
+# description, so it needs both.
+FILTERS = {
+    "none": ({}, []),
+    "category": ({"category": "fict"}, [{"ix_books_category_trgm"}]),
+    "author": ({"author": "author 42"}, [{"ix_books_author_trgm"}]),
+    "search": ({"search": "title 123"}, [SEARCH_INDEXES]),
+    "price_range": ({"min_price": 10, "max_price": 20}, [{"ix_books_price_id"}]),
+    "category_and_price": (
+        {"category": "scien", "min_price": 5, "max_price": 50},
+        [{"ix_books_category_trgm"}, {"ix_books_price_id"}],
+    ),
+    "author_and_search": (
+        {"author": "author 7", "search": "descr"},
+        [{"ix_books_author_trgm"}, SEARCH_INDEXES],
+    ),
+}
+SORTS = [
+    ("title", "asc"), ("title", "desc"),
+    ("price", "asc"), ("price", "desc"),
+    ("published_date", "asc"), ("published_date", "desc"),
+]
+# Walked in (or against) sort order, these serve a page of any filter by
+# reading rows until the page is full
+SORT_INDEXES = {
+    "title": "ix_books_title_id",
+    "price": "ix_books_price_id",
+    "published_date": "ix_books_published_date_raw_id",
+}
+
+
+async def _seed():
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    async with engine.begin() as conn:
+        await conn.execute(SEED_SQL)
+        await conn.execute(text("ANALYZE books"))
+    await engine.dispose()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def seeded_database():
+    config = Config(os.path.join(os.path.dirname(__file__), "..", "alembic.ini"))
+    command.upgrade(config, "head")
+    asyncio.run(_seed())
+
+
+async def _plan(query):
+    compiled = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    sql = str(compiled).replace(":", "\\:")
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    async with engine.begin() as conn:
+        await conn.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar()
+    await engine.dispose()
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+
+def _index_names(node):
+    names = {node["Index Name"]} if "Index Name" in node else set()
+    for child in node.get("Plans", []):
+        names |= _index_names(child)
+    return names
+
+
+def _assert_uses(query, alternatives):
+    plan = asyncio.run(_plan(query))[0]["Plan"]
+    used = _index_names(plan)
+    assert any(indexes <= used for indexes in alternatives), (
+        f"expected one of {[sorted(i) for i in alternatives]}, plan uses {sorted(used)}\n"
+        + json.dumps(plan, indent=2)
+    )
+
+
+@pytest.mark.parametrize(
+    "name,sort",
+    list(itertools.product(FILTERS, SORTS)),
+    ids=[f"{name}-{by}-{order}" for name, (by, order) in itertools.product(FILTERS, SORTS)],
+)
+def test_page_query_uses_index(name, sort):
+    filters, alternatives = FILTERS[name]
+    sort_by, sort_order = sort
+    query = _list_query(**filters, sort_by=sort_by, sort_order=sort_order)
+    _assert_uses(query.offset(40).limit(20), alternatives + [{SORT_INDEXES[sort_by]}])
+
+
+# An unfiltered count reads the whole table whatever the indexes
+@pytest.mark.parametrize("name", [name for name in FILTERS if name != "none"])
+def test_count_query_uses_index(name):
+    filters, alternatives = FILTERS[name]
+    query = _list_query(**filters)
+    _assert_uses(select(func.count()).select_from(query.subquery()), alternatives)
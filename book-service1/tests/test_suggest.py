@@ -0,0 +1,85 @@
+"""
+Autocomplete index under add/remove churn, checked against a brute-force
+ranking of the same books. No database needed:
+
+    python -m pytest tests/test_suggest.py
+"""
+import random
+
+import pytest
+
+from app.suggest import SuggestIndex, normalize
+
+TITLES = ["Prolog", "Pragmatic Programmer", "Programming Pearls", "Python Tricks", "Patterns"]
+AUTHORS = ["Pat Price", "Ann Prentice", "Hunt", "Bo Pryor"]
+
+
+def _expected(books, q: str, limit: int):
+    """Best-stocked distinct suggestions for q, computed from scratch."""
+    prefix = normalize(q)
+    index = SuggestIndex()
+    entries = []
+    for book_id, (title, author, stock) in books.items():
+        for key in index._book_keys(book_id, title, author):
+            if key[0].startswith(prefix):
+                entries.append((stock, key))
+    entries.sort(key=lambda e: (-e[0], e[1]))
+    seen, out = set(), []
+    for _, (_, book_id, kind) in entries:
+        title, author, _ = books[book_id]
+        text = title if kind == "title" else author
+        if (kind, text) in seen:
+            continue
+        seen.add((kind, text))
+        out.append({"text": text, "kind": kind, "book_id": book_id if kind == "title" else None})
+        if len(out) == limit:
+            break
+    return out
+
+
+def _check(index, books):
+    for q in ("p", "pr", "pra", "prog", "pat", "h", "py"):
+        assert index.suggest(q, 10) == _expected(books, q, 10), q
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_churn_matches_brute_force(seed):
+    rnd = random.Random(seed)
+    index = SuggestIndex()
+    books = {}
+    for step in range(600):
+        if books and rnd.random() < 0.45:
+            book_id = rnd.choice(sorted(books))
+            index._remove(book_id)
+            del books[book_id]
+        else:
+            book_id = f"b{rnd.randrange(300)}"
+            title = f"{rnd.choice(TITLES)} {rnd.randrange(50)}"
+            author = rnd.choice(AUTHORS)
+            stock = rnd.randrange(100)
+            # An update is a remove followed by an add, as in refresh()
+            index._remove(book_id)
+            index._add(book_id, title, author, stock)
+            books[book_id] = (title, author, stock)
+        if step % 50 == 0:
+            _check(index, books)
+    _check(index, books)
+
+
+def test_removing_the_buffered_books_keeps_short_prefixes_usable():
+    index = SuggestIndex()
+    index._add("primer", "Primer", "A", 1000)
+    index._add("prolog", "Prolog", "A", 0)
+    books = {"prolog": ("Prolog", "A", 0)}
+    for i in range(200):
+        index._add(f"b{i}", f"Pragmatic Programmer {i}", "Hunt", i + 1)
+    index._rescan_short_prefix("p")
+    index._rescan_short_prefix("pr")
+
+    # One single-key book first, so a buffer runs short between the two
+    # "pr" keys of a later book
+    index._remove("primer")
+    for i in reversed(range(200)):
+        index._remove(f"b{i}")
+    _check(index, books)
+    assert index.suggest("pr") == [{"text": "Prolog", "kind": "title", "book_id": "prolog"}]
@@ -0,0 +1,180 @@
+import itertools
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import (
+    ALSO_BOUGHT_TOP_K, ALSO_BOUGHT_MAX_BASKET, ALSO_BOUGHT_MAX_PAIRS, ALSO_BOUGHT_SETTLE_SECONDS,
+)
+from app.database import engine
+from app.models import AlsoBought, CoPurchaseCount, JobWatermark, Order, OrderItem
+
+# ------------------------------------------------------------
+# Tables
+# ------------------------------------------------------------
+# co_purchase_counts (book, other) -> orders holding both; the full sparse
+#                                     pair matrix, both directions, only
+#                                     ever incremented
+# also_bought        book -> top ALSO_BOUGHT_TOP_K others, best first, as
+#                            two parallel arrays; what the endpoint reads
+# job_watermarks     "also_bought" -> order creation time read up to
+#
+# A run reads the orders created since the watermark, counts book pairs
+# per order in memory, flushes the counts whenever ALSO_BOUGHT_MAX_PAIRS
+# pairs are pending, and finally recomputes also_bought for the books it
+# touched. Counts, lookup rows and watermark commit together, so a failed
+# run leaves no trace and a rerun counts nothing twice.
+WATERMARK = "also_bought"
+# Baskets fetched per server-side cursor round trip
+STREAM_BATCH_SIZE = 5000
+# Pairs per unnest() upsert
+UPSERT_CHUNK_SIZE = 50000
+# Books per top-K recompute statement
+TOP_K_CHUNK_SIZE = 1000
+
+# Any constant works; it only has to be unique among this app's advisory locks
+BUILD_LOCK_ID = 41_004
+
+UPSERT_PAIRS_SQL = text("""
+    INSERT INTO co_purchase_counts (book_id, other_book_id, orders)
+    SELECT * FROM unnest(CAST(:books AS uuid[]), CAST(:others AS uuid[]), CAST(:counts AS integer[]))
+    ON CONFLICT (book_id, other_book_id)
+    DO UPDATE SET orders = co_purchase_counts.orders + excluded.orders
+""")
+
+REFRESH_TOP_K_SQL = text("""
+    INSERT INTO also_bought (book_id, other_book_ids, orders, updated_at)
+    SELECT book_id,
+           array_agg(other_book_id ORDER BY orders DESC, other_book_id),
+           array_agg(orders ORDER BY orders DESC, other_book_id),
+           :now
+    FROM (
+        SELECT book_id, other_book_id, orders,
+               row_number() OVER (PARTITION BY book_id ORDER BY orders DESC, other_book_id) AS rank
+        FROM co_purchase_counts
+        WHERE book_id = ANY(CAST(:books AS uuid[]))
+    ) AS ranked
+    WHERE rank <= :k
+    GROUP BY book_id
+    ON CONFLICT (book_id) DO UPDATE SET
+        other_book_ids = excluded.other_book_ids,
+        orders = excluded.orders,
+        updated_at = excluded.updated_at
+""")
+
+
+def _baskets_query(since, until):
+    """One row per order in (since, until]: its distinct books."""
+    query = (
+        select(func.array_agg(OrderItem.book_id.distinct()).label("books"))
+        .join(Order, (Order.id == OrderItem.order_id) & (Order.created_at == OrderItem.order_created_at))
+        .where(OrderItem.order_created_at <= until, Order.status.is_distinct_from("cancelled"))
+        .group_by(OrderItem.order_id, OrderItem.order_created_at)
+    )
+    if since is not None:
+        query = query.where(OrderItem.order_created_at > since)
+    return query
+
+
+def count_pairs(books, pairs: Counter):
+    """Add one order's book pairs (a < b) to pairs."""
+    basket = sorted(set(books))[:ALSO_BOUGHT_MAX_BASKET]
+    for pair in itertools.combinations(basket, 2):
+        pairs[pair] += 1
+
+
+async def _flush(db: AsyncSession, pairs: Counter, touched: set):
+    books, others, counts = [], [], []
+    for (a, b), n in pairs.items():
+        books += (a, b)
+        others += (b, a)
+        counts += (n, n)
+        touched.update((a, b))
+    for start in range(0, len(books), UPSERT_CHUNK_SIZE):
+        end = start + UPSERT_CHUNK_SIZE
+        await db.execute(UPSERT_PAIRS_SQL, {
+            "books": books[start:end], "others": others[start:end], "counts": counts[start:end],
+        })
+    pairs.clear()
+
+
+async def build(db: AsyncSession, full: bool = False):
+    """
+    Count the co-purchases of orders created since the last run (all
+    orders with full) and refresh the lookup rows of every book involved.
+    Returns a summary, or None when another run holds the job.
+    """
+    locked = await db.execute(text(f"SELECT pg_try_advisory_xact_lock({BUILD_LOCK_ID})"))
+    if not locked.scalar():
+        await db.rollback()
+        return None
+
+    started = time.perf_counter()
+    if full:
+        await db.execute(delete(CoPurchaseCount))
+        await db.execute(delete(AlsoBought))
+        await db.execute(delete(JobWatermark).where(JobWatermark.name == WATERMARK))
+        since = None
+    else:
+        since = (await db.execute(
+            select(JobWatermark.value).where(JobWatermark.name == WATERMARK)
+        )).scalar()
+    # created_at is stamped before commit: stay clear of orders still committing
+    until = datetime.utcnow() - timedelta(seconds=ALSO_BOUGHT_SETTLE_SECONDS)
+
+    pairs, touched, orders = Counter(), set(), 0
+    async with engine.connect() as conn:
+        query = _baskets_query(since, until).execution_options(yield_per=STREAM_BATCH_SIZE)
+        result = await conn.stream(query)
+        async for rows in result.partitions():
+            for row in rows:
+                count_pairs(row.books, pairs)
+            orders += len(rows)
+            if len(pairs) >= ALSO_BOUGHT_MAX_PAIRS:
+                await _flush(db, pairs, touched)
+    await _flush(db, pairs, touched)
+
+    touched = sorted(touched)
+    now = datetime.utcnow()
+    for start in range(0, len(touched), TOP_K_CHUNK_SIZE):
+        await db.execute(REFRESH_TOP_K_SQL, {
+            "books": touched[start:start + TOP_K_CHUNK_SIZE], "k": ALSO_BOUGHT_TOP_K, "now": now,
+        })
+
+    stmt = insert(JobWatermark).values(name=WATERMARK, value=until)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[JobWatermark.name], set_={"value": stmt.excluded.value},
+    ))
+    await db.commit()
+    return {
+        "full": full,
+        "orders_read": orders,
+        "books_updated": len(touched),
+        "watermark": until.isoformat(),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+async def lookup(db: AsyncSession, book_id: str, limit: int):
+    """Books most often bought together with book_id: one primary-key read."""
+    try:
+        book_uuid = UUID(book_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid book_id format")
+    row = await db.get(AlsoBought, book_uuid)
+    if row is None:
+        return {"book_id": book_id, "items": [], "updated_at": None}
+    return {
+        "book_id": book_id,
+        "items": [
+            {"book_id": str(other), "orders": count}
+            for other, count in zip(row.other_book_ids[:limit], row.orders[:limit])
+        ],
+        "updated_at": row.updated_at.isoformat(),
+    }
@@ -0,0 +1,387 @@
+import fcntl
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import ANALYTICS_DATABASE_URL, ANALYTICS_DIR
+from app.models import Order, OrderItem
+
+# ------------------------------------------------------------
+# File layout
+# ------------------------------------------------------------
+# {base}/manifest.json  -> watermark, the part files in write order, version
+# {base}/refresh.lock    -> held by the running refresh, manifest read to swap
+# {base}/part-NNNNNN.npz -> compressed columns, one row per order line:
+#     order_ids   S16[n]  order id bytes
+#     user_ids    S16[u]  dictionary; user  int32[n] indexes it
+#     book_ids    S16[b]  dictionary; book  int32[n] indexes it
+#     book_titles U[b]
+#     statuses    U[s]    dictionary; status int8[n] indexes it
+#     day int32[n] (days since 1970-01-01), quantity f8[n], revenue f8[n]
+#
+# A refresh streams the orders updated since the watermark into a new part.
+# An order in a later part replaces all its lines from earlier parts, so a
+# status change simply re-emits the order. Parts are merged once there are
+# more than MAX_PARTS. Archived orders keep their last facts; orders deleted
+# while pending linger until a --full refresh, which only sees the live
+# tables and so also forgets archived orders.
+MANIFEST = "manifest.json"
+REFRESH_LOCK = "refresh.lock"
+MAX_PARTS = 16
+# Rows fetched per server-side cursor round trip
+STREAM_BATCH_SIZE = 20000
+# Re-read this much before the watermark: updated_at is stamped before
+# commit, so a slow transaction can land behind a faster one
+WATERMARK_OVERLAP = timedelta(minutes=5)
+# Statuses left out of revenue figures unless asked for
+EXCLUDED_STATUSES = ("cancelled",)
+
+FACT_QUERY = (
+    select(
+        Order.id, Order.user_id, Order.status, Order.created_at, Order.updated_at,
+        OrderItem.book_id, OrderItem.book_title, OrderItem.quantity, OrderItem.subtotal,
+    )
+    .join(OrderItem, (OrderItem.order_id == Order.id) & (OrderItem.order_created_at == Order.created_at))
+)
+
+
+def _keys(uuids):
+    return np.array([u.bytes for u in uuids], dtype="S16")
+
+
+def _to_uuid(key: bytes) -> str:
+    return str(UUID(bytes=key.ljust(16, b"\0")))
+
+
+def _dictionary(values):
+    """(unique values, int32 codes) for a column."""
+    unique, codes = np.unique(values, return_inverse=True)
+    return unique, codes.astype(np.int32)
+
+
+# ------------------------------------------------------------
+# Extract: Postgres -> part file
+# ------------------------------------------------------------
+def _chunk_columns(rows):
+    return {
+        "order": _keys(r.id for r in rows),
+        "user": _keys(r.user_id for r in rows),
+        "book": _keys(r.book_id for r in rows),
+        "title": np.array([r.book_title for r in rows], dtype=object),
+        "status": np.array([r.status or "" for r in rows], dtype=object),
+        "day": np.array([r.created_at for r in rows], dtype="datetime64[D]").astype(np.int32),
+        "quantity": np.array([r.quantity for r in rows], dtype=np.float64),
+        "revenue": np.array([r.subtotal for r in rows], dtype=np.float64),
+    }
+
+
+def _part_arrays(columns):
+    user_ids, user = _dictionary(columns["user"])
+    book_ids, first, book = np.unique(columns["book"], return_index=True, return_inverse=True)
+    statuses, status = _dictionary(columns["status"].astype(str))
+    return {
+        "order_ids": columns["order"],
+        "user_ids": user_ids, "user": user,
+        "book_ids": book_ids, "book": book.astype(np.int32),
+        "book_titles": columns["title"][first].astype(str),
+        "statuses": statuses, "status": status.astype(np.int8),
+        "day": columns["day"],
+        "quantity": columns["quantity"],
+        "revenue": columns["revenue"],
+    }
+
+
+def _write_part(base: str, seq: int, arrays) -> str:
+    name = f"part-{seq:06d}.npz"
+    tmp_path = os.path.join(base, f"{name}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(base, name))
+    return name
+
+
+def _read_manifest(base: str):
+    try:
+        with open(os.path.join(base, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(base: str, manifest):
+    tmp_path = os.path.join(base, f"{MANIFEST}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(base, MANIFEST))
+
+
+async def _extract(since):
+    """Stream order lines updated after `since` (all when None) into columns."""
+    engine = create_async_engine(ANALYTICS_DATABASE_URL, poolclass=NullPool)
+    chunks, watermark = [], None
+    try:
+        async with engine.connect() as conn:
+            query = FACT_QUERY
+            if since is not None:
+                query = query.where(Order.updated_at > since)
+            result = await conn.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+            async for rows in result.partitions():
+                chunks.append(_chunk_columns(rows))
+                newest = max(r.updated_at for r in rows if r.updated_at is not None)
+                watermark = newest if watermark is None else max(watermark, newest)
+    finally:
+        await engine.dispose()
+    if not chunks:
+        return {}, watermark
+    return {name: np.concatenate([c[name] for c in chunks]) for name in chunks[0]}, watermark
+
+
+async def refresh(base: str, full: bool = False):
+    """
+    Bring the analytics files up to date: everything updated since the
+    watermark, or the whole history with full. Returns a summary, or None
+    when another refresh holds the job.
+    """
+    os.makedirs(base, exist_ok=True)
+    # One lock from reading the manifest to swapping it, so overlapping runs
+    # can neither reuse a part number nor overwrite each other's manifest
+    with open(os.path.join(base, REFRESH_LOCK), "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        return await _refresh(base, full)
+
+
+async def _refresh(base: str, full: bool):
+    manifest = None if full else _read_manifest(base)
+    previous = _read_manifest(base) or {"parts": [], "version": 0, "next_part": 0}
+
+    since = None
+    if manifest and manifest.get("watermark"):
+        since = datetime.fromisoformat(manifest["watermark"]) - WATERMARK_OVERLAP
+
+    started = time.perf_counter()
+    columns, watermark = await _extract(since)
+
+    parts = [] if full else list(previous["parts"])
+    seq = previous.get("next_part", 0)
+    if columns:
+        parts.append(_write_part(base, seq, _part_arrays(columns)))
+        seq += 1
+
+    if len(parts) > MAX_PARTS:
+        merged = _merge(base, parts)
+        parts = [_write_part(base, seq, merged)]
+        seq += 1
+
+    old_watermark = previous.get("watermark") if not full else None
+    new_watermark = max(filter(None, [watermark and watermark.isoformat(), old_watermark]), default=None)
+    _write_manifest(base, {
+        "version": previous.get("version", 0) + 1,
+        "watermark": new_watermark,
+        "refreshed_at": datetime.utcnow().isoformat(),
+        "parts": parts,
+        "next_part": seq,
+    })
+
+    # Readers that opened the old manifest retry on the new one
+    for name in set(previous["parts"]) - set(parts):
+        try:
+            os.remove(os.path.join(base, name))
+        except FileNotFoundError:
+            pass
+
+    return {
+        "full": full,
+        "rows_read": int(len(columns["order"])) if columns else 0,
+        "parts": len(parts),
+        "watermark": new_watermark,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+# ------------------------------------------------------------
+# Load: part files -> one deduplicated fact table
+# ------------------------------------------------------------
+def _load_columns(base: str, parts):
+    """Per-row columns across parts, keeping each order's newest lines only."""
+    loaded = []
+    for i, name in enumerate(parts):
+        with np.load(os.path.join(base, name)) as part:
+            loaded.append({
+                "order": part["order_ids"],
+                "user": part["user_ids"][part["user"]],
+                "book": part["book_ids"][part["book"]],
+                "title": part["book_titles"][part["book"]],
+                "status": part["statuses"][part["status"]],
+                "day": part["day"],
+                "quantity": part["quantity"],
+                "revenue": part["revenue"],
+                "part": np.full(len(part["order_ids"]), i, dtype=np.int32),
+            })
+    if not loaded:
+        return None
+    columns = {name: np.concatenate([p[name] for p in loaded]) for name in loaded[0]}
+
+    _, order_codes = np.unique(columns["order"], return_inverse=True)
+    newest = np.zeros(order_codes.max() + 1 if len(order_codes) else 0, dtype=np.int32)
+    np.maximum.at(newest, order_codes, columns["part"])
+    keep = columns["part"] == newest[order_codes]
+    return {name: values[keep] for name, values in columns.items() if name != "part"}
+
+
+def _merge(base: str, parts):
+    return _part_arrays(_load_columns(base, parts))
+
+
+class SalesFacts:
+    """The loaded fact table, with dictionary-encoded columns for grouping."""
+
+    def __init__(self, columns, manifest):
+        self.manifest = manifest
+        self.order_ids, self.order = np.unique(columns["order"], return_inverse=True)
+        self.user_ids, self.user = np.unique(columns["user"], return_inverse=True)
+        self.book_ids, first, self.book = np.unique(columns["book"], return_index=True, return_inverse=True)
+        # Titles as of each book's first line; they only change by renames
+        self.book_titles = columns["title"][first]
+        self.statuses, self.status = np.unique(columns["status"], return_inverse=True)
+        self.day = columns["day"]
+        self.quantity = columns["quantity"]
+        self.revenue = columns["revenue"]
+
+    def _mask(self, start: date, end: date, statuses):
+        mask = np.ones(len(self.day), dtype=bool)
+        if start is not None:
+            mask &= self.day >= np.datetime64(start, "D").astype(np.int32)
+        if end is not None:
+            mask &= self.day <= np.datetime64(end, "D").astype(np.int32)
+        if statuses is not None:
+            mask &= np.isin(self.statuses[self.status], list(statuses))
+        return mask
+
+    def _orders_per(self, group, mask, size):
+        """Distinct orders per group value (each order has one day/user/status)."""
+        _, first = np.unique(self.order[mask], return_index=True)
+        return np.bincount(group[mask][first], minlength=size)
+
+    def _top(self, values, n):
+        n = min(n, int(np.count_nonzero(values)))
+        if n == 0:
+            return np.array([], dtype=np.int64)
+        top = np.argpartition(-values, n - 1)[:n]
+        return top[np.argsort(-values[top], kind="stable")]
+
+    def report(self, start: date = None, end: date = None, top: int = 20, statuses=None):
+        if statuses is None:
+            statuses = [s for s in self.statuses.tolist() if s not in EXCLUDED_STATUSES]
+        dated = self._mask(start, end, None)
+        mask = self._mask(start, end, statuses)
+
+        # By status covers every status in the date range
+        n_status = len(self.statuses)
+        status_revenue = np.bincount(self.status[dated], self.revenue[dated], minlength=n_status)
+        status_units = np.bincount(self.status[dated], self.quantity[dated], minlength=n_status)
+        status_orders = self._orders_per(self.status, dated, n_status)
+
+        days = self.day[mask]
+        by_day = []
+        if len(days):
+            first_day = int(days.min())
+            offsets = days - first_day
+            day_revenue = np.bincount(offsets, self.revenue[mask])
+            day_units = np.bincount(offsets, self.quantity[mask])
+            day_orders = self._orders_per(self.day - first_day, mask, len(day_revenue))
+            for i in np.flatnonzero(day_units):
+                by_day.append({
+                    "day": str(np.datetime64(first_day + int(i), "D")),
+                    "orders": int(day_orders[i]),
+                    "units": float(day_units[i]),
+                    "revenue": round(float(day_revenue[i]), 2),
+                })
+
+        n_books, n_users = len(self.book_ids), len(self.user_ids)
+        book_revenue = np.bincount(self.book[mask], self.revenue[mask], minlength=n_books)
+        book_units = np.bincount(self.book[mask], self.quantity[mask], minlength=n_books)
+        user_revenue = np.bincount(self.user[mask], self.revenue[mask], minlength=n_users)
+        user_orders = self._orders_per(self.user, mask, n_users)
+
+        return {
+            "source": {
+                "watermark": self.manifest.get("watermark"),
+                "refreshed_at": self.manifest.get("refreshed_at"),
+            },
+            "start": start.isoformat() if start else None,
+            "end": end.isoformat() if end else None,
+            "statuses": statuses,
+            "totals": {
+                "orders": int(len(np.unique(self.order[mask]))),
+                "units": float(self.quantity[mask].sum()),
+                "revenue": round(float(self.revenue[mask].sum()), 2),
+            },
+            "by_status": [
+                {
+                    "status": str(self.statuses[i]),
+                    "orders": int(status_orders[i]),
+                    "units": float(status_units[i]),
+                    "revenue": round(float(status_revenue[i]), 2),
+                }
+                for i in np.flatnonzero(status_orders)
+            ],
+            "by_day": by_day,
+            "top_books": [
+                {
+                    "book_id": _to_uuid(self.book_ids[i]),
+                    "book_title": str(self.book_titles[i]),
+                    "units": float(book_units[i]),
+                    "revenue": round(float(book_revenue[i]), 2),
+                }
+                for i in self._top(book_revenue, top)
+            ],
+            "top_customers": [
+                {
+                    "user_id": _to_uuid(self.user_ids[i]),
+                    "orders": int(user_orders[i]),
+                    "revenue": round(float(user_revenue[i]), 2),
+                }
+                for i in self._top(user_revenue, top)
+            ],
+        }
+
+
+class SalesDataset:
+    """Serves reports from the newest refreshed files, reloading on change."""
+
+    def __init__(self, base: str):
+        self.base = base
+        self.version = None
+        self.facts = None
+
+    def reload(self):
+        """Load the files if a refresh replaced them. Returns True on switch."""
+        for _ in range(3):
+            manifest = _read_manifest(self.base)
+            if manifest is None or manifest["version"] == self.version:
+                return False
+            try:
+                columns = _load_columns(self.base, manifest["parts"])
+            except FileNotFoundError:
+                continue  # a merge removed a part meanwhile; read the new manifest
+            self.facts = SalesFacts(columns, manifest) if columns is not None else None
+            self.version = manifest["version"]
+            return True
+        return False
+
+
+dataset = SalesDataset(ANALYTICS_DIR)
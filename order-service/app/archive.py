@@ -0,0 +1,199 @@
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app import crud
+from app.config import ORDER_ARCHIVE_DIR
+from app.models import ArchivedOrder, Order, OrderItem
+
+# ------------------------------------------------------------
+# File layout
+# ------------------------------------------------------------
+# {ORDER_ARCHIVE_DIR}/YYYY/MM/orders-{archived at}.ndjson.gz holds one
+# serialized order per line, as get_order returns it. Every BLOCK_ORDERS
+# lines form their own gzip member: the concatenation is still one valid
+# .ndjson.gz for zcat and friends, and a single order is read back by
+# decompressing just its member (offset and length in archived_orders).
+BLOCK_ORDERS = 64
+
+# Any constant works; it only has to be unique among this app's advisory locks
+ARCHIVE_LOCK_ID = 41_002
+
+
+def _write_file(path: str, records):
+    """Write the records in gzip blocks; returns [(order id, offset, length)]."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    locations = []
+    with open(tmp_path, "wb") as f:
+        for start in range(0, len(records), BLOCK_ORDERS):
+            block = records[start:start + BLOCK_ORDERS]
+            payload = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in block)
+            member = gzip.compress(payload.encode(), compresslevel=6)
+            offset = f.tell()
+            f.write(member)
+            locations += [(r["id"], offset, len(member)) for r in block]
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return locations
+
+
+def _read_record(path: str, offset: int, length: int, order_id: str):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        block = gzip.decompress(f.read(length))
+    for line in block.splitlines():
+        record = json.loads(line)
+        if record["id"] == order_id:
+            return record
+    return None
+
+
+# ------------------------------------------------------------
+# Archival job
+# ------------------------------------------------------------
+async def archive_batch(db: AsyncSession, cutoff: datetime, statuses, batch_size: int):
+    """
+    Move up to batch_size finished orders created before cutoff to a new
+    archive file and delete them from the hot tables. The file is durable
+    before the transaction that deletes the rows commits. It is removed
+    again only when the batch fails before the commit; a failed commit may
+    have gone through on the server, so the file stays and sweep_orphans
+    deletes it later if no row points at it. Returns the number of orders
+    moved, or None when another worker holds the job.
+    """
+    locked = await db.execute(text(f"SELECT pg_try_advisory_xact_lock({ARCHIVE_LOCK_ID})"))
+    if not locked.scalar():
+        await db.rollback()
+        return None
+
+    result = await db.execute(
+        select(Order)
+        .options(selectinload(Order.items))
+        .where(Order.created_at < cutoff, Order.status.in_(statuses))
+        .order_by(Order.created_at)
+        .limit(batch_size)
+        .with_for_update(of=Order, skip_locked=True)
+    )
+    orders = result.scalars().all()
+    if not orders:
+        await db.rollback()
+        return 0
+
+    now = datetime.utcnow()
+    relative = os.path.join(f"{now:%Y}", f"{now:%m}", f"orders-{now:%Y%m%dT%H%M%S%f}.ndjson.gz")
+    path = os.path.join(ORDER_ARCHIVE_DIR, relative)
+    locations = await asyncio.to_thread(_write_file, path, [crud.serialize_order(o) for o in orders])
+
+    by_id = {str(o.id): o for o in orders}
+    try:
+        await db.execute(insert(ArchivedOrder), [
+            {
+                "id": by_id[order_id].id,
+                "user_id": by_id[order_id].user_id,
+                "status": by_id[order_id].status,
+                "total_amount": by_id[order_id].total_amount or 0,
+                "books_purchased": sum(item.quantity for item in by_id[order_id].items),
+                "created_at": by_id[order_id].created_at,
+                "archived_at": now,
+                "file": relative,
+                "block_offset": offset,
+                "block_length": length,
+            }
+            for order_id, offset, length in locations
+        ])
+        # created_at bounds let the planner prune to the old partitions
+        ids = [o.id for o in orders]
+        await db.execute(
+            delete(OrderItem)
+            .where(OrderItem.order_id.in_(ids), OrderItem.order_created_at < cutoff)
+            .execution_options(synchronize_session=False)
+        )
+        await db.execute(
+            delete(Order)
+            .where(Order.id.in_(ids), Order.created_at < cutoff)
+            .execution_options(synchronize_session=False)
+        )
+    except Exception:
+        # Nothing is committed, so no archived_orders row points at the file
+        await db.rollback()
+        os.remove(path)
+        raise
+    await db.commit()
+    return len(orders)
+
+
+def _archive_files():
+    """Archive files (and leftover .tmp files), relative to ORDER_ARCHIVE_DIR."""
+    found = []
+    for root, _, names in os.walk(ORDER_ARCHIVE_DIR):
+        for name in names:
+            if name.endswith((".ndjson.gz", ".ndjson.gz.tmp")):
+                found.append(os.path.relpath(os.path.join(root, name), ORDER_ARCHIVE_DIR))
+    return found
+
+
+async def sweep_orphans(db: AsyncSession):
+    """
+    Delete archive files no archived_orders row points at, as left by a
+    batch whose commit failed. Holds the archival lock so no batch is
+    writing meanwhile. Returns the number of files removed, or None when
+    another worker holds the job.
+    """
+    locked = await db.execute(text(f"SELECT pg_try_advisory_xact_lock({ARCHIVE_LOCK_ID})"))
+    if not locked.scalar():
+        await db.rollback()
+        return None
+
+    referenced = set((await db.execute(select(ArchivedOrder.file).distinct())).scalars())
+    orphans = [f for f in await asyncio.to_thread(_archive_files) if f not in referenced]
+    for relative in orphans:
+        os.remove(os.path.join(ORDER_ARCHIVE_DIR, relative))
+    await db.commit()
+    return len(orphans)
+
+
+async def archive_orders(db: AsyncSession, older_than_days: int, statuses, batch_size: int):
+    """Archive batches until none is left; returns the total moved."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved = 0
+    while True:
+        count = await archive_batch(db, cutoff, statuses, batch_size)
+        if count is None:
+            print("Order archival already running elsewhere; skipped")
+            return moved
+        moved += count
+        if count < batch_size:
+            return moved
+
+
+# ------------------------------------------------------------
+# Reads
+# ------------------------------------------------------------
+async def find_order(db: AsyncSession, order_id, user_id):
+    """The archived order as get_order serializes it, or None."""
+    result = await db.execute(
+        select(ArchivedOrder).where(ArchivedOrder.id == order_id, ArchivedOrder.user_id == user_id)
+    )
+    entry = result.scalar_one_or_none()
+    if entry is None:
+        return None
+    return await asyncio.to_thread(
+        _read_record, os.path.join(ORDER_ARCHIVE_DIR, entry.file),
+        entry.block_offset, entry.block_length, str(order_id),
+    )
+
+
+async def count_orders(db: AsyncSession, user_id, status=None) -> int:
+    """How many of the user's orders (with this status) have been archived."""
+    query = select(func.count()).select_from(ArchivedOrder).where(ArchivedOrder.user_id == user_id)
+    if status:
+        query = query.where(ArchivedOrder.status == status)
+    return (await db.execute(query)).scalar_one()
@@ -0,0 +1,108 @@
+import time
+from collections import Counter
+
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+
+from app.config import BESTSELLER_MERGE_TTL
+from app.redis_client import redis_client
+
+# ------------------------------------------------------------
+# Key layout
+# ------------------------------------------------------------
+# orders:best:{res}:{category}:{bucket} -> ZSET book_id -> units sold in
+#                                          the bucket starting at epoch
+#                                          second {bucket}; "*" = all books
+# orders:best:merged:{window}:{category}:{bucket}
+#                                       -> ZSET, the window's buckets summed;
+#                                          rebuilt at most every
+#                                          BESTSELLER_MERGE_TTL seconds
+# orders:best:titles                    -> HASH book_id -> title
+#
+# Each window is a fixed number of buckets at its own resolution, so a
+# sale costs one ZINCRBY per window and a read merges a constant number of
+# buckets, or none while the merged set is fresh. Every bucket expires on
+# its own once it can no longer fall inside its window. Windows slide one
+# bucket at a time: "hour" covers the current 5-minute bucket and the 11
+# before it, i.e. between 55 and 60 minutes.
+ALL = "*"
+TITLES_KEY = "orders:best:titles"
+
+# window -> (bucket seconds, buckets per window)
+WINDOWS = {
+    "hour": (300, 12),
+    "day": (3600, 24),
+    "week": (86400, 7),
+}
+
+
+def bucket_key(window: str, category: str, bucket: int) -> str:
+    return f"orders:best:{WINDOWS[window][0]}:{category}:{bucket}"
+
+
+def _bucket(now: float, seconds: int) -> int:
+    return int(now // seconds) * seconds
+
+
+async def record_sale(order, quotes: dict):
+    """
+    Count an order's lines into every window, overall and per category
+    (taken from the pricing quotes, as order lines don't store it).
+    """
+    units = Counter()
+    titles = {}
+    for item in order.items:
+        book_id = str(item.book_id)
+        category = quotes[item.book_id].category
+        units[(ALL, book_id)] += item.quantity
+        if category:
+            units[(category, book_id)] += item.quantity
+        titles[book_id] = item.book_title
+
+    now = time.time()
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for window, (seconds, count) in WINDOWS.items():
+                bucket = _bucket(now, seconds)
+                keys = set()
+                for (category, book_id), quantity in units.items():
+                    key = bucket_key(window, category, bucket)
+                    pipe.zincrby(key, quantity, book_id)
+                    keys.add(key)
+                for key in keys:
+                    # Outlives the last window it can belong to
+                    pipe.expireat(key, bucket + seconds * (count + 1))
+            pipe.hset(TITLES_KEY, mapping=titles)
+            await pipe.execute()
+    except RedisError as e:
+        # Leaderboards are best effort; the order itself is already stored
+        print(f"Best-seller update skipped: {e}")
+
+
+async def top(window: str, category: str = None, limit: int = 10):
+    """[{book_id, book_title, units}] best first for the window."""
+    seconds, count = WINDOWS[window]
+    category = category or ALL
+    now = time.time()
+    current = _bucket(now, seconds)
+    merged = f"orders:best:merged:{window}:{category}:{current}"
+    try:
+        if not await redis_client.exists(merged):
+            buckets = [bucket_key(window, category, current - i * seconds) for i in range(count)]
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.zunionstore(merged, buckets)
+                pipe.expire(merged, BESTSELLER_MERGE_TTL)
+                await pipe.execute()
+        rows = await redis_client.zrevrange(merged, 0, limit - 1, withscores=True)
+        titles = await redis_client.hmget(TITLES_KEY, [book_id for book_id, _ in rows]) if rows else []
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Best sellers are temporarily unavailable")
+
+    return {
+        "window": window,
+        "category": None if category == ALL else category,
+        "items": [
+            {"book_id": book_id, "book_title": title, "units": units}
+            for (book_id, units), title in zip(rows, titles)
+        ],
+    }
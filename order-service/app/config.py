@@ -25,4 +25,51 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = 0
 
 # GCP Pub/Sub
-GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID", "bookhub-service-project")
\ No newline at end of file
+GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID", "bookhub-service-project")
+
+# Books service (prices and titles for order lines)
+BOOKS_SERVICE_URL = os.getenv("BOOKS_SERVICE_URL", "http://localhost:8002")
+BOOKS_SERVICE_TIMEOUT = float(os.getenv("BOOKS_SERVICE_TIMEOUT", 2.0))
+# Seconds a fetched price may be reused; cached prices are re-checked at commit
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", 30))
+
+# Group-commit ingestion for order creation (off by default)
+ORDER_BATCHING_ENABLED = os.getenv("ORDER_BATCHING_ENABLED", "false").lower() == "true"
+ORDER_BATCH_MAX_SIZE = int(os.getenv("ORDER_BATCH_MAX_SIZE", 100))
+ORDER_BATCH_MAX_WAIT_MS = float(os.getenv("ORDER_BATCH_MAX_WAIT_MS", 5))
+
+# Idempotency-Key handling for order writes
+# Seconds a finished response is kept for replay
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 86400))
+# How long an in-flight marker survives a worker that died mid-request
+IDEMPOTENCY_LOCK_TTL_MS = int(os.getenv("IDEMPOTENCY_LOCK_TTL_MS", 30000))
+# How long a duplicate waits for the original before giving up with a 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 10))
+
+# Monthly partitions of orders/order_items: how many future months to keep
+# created, and how often (seconds) the service checks
+ORDER_PARTITION_MONTHS_AHEAD = int(os.getenv("ORDER_PARTITION_MONTHS_AHEAD", 3))
+ORDER_PARTITION_CHECK_INTERVAL = int(os.getenv("ORDER_PARTITION_CHECK_INTERVAL", 86400))
+
+# Cold archival of finished orders (archive_orders.py)
+ORDER_ARCHIVE_DIR = os.getenv("ORDER_ARCHIVE_DIR", "./order_archive")
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", 365))
+ORDER_ARCHIVE_STATUSES = os.getenv("ORDER_ARCHIVE_STATUSES", "delivered,cancelled").split(",")
+ORDER_ARCHIVE_BATCH_SIZE = int(os.getenv("ORDER_ARCHIVE_BATCH_SIZE", 5000))
+
+# Sales analytics files (build_analytics.py); point ANALYTICS_DATABASE_URL
+# at a replica to keep the extract off the primary
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "data/analytics")
+ANALYTICS_DATABASE_URL = os.getenv("ANALYTICS_DATABASE_URL", DATABASE_URL)
+
+# Seconds a merged best-seller window is reused before being re-merged
+BESTSELLER_MERGE_TTL = int(os.getenv("BESTSELLER_MERGE_TTL", 10))
+
+# "Also bought" index (build_also_bought.py)
+ALSO_BOUGHT_TOP_K = int(os.getenv("ALSO_BOUGHT_TOP_K", 20))
+# Distinct books counted per order; bigger baskets are truncated
+ALSO_BOUGHT_MAX_BASKET = int(os.getenv("ALSO_BOUGHT_MAX_BASKET", 30))
+# Pair counts held in memory before they are flushed to Postgres
+ALSO_BOUGHT_MAX_PAIRS = int(os.getenv("ALSO_BOUGHT_MAX_PAIRS", 500000))
+# Orders younger than this are left for the next run (still committing)
+ALSO_BOUGHT_SETTLE_SECONDS = int(os.getenv("ALSO_BOUGHT_SETTLE_SECONDS", 300))
@@ -1,11 +1,16 @@
+import asyncio
+
 from fastapi import HTTPException
-from sqlalchemy import select, func
+from sqlalchemy import select, desc, literal, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from uuid import UUID, uuid4
 from datetime import datetime
 
-from app.models import Order, OrderItem
+from app import archive, bestsellers, ingest, order_stats, pricing
+from app.models import Order, OrderItem, UserOrderStats
+from app.pagination import decode_cursor, encode_cursor
+from app.transitions import check_transition
 from app.schemas import OrderCreate
 
 
@@ -34,6 +39,20 @@ def serialize_order(order: Order):
     }
 
 
+# ------------------------------------------------------------
+# Helper: price every line from books-service quotes
+# ------------------------------------------------------------
+def apply_quotes(order: Order, quotes: dict):
+    total_amount = 0
+    for item in order.items:
+        quote = quotes[item.book_id]
+        item.book_title = quote.title
+        item.price_at_purchase = quote.price
+        item.subtotal = round(quote.price * item.quantity, 2)
+        total_amount += item.subtotal
+    order.total_amount = round(total_amount, 2)
+
+
 # ------------------------------------------------------------
 # CREATE ORDER
 # ------------------------------------------------------------
@@ -44,82 +63,123 @@ async def create_order(db: AsyncSession, user_id: str, order_data: OrderCreate):
         raise HTTPException(status_code=400, detail="Invalid user_id format")
 
     items = []
-    total_amount = 0
-
     for item in order_data.items:
         try:
             book_uuid = UUID(str(item.book_id))
         except:
             raise HTTPException(status_code=400, detail=f"Invalid book_id: {item.book_id}")
 
-        # Dummy price (replace with call to books-service if needed)
-        price = 42.99
-        subtotal = price * item.quantity
-        total_amount += subtotal
-
-        items.append(
-            OrderItem(
-                id=uuid4(),
-                book_id=book_uuid,
-                book_title="Demo Book",
-                quantity=item.quantity,
-                price_at_purchase=price,
-                subtotal=subtotal,
-            )
-        )
+        items.append(OrderItem(id=uuid4(), book_id=book_uuid, quantity=item.quantity))
+
+    # All titles and prices in one batched call (or straight from the cache)
+    quotes, cached = await pricing.quote([item.book_id for item in items])
 
+    # Every column is set here, so the in-memory order is what gets stored
+    now = datetime.utcnow()
     order = Order(
         id=uuid4(),
         user_id=user_uuid,
         status="pending",
-        total_amount=total_amount,
+        created_at=now,
+        updated_at=now,
         items=items,
     )
+    apply_quotes(order, quotes)
+
+    if ingest.batcher.running:
+        changed = await pricing.verify(quotes, cached)
+        if changed:
+            quotes = {**quotes, **changed}
+            apply_quotes(order, quotes)
+        try:
+            submitted = await ingest.batcher.submit(order)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if submitted:
+            await bestsellers.record_sale(order, quotes)
+            return serialize_order(order)
+        # The batcher stopped meanwhile (shutdown): prices are verified, so
+        # store the order through the session instead
+        cached = None
 
     db.add(order)
     try:
+        # Cached prices are re-checked while the insert is in flight
+        _, changed = await asyncio.gather(db.flush(), pricing.verify(quotes, cached))
+        if changed:
+            quotes = {**quotes, **changed}
+            apply_quotes(order, quotes)
+        await order_stats.order_created(db, order)
         await db.commit()
-        await db.refresh(order)
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-
-    # Ensure items are eager-loaded
-    result = await db.execute(
-        select(Order).options(selectinload(Order.items)).where(Order.id == order.id)
-    )
-    order = result.scalar_one()
+    await bestsellers.record_sale(order, quotes)
     return serialize_order(order)
 
 
 # ------------------------------------------------------------
 # LIST ORDERS (pagination)
 # ------------------------------------------------------------
-async def get_orders(db: AsyncSession, user_id: str, status: str = None, page: int = 1, limit: int = 20):
+def serialize_order_summary(order: Order):
+    return {
+        "id": str(order.id),
+        "user_id": str(order.user_id),
+        "status": order.status,
+        "total_amount": float(order.total_amount),
+        "created_at": order.created_at.isoformat(),
+        "updated_at": order.updated_at.isoformat(),
+    }
+
+
+def _history_query(user_uuid: UUID, status: str, view: str):
+    """A user's orders newest first, matching the ix_orders_user_* indexes."""
+    query = select(Order).where(Order.user_id == user_uuid)
+    if status:
+        query = query.where(Order.status == status)
+    # Summary pages skip the items query altogether
+    if view == "full":
+        query = query.options(selectinload(Order.items))
+    return query.order_by(desc(Order.created_at), desc(Order.id))
+
+
+def _serialize_page(orders, view: str):
+    serialize = serialize_order if view == "full" else serialize_order_summary
+    return [serialize(o) for o in orders]
+
+
+async def _count_orders(db: AsyncSession, user_uuid: UUID, status: str):
+    # Read from the per-user rollup instead of counting the history. The
+    # rollup still counts archived orders, which listings no longer return
+    stats = await db.get(UserOrderStats, user_uuid)
+    if stats is None:
+        return 0
+    if status:
+        total = stats.status_counts.get(status, 0)
+    else:
+        total = stats.total_orders
+    return max(total - await archive.count_orders(db, user_uuid, status), 0)
+
+
+async def get_orders(
+    db: AsyncSession, user_id: str, status: str = None, page: int = 1, limit: int = 20,
+    view: str = "full"
+):
     try:
         user_uuid = UUID(user_id)
     except:
         raise HTTPException(status_code=400, detail="Invalid user_id")
 
-    base_query = select(Order).where(Order.user_id == user_uuid)
-
-    if status:
-        base_query = base_query.where(Order.status == status)
-
-    # Count total
-    total_query = select(func.count()).select_from(base_query.subquery())
-    total = (await db.execute(total_query)).scalar() or 0
+    total = await _count_orders(db, user_uuid, status)
 
     # Pagination
     offset = (page - 1) * limit
 
-    result = await db.execute(
-        base_query.options(selectinload(Order.items)).offset(offset).limit(limit)
-    )
-    orders = result.scalars().unique().all()
+    result = await db.execute(_history_query(user_uuid, status, view).offset(offset).limit(limit))
+    orders = result.scalars().all()
 
     return {
-        "items": [serialize_order(o) for o in orders],
+        "items": _serialize_page(orders, view),
         "total": total,
         "page": page,
         "limit": limit,
@@ -127,6 +187,46 @@ async def get_orders(db: AsyncSession, user_id: str, status: str = None, page: i
     }
 
 
+# ------------------------------------------------------------
+# LIST ORDERS (keyset / cursor pagination)
+# ------------------------------------------------------------
+async def get_orders_keyset(
+    db: AsyncSession, user_id: str, status: str = None, cursor: str = None, limit: int = 20,
+    view: str = "full", include_total: bool = False
+):
+    try:
+        user_uuid = UUID(user_id)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid user_id")
+
+    query = _history_query(user_uuid, status, view)
+    if cursor:
+        last_created_at, last_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(Order.created_at, Order.id)
+            < tuple_(literal(last_created_at, Order.created_at.type), literal(last_id, Order.id.type))
+        )
+
+    # Fetch one extra row to learn whether another page exists
+    result = await db.execute(query.limit(limit + 1))
+    orders = result.scalars().all()
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(orders[-1].created_at, orders[-1].id)
+
+    response = {
+        "items": _serialize_page(orders, view),
+        "limit": limit,
+        "next_cursor": next_cursor,
+    }
+    if include_total:
+        response["total"] = await _count_orders(db, user_uuid, status)
+    return response
+
+
 # ------------------------------------------------------------
 # GET ORDER BY ID
 # ------------------------------------------------------------
@@ -143,10 +243,14 @@ async def get_order(db: AsyncSession, user_id: str, order_id: str):
         .where(Order.id == order_uuid, Order.user_id == user_uuid)
     )
     order = result.scalar_one_or_none()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+    if order:
+        return serialize_order(order)
 
-    return serialize_order(order)
+    # Finished orders past ORDER_ARCHIVE_AFTER_DAYS live in the cold files
+    archived = await archive.find_order(db, order_uuid, user_uuid)
+    if archived is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return archived
 
 
 # ------------------------------------------------------------
@@ -158,23 +262,27 @@ async def update_order_status(db: AsyncSession, order_id: str, new_status: str):
     except:
         raise HTTPException(status_code=400, detail="Invalid order_id")
 
-    result = await db.execute(select(Order).where(Order.id == order_uuid))
+    # Locked until commit, so the transition is checked against the status
+    # it is applied to, not one a concurrent update has since replaced
+    result = await db.execute(
+        select(Order)
+        .options(selectinload(Order.items))
+        .where(Order.id == order_uuid)
+        .with_for_update(of=Order)
+    )
     order = result.scalar_one_or_none()
 
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
+    check_transition(order.status, new_status)
 
+    old_status = order.status
     order.status = new_status
     order.updated_at = datetime.utcnow()
+    await order_stats.status_changed(db, order, old_status)
 
+    # Sessions don't expire on commit, so the loaded order serializes as-is
     await db.commit()
-    await db.refresh(order)
-
-    # Re-fetch for items
-    result = await db.execute(
-        select(Order).options(selectinload(Order.items)).where(Order.id == order.id)
-    )
-    order = result.scalar_one()
     return serialize_order(order)
 
 
@@ -187,7 +295,14 @@ async def delete_order(db: AsyncSession, order_id: str):
     except:
         raise HTTPException(status_code=400, detail="Invalid order_id")
 
-    result = await db.execute(select(Order).where(Order.id == order_uuid))
+    # Locked so the status checked here, and the one the rollup is told
+    # about, is still current when the row goes
+    result = await db.execute(
+        select(Order)
+        .options(selectinload(Order.items))
+        .where(Order.id == order_uuid)
+        .with_for_update(of=Order)
+    )
     order = result.scalar_one_or_none()
 
     if not order:
@@ -200,6 +315,7 @@ async def delete_order(db: AsyncSession, order_id: str):
         )
 
     await db.delete(order)
+    await order_stats.order_deleted(db, order)
     await db.commit()
     return serialize_order(order)
 
@@ -213,32 +329,6 @@ async def get_order_stats(db: AsyncSession, user_id: str):
     except:
         raise HTTPException(status_code=400, detail="Invalid user_id")
 
-    # Total orders & total spent
-    result = await db.execute(
-        select(func.count(Order.id), func.coalesce(func.sum(Order.total_amount), 0))
-        .where(Order.user_id == user_uuid)
-    )
-    total_orders, total_spent = result.first()
-
-    # Orders grouped by status
-    group_res = await db.execute(
-        select(Order.status, func.count(Order.id))
-        .where(Order.user_id == user_uuid)
-        .group_by(Order.status)
-    )
-    orders_by_status = {row[0]: row[1] for row in group_res.fetchall()}
-
-    # Total books purchased
-    books_res = await db.execute(
-        select(func.coalesce(func.sum(OrderItem.quantity), 0))
-        .join(Order)
-        .where(Order.user_id == user_uuid)
-    )
-    total_books = books_res.scalar() or 0
-
-    return {
-        "total_orders": total_orders,
-        "total_spent": float(total_spent),
-        "orders_by_status": orders_by_status,
-        "total_books_purchased": total_books,
-    }
+    # One primary-key read of the rollup kept by app.order_stats
+    stats = await db.get(UserOrderStats, user_uuid)
+    return order_stats.serialize_stats(stats)
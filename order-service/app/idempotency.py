@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import json
+import uuid
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from redis.exceptions import RedisError
+
+from app.config import IDEMPOTENCY_TTL, IDEMPOTENCY_LOCK_TTL_MS, IDEMPOTENCY_WAIT_SECONDS
+from app.redis_client import redis_client
+
+# ------------------------------------------------------------
+# Key layout
+# ------------------------------------------------------------
+# orders:idem:{user_id}:{scope}:{key} -> {"state": "pending", "token": ...}
+#                                        while the first request runs (expires
+#                                        after IDEMPOTENCY_LOCK_TTL_MS so a
+#                                        crashed worker frees the key), then
+#                                        {"state": "done", "status": ...,
+#                                        "body": ...} for IDEMPOTENCY_TTL
+#
+# Both states carry the request fingerprint: reusing a key with another
+# body is a client bug and gets a 422 instead of someone else's response.
+MAX_KEY_LENGTH = 255
+POLL_SECONDS = 0.05
+REPLAY_HEADER = "Idempotent-Replayed"
+
+# Deletes the pending marker only while it is still ours
+RELEASE_SCRIPT = redis_client.register_script("""
+local current = redis.call('GET', KEYS[1])
+if current and cjson.decode(current)['token'] == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+# Handlers currently running in this worker, keyed by Redis key
+_inflight = {}
+
+
+def fingerprint(payload) -> str:
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _key(user_id: str, scope: str, idempotency_key: str) -> str:
+    return f"orders:idem:{user_id}:{scope}:{idempotency_key}"
+
+
+def _replay(entry: dict, digest: str):
+    if entry["fingerprint"] != digest:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    return JSONResponse(entry["body"], status_code=entry["status"], headers={REPLAY_HEADER: "true"})
+
+
+async def run(user_id: str, scope: str, idempotency_key, payload, handler, status_code: int = 200):
+    """
+    Run handler() at most once per (user, scope, Idempotency-Key). The first
+    request claims the key and stores its response; a duplicate arriving
+    while it runs waits for that response, and later ones get it replayed
+    without running the handler. Failed requests release the key so the
+    client can retry. Without a key, or with Redis down, handler() just runs.
+    """
+    if idempotency_key is None:
+        return await handler()
+    if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+    key = _key(user_id, scope, idempotency_key)
+    digest = fingerprint(payload)
+
+    # Same-worker duplicates wait on the original directly; if it failed
+    # they go on to claim the key themselves
+    pending = _inflight.get(key)
+    if pending is not None:
+        entry = await asyncio.shield(pending)
+        if entry is not None:
+            return _replay(entry, digest)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IDEMPOTENCY_WAIT_SECONDS
+    token = uuid.uuid4().hex
+    marker = json.dumps({"state": "pending", "token": token, "fingerprint": digest})
+    try:
+        while True:
+            if await redis_client.set(key, marker, nx=True, px=IDEMPOTENCY_LOCK_TTL_MS):
+                break
+            current = await redis_client.get(key)
+            if current is not None:
+                entry = json.loads(current)
+                if entry["state"] == "done":
+                    return _replay(entry, digest)
+                if entry["fingerprint"] != digest:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+            # Another worker is running it (or just released the key): wait
+            if loop.time() >= deadline:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            await asyncio.sleep(POLL_SECONDS)
+    except RedisError as e:
+        print(f"Idempotency check skipped: {e}")
+        return await handler()
+
+    future = loop.create_future()
+    _inflight[key] = future
+    try:
+        body = await handler()
+        entry = {"state": "done", "fingerprint": digest, "status": status_code, "body": body}
+        try:
+            await redis_client.set(key, json.dumps(entry), ex=IDEMPOTENCY_TTL)
+        except RedisError as e:
+            print(f"Idempotent response not stored: {e}")
+        future.set_result(entry)
+        return body
+    except BaseException:
+        try:
+            await RELEASE_SCRIPT(keys=[key], args=[token])
+        except RedisError:
+            pass  # the marker expires on its own
+        raise
+    finally:
+        if not future.done():
+            future.set_result(None)
+        _inflight.pop(key, None)
@@ -0,0 +1,136 @@
+import asyncio
+
+from sqlalchemy import insert
+
+from app import order_stats
+from app.config import ORDER_BATCH_MAX_SIZE, ORDER_BATCH_MAX_WAIT_MS
+from app.database import async_session
+from app.models import Order, OrderItem
+
+ORDER_COLUMNS = ("id", "user_id", "status", "total_amount", "created_at", "updated_at")
+ITEM_COLUMNS = (
+    "id", "order_id", "order_created_at", "book_id", "book_title", "quantity", "price_at_purchase", "subtotal",
+)
+
+
+def _rows(orders):
+    order_rows = [{c: getattr(order, c) for c in ORDER_COLUMNS} for order in orders]
+    item_rows = [
+        {**{c: getattr(item, c) for c in ITEM_COLUMNS}, "order_id": order.id, "order_created_at": order.created_at}
+        for order in orders
+        for item in order.items
+    ]
+    return order_rows, item_rows
+
+
+class OrderBatcher:
+    """
+    Group commit for order creation. Concurrent callers queue fully built
+    orders; one writer task drains up to max_batch of them (waiting at most
+    max_wait for company), inserts them with two multi-row INSERTs in a
+    single transaction and resolves every caller's future. One commit, and
+    one WAL flush, then covers the whole batch.
+    """
+
+    def __init__(self, max_batch: int, max_wait_ms: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.running = False
+        self.batches = 0
+        self.orders = 0
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        self.running = True
+
+    async def stop(self):
+        """Stop taking orders and write the ones already queued."""
+        if not self.running:
+            return
+        self.running = False
+        await self._queue.put(None)
+        await self._task
+
+    async def submit(self, order: Order) -> bool:
+        """
+        Queue an order and wait until it is committed. Returns False, having
+        queued nothing, once stop() has been called: the writer may be gone.
+        """
+        if not self.running:
+            return False
+        future = asyncio.get_running_loop().create_future()
+        # No await between the check and the put, so stop() cannot slip in
+        # and the order is always ahead of the sentinel
+        self._queue.put_nowait((order, future))
+        await future
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = loop.time() + self.max_wait
+            closing = False
+            while len(batch) < self.max_batch:
+                try:
+                    entry = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        entry = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if entry is None:
+                    closing = True
+                    break
+                batch.append(entry)
+            await self._write(batch)
+            if closing:
+                return
+
+    async def _write(self, batch):
+        orders = [order for order, _ in batch]
+        order_rows, item_rows = _rows(orders)
+        try:
+            async with async_session() as session:
+                await session.execute(insert(Order), order_rows)
+                if item_rows:
+                    await session.execute(insert(OrderItem), item_rows)
+                await order_stats.apply_deltas(session, order_stats.batch_deltas(orders))
+                await session.commit()
+        except Exception as exc:
+            if len(batch) == 1:
+                _, future = batch[0]
+                if not future.done():
+                    future.set_exception(exc)
+                return
+            # Retry one by one so a single bad order fails alone
+            for entry in batch:
+                await self._write([entry])
+            return
+
+        self.batches += 1
+        self.orders += len(batch)
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "batches": self.batches,
+            "orders": self.orders,
+            "avg_batch": round(self.orders / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+
+batcher = OrderBatcher(ORDER_BATCH_MAX_SIZE, ORDER_BATCH_MAX_WAIT_MS)
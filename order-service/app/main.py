@@ -1,37 +1,127 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
-from app import crud, models, schemas, database
+from datetime import date
+from app import crud, models, schemas, database, pricing, ingest, idempotency, partitions, transitions, analytics, bestsellers, also_bought
+from app.redis_client import redis_client
+from app.config import (
+    ORDER_BATCHING_ENABLED, ORDER_PARTITION_CHECK_INTERVAL, ORDER_PARTITION_MONTHS_AHEAD,
+    ALSO_BOUGHT_TOP_K,
+)
 import asyncio
 
 app = FastAPI(title="Orders Service")
 
+
+@app.on_event("startup")
+async def startup():
+    if ORDER_BATCHING_ENABLED:
+        ingest.batcher.start()
+    asyncio.create_task(partitions.run_partition_maintenance(
+        ORDER_PARTITION_CHECK_INTERVAL, ORDER_PARTITION_MONTHS_AHEAD
+    ))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await ingest.batcher.stop()
+    await pricing.client.aclose()
+    await redis_client.aclose()
+
+
 # DB Dependency
 async def get_db_dep():
     async for db in database.get_db():
         yield db
 
 @app.post("/api/v1/orders")
-async def create_order(order: schemas.OrderCreate, db: AsyncSession = Depends(get_db_dep)):
+async def create_order(
+    order: schemas.OrderCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_db_dep),
+):
     # Dummy user_id
-    return await crud.create_order(db, "660e8400-e29b-41d4-a716-446655440000", order)
+    user_id = "660e8400-e29b-41d4-a716-446655440000"
+    return await idempotency.run(
+        user_id, "create", idempotency_key, order.model_dump(),
+        lambda: crud.create_order(db, user_id, order),
+    )
 
 @app.get("/api/v1/orders")
-async def list_orders(page: int = 1, limit: int = 20, status: Optional[str] = None, db: AsyncSession = Depends(get_db_dep)):
-    return await crud.get_orders(db, "660e8400-e29b-41d4-a716-446655440000", status, page, limit)
+async def list_orders(
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    status: Optional[str] = None,
+    paginate: str = Query("page", pattern="^(page|cursor)$"),
+    cursor: Optional[str] = None,
+    total: bool = False,
+    view: str = Query("full", pattern="^(full|summary)$"),
+    db: AsyncSession = Depends(get_db_dep),
+):
+    user_id = "660e8400-e29b-41d4-a716-446655440000"
+    # Keyset pagination: opt in with paginate=cursor or by passing a cursor
+    if paginate == "cursor" or cursor:
+        return await crud.get_orders_keyset(db, user_id, status, cursor, limit, view, total)
+    return await crud.get_orders(db, user_id, status, page, limit, view)
+
+# Declared before /{order_id} so these paths are not taken for an order id
+@app.get("/api/v1/orders/bestsellers")
+async def get_bestsellers(
+    window: str = Query("day", pattern="^(hour|day|week)$"),
+    category: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+):
+    return await bestsellers.top(window, category, limit)
+
+# Co-purchase recommendations, precomputed by build_also_bought.py
+@app.get("/api/v1/orders/also-bought/{book_id}")
+async def get_also_bought(
+    book_id: str,
+    limit: int = Query(10, ge=1, le=ALSO_BOUGHT_TOP_K),
+    db: AsyncSession = Depends(get_db_dep),
+):
+    return await also_bought.lookup(db, book_id, limit)
+
+@app.get("/api/v1/orders/stats")
+async def get_stats(db: AsyncSession = Depends(get_db_dep)):
+    return await crud.get_order_stats(db, "660e8400-e29b-41d4-a716-446655440000")
+
+# Finance reports, served from the analytics files (build_analytics.py)
+@app.get("/api/v1/orders/reports/sales")
+async def sales_report(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    top: int = Query(20, ge=1, le=100),
+    statuses: Optional[str] = Query(None, description="Comma-separated; default all but cancelled"),
+):
+    await asyncio.to_thread(analytics.dataset.reload)
+    facts = analytics.dataset.facts
+    if facts is None:
+        raise HTTPException(status_code=503, detail="Sales analytics have not been built yet")
+    return await asyncio.to_thread(facts.report, start, end, top, statuses.split(",") if statuses else None)
 
 @app.get("/api/v1/orders/{order_id}")
 async def get_order(order_id: str, db: AsyncSession = Depends(get_db_dep)):
     return await crud.get_order(db, "660e8400-e29b-41d4-a716-446655440000", order_id)
 
 @app.patch("/api/v1/orders/{order_id}/status")
-async def update_order_status(order_id: str, status: dict, db: AsyncSession = Depends(get_db_dep)):
-    return await crud.update_order_status(db, order_id, status.get("status"))
+async def update_order_status(
+    order_id: str,
+    status: dict,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_db_dep),
+):
+    user_id = "660e8400-e29b-41d4-a716-446655440000"
+    return await idempotency.run(
+        user_id, f"status:{order_id}", idempotency_key, status,
+        lambda: crud.update_order_status(db, order_id, status.get("status")),
+    )
+
+# Fulfillment: move many orders to one status in a single UPDATE
+@app.patch("/api/v1/orders/bulk")
+async def bulk_update_status(body: schemas.BulkStatusUpdate, db: AsyncSession = Depends(get_db_dep)):
+    return await transitions.bulk_transition(db, body)
 
 @app.delete("/api/v1/orders/{order_id}")
 async def delete_order(order_id: str, db: AsyncSession = Depends(get_db_dep)):
     return await crud.delete_order(db, order_id)
-
-@app.get("/api/v1/orders/stats")
-async def get_stats(db: AsyncSession = Depends(get_db_dep)):
-    return await crud.get_order_stats(db, "660e8400-e29b-41d4-a716-446655440000")
@@ -1,5 +1,7 @@
-from sqlalchemy import Column, String, Float, DateTime, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    Column, String, Float, Integer, BigInteger, DateTime, ForeignKeyConstraint, Index,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -7,6 +9,9 @@ import uuid
 
 Base = declarative_base()
 
+# orders and order_items are range-partitioned by month on the order's
+# creation time (see app.partitions), so the partition key is part of every
+# primary and foreign key.
 class Order(Base):
     __tablename__ = "orders"
 
@@ -14,19 +19,103 @@ class Order(Base):
     user_id = Column(UUID(as_uuid=True), nullable=False)
     status = Column(String, default="pending")
     total_amount = Column(Float, default=0)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Order history, newest first, with and without a status filter. The
+        # INCLUDE columns make summary pages index-only scans.
+        Index(
+            "ix_orders_user_created_id",
+            "user_id", created_at.desc(), id.desc(),
+            postgresql_include=["status", "total_amount", "updated_at"],
+        ),
+        Index(
+            "ix_orders_user_status_created_id",
+            "user_id", "status", created_at.desc(), id.desc(),
+            postgresql_include=["total_amount", "updated_at"],
+        ),
+        # Incremental analytics refreshes read orders changed since a watermark
+        Index("ix_orders_updated_at", "updated_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id"))
+    order_id = Column(UUID(as_uuid=True), index=True)
+    # Copy of orders.created_at: keeps items in their order's month
+    order_created_at = Column(DateTime, primary_key=True)
     book_id = Column(UUID(as_uuid=True), nullable=False)
     book_title = Column(String, nullable=False)
     quantity = Column(Float, nullable=False)
     price_at_purchase = Column(Float, nullable=False)
     subtotal = Column(Float, nullable=False)
     order = relationship("Order", back_populates="items")
+
+    __table_args__ = (
+        ForeignKeyConstraint(["order_id", "order_created_at"], ["orders.id", "orders.created_at"]),
+        {"postgresql_partition_by": "RANGE (order_created_at)"},
+    )
+
+
+class UserOrderStats(Base):
+    """Per-user rollup kept in step with orders by app.order_stats."""
+    __tablename__ = "user_order_stats"
+
+    user_id = Column(UUID(as_uuid=True), primary_key=True)
+    total_orders = Column(Integer, nullable=False, default=0)
+    total_spent = Column(Float, nullable=False, default=0)
+    books_purchased = Column(Float, nullable=False, default=0)
+    # {status: order count}; statuses with no orders are left out
+    status_counts = Column(JSONB, nullable=False, default=dict)
+
+
+class ArchivedOrder(Base):
+    """
+    Where an archived order lives in the cold files written by app.archive,
+    plus the figures the stats rollup needs without reading them.
+    """
+    __tablename__ = "archived_orders"
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    status = Column(String)
+    total_amount = Column(Float, nullable=False)
+    books_purchased = Column(Float, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # Path relative to ORDER_ARCHIVE_DIR, and the gzip member holding the order
+    file = Column(String, nullable=False)
+    block_offset = Column(BigInteger, nullable=False)
+    block_length = Column(Integer, nullable=False)
+
+
+class CoPurchaseCount(Base):
+    """How many orders contained both books; stored in both directions."""
+    __tablename__ = "co_purchase_counts"
+
+    book_id = Column(UUID(as_uuid=True), primary_key=True)
+    other_book_id = Column(UUID(as_uuid=True), primary_key=True)
+    orders = Column(Integer, nullable=False)
+
+
+class AlsoBought(Base):
+    """Top co-purchased books per book, best first, read with one key lookup."""
+    __tablename__ = "also_bought"
+
+    book_id = Column(UUID(as_uuid=True), primary_key=True)
+    other_book_ids = Column(ARRAY(UUID(as_uuid=True)), nullable=False)
+    orders = Column(ARRAY(Integer), nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class JobWatermark(Base):
+    """How far an incremental batch job has read."""
+    __tablename__ = "job_watermarks"
+
+    name = Column(String, primary_key=True)
+    value = Column(DateTime, nullable=False)
@@ -0,0 +1,199 @@
+from collections import Counter, defaultdict
+
+from sqlalchemy import Numeric, cast, func, literal_column, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Order, UserOrderStats
+
+
+# ------------------------------------------------------------
+# Transactional rollup updates
+# ------------------------------------------------------------
+class StatsDelta:
+    """Change to one user's rollup row, accumulated before it is written."""
+
+    def __init__(self):
+        self.orders = 0
+        self.spent = 0.0
+        self.books = 0.0
+        self.statuses = Counter()
+
+    def add_order(self, order: Order, sign: int = 1):
+        self.orders += sign
+        self.spent += sign * (order.total_amount or 0)
+        self.books += sign * sum(item.quantity for item in order.items)
+        if order.status is not None:
+            self.statuses[order.status] += sign
+
+    def move(self, old_status, new_status):
+        if old_status == new_status:
+            return
+        if old_status is not None:
+            self.statuses[old_status] -= 1
+        if new_status is not None:
+            self.statuses[new_status] += 1
+
+
+# Adds the incoming per-status deltas to the stored counts, dropping zeros
+MERGE_STATUS_COUNTS = literal_column("""(
+    SELECT coalesce(jsonb_object_agg(key, total), '{}'::jsonb)
+    FROM (
+        SELECT key, sum(value::int) AS total
+        FROM (
+            SELECT * FROM jsonb_each_text(user_order_stats.status_counts)
+            UNION ALL
+            SELECT * FROM jsonb_each_text(excluded.status_counts)
+        ) AS counts
+        GROUP BY key
+        HAVING sum(value::int) <> 0
+    ) AS merged
+)""")
+
+
+async def apply_deltas(db: AsyncSession, deltas: dict):
+    """
+    Add {user_id: StatsDelta} to the rollup inside the caller's transaction,
+    in one upsert. Rows are written in user_id order so concurrent writers
+    touching several users lock them in the same order.
+    """
+    rows = []
+    for user_id in sorted(deltas, key=str):
+        delta = deltas[user_id]
+        statuses = {status: n for status, n in delta.statuses.items() if n}
+        if not (delta.orders or delta.spent or delta.books or statuses):
+            continue
+        rows.append({
+            "user_id": user_id,
+            "total_orders": delta.orders,
+            "total_spent": round(delta.spent, 2),
+            "books_purchased": delta.books,
+            "status_counts": statuses,
+        })
+    if not rows:
+        return
+
+    stmt = insert(UserOrderStats).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserOrderStats.user_id],
+        set_={
+            "total_orders": UserOrderStats.total_orders + stmt.excluded.total_orders,
+            # Rounded on every write so float error can't pile up
+            "total_spent": func.round(
+                cast(UserOrderStats.total_spent + stmt.excluded.total_spent, Numeric), 2
+            ),
+            "books_purchased": UserOrderStats.books_purchased + stmt.excluded.books_purchased,
+            "status_counts": MERGE_STATUS_COUNTS,
+        },
+    )
+    await db.execute(stmt)
+
+
+async def order_created(db: AsyncSession, order: Order):
+    delta = StatsDelta()
+    delta.add_order(order)
+    await apply_deltas(db, {order.user_id: delta})
+
+
+async def order_deleted(db: AsyncSession, order: Order):
+    delta = StatsDelta()
+    delta.add_order(order, sign=-1)
+    await apply_deltas(db, {order.user_id: delta})
+
+
+async def status_changed(db: AsyncSession, order: Order, old_status):
+    delta = StatsDelta()
+    delta.move(old_status, order.status)
+    await apply_deltas(db, {order.user_id: delta})
+
+
+def batch_deltas(orders):
+    """One StatsDelta per user for a batch of newly created orders."""
+    deltas = defaultdict(StatsDelta)
+    for order in orders:
+        deltas[order.user_id].add_order(order)
+    return deltas
+
+
+# ------------------------------------------------------------
+# Reads
+# ------------------------------------------------------------
+def serialize_stats(stats):
+    if stats is None:
+        return {"total_orders": 0, "total_spent": 0.0, "orders_by_status": {}, "total_books_purchased": 0}
+    return {
+        "total_orders": stats.total_orders,
+        "total_spent": round(stats.total_spent, 2),
+        "orders_by_status": stats.status_counts,
+        "total_books_purchased": stats.books_purchased,
+    }
+
+
+# ------------------------------------------------------------
+# Rebuild from the orders tables (repairs drift)
+# ------------------------------------------------------------
+REBUILD_SQL = """
+WITH per_order AS (
+    SELECT o.user_id, o.status, o.total_amount, coalesce(sum(i.quantity), 0) AS books
+    FROM orders o
+    LEFT JOIN order_items i ON i.order_id = o.id AND i.order_created_at = o.created_at
+    {where}
+    GROUP BY o.id, o.created_at
+    UNION ALL
+    -- Archived orders still count towards their user's figures
+    SELECT a.user_id, a.status, a.total_amount, a.books_purchased
+    FROM archived_orders a
+    {archived_where}
+), per_status AS (
+    SELECT user_id, status, count(*) AS n
+    FROM per_order
+    WHERE status IS NOT NULL
+    GROUP BY user_id, status
+)
+INSERT INTO user_order_stats (user_id, total_orders, total_spent, books_purchased, status_counts)
+SELECT p.user_id, count(*), round(coalesce(sum(p.total_amount), 0)::numeric, 2), sum(p.books),
+       coalesce((SELECT jsonb_object_agg(s.status, s.n) FROM per_status s WHERE s.user_id = p.user_id), '{{}}'::jsonb)
+FROM per_order p
+GROUP BY p.user_id
+ON CONFLICT (user_id) DO UPDATE SET
+    total_orders = excluded.total_orders,
+    total_spent = excluded.total_spent,
+    books_purchased = excluded.books_purchased,
+    status_counts = excluded.status_counts
+WHERE (user_order_stats.total_orders, user_order_stats.total_spent,
+       user_order_stats.books_purchased, user_order_stats.status_counts)
+      IS DISTINCT FROM
+      (excluded.total_orders, excluded.total_spent,
+       excluded.books_purchased, excluded.status_counts)
+"""
+
+DELETE_ORPHANS_SQL = """
+DELETE FROM user_order_stats s
+WHERE NOT EXISTS (SELECT 1 FROM orders o WHERE o.user_id = s.user_id)
+  AND NOT EXISTS (SELECT 1 FROM archived_orders a WHERE a.user_id = s.user_id)
+{where}
+"""
+
+
+async def rebuild(db: AsyncSession, user_id=None):
+    """
+    Recompute the rollup from orders, order_items and archived_orders, for
+    one user or everyone, and return the number of rows corrected.
+    """
+    # Blocks rollup writers until commit, so the recount sees every
+    # transaction that changed an order before it
+    await db.execute(text("LOCK TABLE user_order_stats IN SHARE ROW EXCLUSIVE MODE"))
+
+    params = {}
+    order_filter = archived_filter = orphan_filter = ""
+    if user_id is not None:
+        params["user_id"] = user_id
+        order_filter = "WHERE o.user_id = :user_id"
+        archived_filter = "WHERE a.user_id = :user_id"
+        orphan_filter = "AND s.user_id = :user_id"
+
+    rebuild_sql = REBUILD_SQL.format(where=order_filter, archived_where=archived_filter)
+    fixed = await db.execute(text(rebuild_sql), params)
+    removed = await db.execute(text(DELETE_ORPHANS_SQL.format(where=orphan_filter)), params)
+    await db.commit()
+    return fixed.rowcount + removed.rowcount
@@ -0,0 +1,28 @@
+import base64
+import json
+from datetime import datetime
+from uuid import UUID
+
+from fastapi import HTTPException
+
+# ------------------------------------------------------------
+# Opaque keyset cursors
+# ------------------------------------------------------------
+# Order history is always newest first on (created_at DESC, id DESC). A
+# cursor is base64url(JSON) holding the last row's created_at and id;
+# clients must treat it as an opaque token.
+
+def encode_cursor(created_at: datetime, order_id) -> str:
+    payload = {"c": created_at.isoformat(), "id": str(order_id)}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Return (created_at, id) of the last row on the previous page."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["c"]), UUID(payload["id"])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
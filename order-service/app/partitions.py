@@ -0,0 +1,159 @@
+import asyncio
+import re
+from datetime import date, datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.database import engine
+
+# ------------------------------------------------------------
+# Monthly range partitions
+# ------------------------------------------------------------
+# orders is partitioned on created_at and order_items on order_created_at,
+# one partition per calendar month named {table}_yYYYYmMM. There is no
+# default partition: an insert for a month nobody created fails loudly
+# instead of piling rows into a catch-all that would then block creating
+# the real partition. ensure_partitions keeps ORDER_PARTITION_MONTHS_AHEAD
+# months ready in advance.
+PARTITIONED_TABLES = ("orders", "order_items")
+PARTITION_NAME = re.compile(r"^(?P<table>\w+)_y(?P<year>\d{4})m(?P<month>\d{2})$")
+
+# Any constant works; it only has to be unique among this app's advisory locks
+PARTITION_LOCK_ID = 41_001
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+async def ensure_partitions(conn: AsyncConnection, first: date, last: date):
+    """
+    Create the monthly partitions of both tables for every month from first
+    to last (inclusive) that does not exist yet. Serialized across workers
+    with a transaction-scoped advisory lock; call inside a transaction.
+    """
+    await conn.execute(text(f"SELECT pg_advisory_xact_lock({PARTITION_LOCK_ID})"))
+    month, created = month_start(first), []
+    while month <= last:
+        upper = add_months(month, 1)
+        for table in PARTITIONED_TABLES:
+            name = partition_name(table, month)
+            exists = await conn.execute(text("SELECT to_regclass(:name)"), {"name": name})
+            if exists.scalar() is None:
+                await conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+                ))
+                created.append(name)
+        month = upper
+    return created
+
+
+async def list_partitions(conn: AsyncConnection, table: str):
+    """[(month, partition name)] for the monthly partitions of table."""
+    result = await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:table AS regclass)"
+    ), {"table": table})
+    partitions = []
+    for (name,) in result:
+        match = PARTITION_NAME.match(name)
+        if match and match["table"] == table:
+            partitions.append((date(int(match["year"]), int(match["month"]), 1), name))
+    return sorted(partitions)
+
+
+async def drop_empty_partitions(conn: AsyncConnection, before: date):
+    """
+    Drop the partitions of months that ended before `before` once archival
+    has emptied them, items first because of the foreign key. Returns the
+    dropped months.
+    """
+    await conn.execute(text(f"SELECT pg_advisory_xact_lock({PARTITION_LOCK_ID})"))
+    dropped = []
+    for month, orders_partition in await list_partitions(conn, "orders"):
+        if add_months(month, 1) > month_start(before):
+            continue
+        items_partition = partition_name("order_items", month)
+        has_orders = await conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {orders_partition})"))
+        if has_orders.scalar():
+            continue
+        await conn.execute(text(f"DROP TABLE IF EXISTS {items_partition}"))
+        await conn.execute(text(f"DROP TABLE {orders_partition}"))
+        dropped.append(month)
+    return dropped
+
+
+# ------------------------------------------------------------
+# One-off conversion of pre-partitioning tables
+# ------------------------------------------------------------
+async def set_aside_legacy_tables(conn: AsyncConnection, index_names):
+    """
+    If orders exists but is not partitioned, rename both tables to
+    *_legacy and drop their keys and the named indexes, so the partitioned
+    tables can be created under the original names. Returns the earliest
+    order month, or None when there was nothing to convert.
+    """
+    result = await conn.execute(text(
+        "SELECT to_regclass('orders') IS NOT NULL, "
+        "EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('orders'))"
+    ))
+    exists, partitioned = result.one()
+    if not exists or partitioned:
+        return None
+
+    await conn.execute(text("ALTER TABLE order_items RENAME TO order_items_legacy"))
+    await conn.execute(text("ALTER TABLE orders RENAME TO orders_legacy"))
+    await conn.execute(text("ALTER TABLE order_items_legacy DROP CONSTRAINT IF EXISTS order_items_pkey"))
+    await conn.execute(text("ALTER TABLE orders_legacy DROP CONSTRAINT IF EXISTS orders_pkey CASCADE"))
+    for name in index_names:
+        await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    first = await conn.execute(text(
+        "SELECT min(coalesce(created_at, updated_at, now())) FROM orders_legacy"
+    ))
+    return month_start(first.scalar() or datetime.utcnow())
+
+
+async def copy_legacy_tables(conn: AsyncConnection):
+    """Move the *_legacy rows into the partitioned tables and drop them."""
+    await conn.execute(text(
+        "INSERT INTO orders (id, user_id, status, total_amount, created_at, updated_at) "
+        "SELECT id, user_id, status, total_amount, "
+        "       coalesce(created_at, updated_at, now()), updated_at "
+        "FROM orders_legacy"
+    ))
+    await conn.execute(text(
+        "INSERT INTO order_items (id, order_id, order_created_at, book_id, book_title, "
+        "                         quantity, price_at_purchase, subtotal) "
+        "SELECT i.id, i.order_id, coalesce(o.created_at, o.updated_at, now()), i.book_id, "
+        "       i.book_title, i.quantity, i.price_at_purchase, i.subtotal "
+        "FROM order_items_legacy i JOIN orders_legacy o ON o.id = i.order_id"
+    ))
+    await conn.execute(text("DROP TABLE order_items_legacy"))
+    await conn.execute(text("DROP TABLE orders_legacy"))
+
+
+async def run_partition_maintenance(interval: int, months_ahead: int):
+    """Background loop: keep the coming months' partitions created."""
+    while True:
+        try:
+            this_month = month_start(datetime.utcnow())
+            async with engine.begin() as conn:
+                created = await ensure_partitions(conn, this_month, add_months(this_month, months_ahead))
+            if created:
+                print(f"Order partitions created: {', '.join(created)}")
+        except Exception as e:
+            print(f"Order partition maintenance failed: {e}")
+        await asyncio.sleep(interval)
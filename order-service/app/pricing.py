@@ -0,0 +1,115 @@
+import time
+from typing import NamedTuple, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from app.config import BOOKS_SERVICE_URL, BOOKS_SERVICE_TIMEOUT, PRICE_CACHE_TTL
+
+# The books service accepts at most this many ids per batch call
+MAX_BATCH_IDS = 500
+
+# One pooled keep-alive client per worker; closed on shutdown
+client = httpx.AsyncClient(
+    base_url=BOOKS_SERVICE_URL,
+    timeout=BOOKS_SERVICE_TIMEOUT,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+)
+
+
+class Quote(NamedTuple):
+    title: str
+    price: float
+    category: Optional[str] = None
+
+
+# ------------------------------------------------------------
+# Local price cache
+# ------------------------------------------------------------
+class PriceCache:
+    """Per-worker book_id -> Quote map with a short TTL."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # book_id -> (Quote, fetched_at)
+
+    def get_many(self, book_ids):
+        """Return (fresh quotes, ids that need fetching)."""
+        now = time.monotonic()
+        found, missing = {}, []
+        for book_id in book_ids:
+            entry = self._entries.get(book_id)
+            if entry and now - entry[1] < self.ttl:
+                found[book_id] = entry[0]
+            else:
+                missing.append(book_id)
+        self.hits += len(found)
+        self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, quotes: dict):
+        now = time.monotonic()
+        for book_id, quote in quotes.items():
+            self._entries[book_id] = (quote, now)
+
+
+cache = PriceCache(PRICE_CACHE_TTL)
+
+
+# ------------------------------------------------------------
+# Books service calls
+# ------------------------------------------------------------
+async def fetch_quotes(book_ids):
+    """Title and price for each id: one batch call per MAX_BATCH_IDS ids."""
+    book_ids = list(book_ids)
+    quotes = {}
+    for start in range(0, len(book_ids), MAX_BATCH_IDS):
+        chunk = book_ids[start:start + MAX_BATCH_IDS]
+        try:
+            response = await client.post(
+                "/api/v1/books:batch",
+                json={"ids": [str(book_id) for book_id in chunk], "fields": ["id", "title", "price", "category"]},
+            )
+        except httpx.HTTPError:
+            raise HTTPException(status_code=503, detail="Books service unavailable")
+        if response.status_code != 200:
+            raise HTTPException(status_code=502, detail="Books service error")
+        by_id = {str(book_id): book_id for book_id in chunk}
+        for book in response.json()["items"]:
+            quotes[by_id[book["id"]]] = Quote(book["title"], float(book["price"]), book.get("category"))
+    cache.put_many(quotes)
+    return quotes
+
+
+async def quote(book_ids):
+    """
+    Quotes for every id, from the cache or one batched fetch for the rest.
+    Returns (quotes, ids served from the cache). Unknown books are a 400.
+    """
+    quotes, missing = cache.get_many(set(book_ids))
+    cached = set(quotes)
+    if missing:
+        quotes.update(await fetch_quotes(missing))
+
+    unknown = [str(book_id) for book_id in book_ids if book_id not in quotes]
+    if unknown:
+        raise HTTPException(status_code=400, detail={"message": "Book not found", "book_ids": unknown})
+    return quotes, cached
+
+
+async def verify(quotes: dict, cached):
+    """
+    Re-read the cached quotes and return the ones that changed. If the books
+    service cannot be reached the cached prices stand: they are at most
+    PRICE_CACHE_TTL seconds old.
+    """
+    if not cached:
+        return {}
+    try:
+        fresh = await fetch_quotes(cached)
+    except HTTPException as exc:
+        print(f"Price check skipped: {exc.detail}")
+        return {}
+    return {book_id: q for book_id, q in fresh.items() if quotes.get(book_id) != q}
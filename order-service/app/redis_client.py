@@ -0,0 +1,11 @@
+import redis.asyncio as redis
+
+from app.config import REDIS_HOST, REDIS_PORT, REDIS_DB
+
+# One pooled client per worker, shared by idempotency keys and leaderboards
+redis_client = redis.Redis(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    decode_responses=True
+)
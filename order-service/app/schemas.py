@@ -1,5 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional
+from uuid import UUID
 from datetime import datetime
 
 class OrderItemCreate(BaseModel):
@@ -30,3 +31,25 @@ class OrderOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class BulkStatusFilter(BaseModel):
+    status: Optional[str] = None
+    user_id: Optional[UUID] = None
+    created_before: Optional[datetime] = None
+    created_after: Optional[datetime] = None
+
+class BulkStatusUpdate(BaseModel):
+    order_ids: Optional[List[UUID]] = Field(None, min_length=1, max_length=10000)
+    filter: Optional[BulkStatusFilter] = None
+    # Filter mode moves at most this many orders, oldest first
+    limit: int = Field(1000, ge=1, le=10000)
+    status: str
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if (self.order_ids is None) == (self.filter is None):
+            raise ValueError("Give exactly one of order_ids or filter")
+        if self.filter is not None and not self.filter.model_dump(exclude_none=True):
+            raise ValueError("filter needs at least one condition")
+        return self
@@ -0,0 +1,120 @@
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import order_stats
+from app.models import Order
+from app.schemas import BulkStatusUpdate
+
+# ------------------------------------------------------------
+# Order state machine
+# ------------------------------------------------------------
+# status -> statuses it may move to; delivered and cancelled are final
+TRANSITIONS = {
+    "pending": {"processing", "cancelled"},
+    "processing": {"shipped", "cancelled"},
+    "shipped": {"delivered"},
+    "delivered": set(),
+    "cancelled": set(),
+}
+
+
+def sources(target: str):
+    """Statuses an order may move to target from, sorted."""
+    if target not in TRANSITIONS:
+        raise HTTPException(
+            status_code=400,
+            detail={"message": "Unknown status", "allowed": sorted(TRANSITIONS)},
+        )
+    return sorted(s for s, targets in TRANSITIONS.items() if target in targets)
+
+
+def check_transition(current: str, target: str):
+    """Raise unless current may move to target; current must come from a locked row."""
+    if current not in sources(target):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Cannot move an order from {current} to {target}",
+        )
+
+
+# ------------------------------------------------------------
+# Bulk transitions
+# ------------------------------------------------------------
+def _candidates(body: BulkStatusUpdate, allowed):
+    """Orders to move, locked in id order so concurrent bulk calls can't deadlock."""
+    query = select(Order.id, Order.created_at, Order.status.label("old_status"))
+    query = query.where(Order.status.in_(allowed))
+    if body.order_ids is not None:
+        return query.where(Order.id.in_(body.order_ids)).order_by(Order.id).with_for_update()
+
+    f = body.filter
+    if f.status is not None:
+        query = query.where(Order.status == f.status)
+    if f.user_id is not None:
+        query = query.where(Order.user_id == f.user_id)
+    if f.created_before is not None:
+        query = query.where(Order.created_at < f.created_before)
+    if f.created_after is not None:
+        query = query.where(Order.created_at >= f.created_after)
+    # Oldest first; rows another call holds are left for the next run
+    return (
+        query.order_by(Order.created_at, Order.id)
+        .limit(body.limit)
+        .with_for_update(skip_locked=True)
+    )
+
+
+async def bulk_transition(db: AsyncSession, body: BulkStatusUpdate):
+    """
+    Move every selected order whose current status allows it to body.status
+    with one UPDATE ... FROM (locked candidates) RETURNING, in one
+    transaction. The transition rule is part of the WHERE clause, so an
+    order whose status changed concurrently is re-checked after its lock
+    wait rather than overwritten. Items are never loaded.
+    """
+    allowed = sources(body.status)
+    now = datetime.utcnow()
+
+    moved = []
+    if allowed:
+        target = _candidates(body, allowed).cte("target")
+        stmt = (
+            update(Order)
+            .where(Order.id == target.c.id, Order.created_at == target.c.created_at)
+            .values(status=body.status, updated_at=now)
+            .returning(Order.id, Order.user_id, target.c.old_status)
+            .execution_options(synchronize_session=False)
+        )
+        moved = (await db.execute(stmt)).all()
+
+    deltas = {}
+    for row in moved:
+        deltas.setdefault(row.user_id, order_stats.StatsDelta()).move(row.old_status, body.status)
+    await order_stats.apply_deltas(db, deltas)
+
+    results = [
+        {"id": str(row.id), "result": "updated", "from": row.old_status, "to": body.status}
+        for row in moved
+    ]
+
+    # With explicit ids, say why each of the others was left alone
+    if body.order_ids is not None:
+        done = {row.id for row in moved}
+        rest = [order_id for order_id in dict.fromkeys(body.order_ids) if order_id not in done]
+        current = {}
+        if rest:
+            found = await db.execute(select(Order.id, Order.status).where(Order.id.in_(rest)))
+            current = dict(found.all())
+        for order_id in rest:
+            if order_id not in current:
+                results.append({"id": str(order_id), "result": "not_found"})
+            elif current[order_id] == body.status:
+                results.append({"id": str(order_id), "result": "unchanged", "status": body.status})
+            else:
+                results.append({"id": str(order_id), "result": "invalid_transition", "from": current[order_id]})
+
+    await db.commit()
+    return {"status": body.status, "updated": len(moved), "results": results}
@@ -0,0 +1,46 @@
+"""
+Move finished orders out of the hot partitions into compressed NDJSON files
+under ORDER_ARCHIVE_DIR, then drop the monthly partitions that leaves empty.
+Files left behind by a failed earlier run, which no row points at, are
+removed first.
+GET /api/v1/orders/{id} keeps serving archived orders from the files.
+
+    python archive_orders.py                        # ORDER_ARCHIVE_* settings
+    python archive_orders.py --older-than-days 180 --statuses delivered
+
+Run it from cron. ORDER_ARCHIVE_DIR must be durable storage shared with
+every service worker.
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+
+from app import partitions
+from app.archive import archive_orders, sweep_orphans
+from app.config import ORDER_ARCHIVE_AFTER_DAYS, ORDER_ARCHIVE_BATCH_SIZE, ORDER_ARCHIVE_STATUSES
+from app.database import async_session, engine
+
+
+async def main(older_than_days: int, statuses, batch_size: int):
+    async with async_session() as session:
+        removed = await sweep_orphans(session)
+        if removed:
+            print(f"Orphaned archive files removed: {removed}")
+        moved = await archive_orders(session, older_than_days, statuses, batch_size)
+    print(f"Orders archived: {moved}")
+
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    async with engine.begin() as conn:
+        dropped = await partitions.drop_empty_partitions(conn, cutoff.date())
+    for month in dropped:
+        print(f"Dropped empty partitions for {month:%Y-%m}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive finished orders to cold storage")
+    parser.add_argument("--older-than-days", type=int, default=ORDER_ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--statuses", default=",".join(ORDER_ARCHIVE_STATUSES),
+                        help="Comma-separated statuses that count as finished")
+    parser.add_argument("--batch-size", type=int, default=ORDER_ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+    asyncio.run(main(args.older_than_days, args.statuses.split(","), args.batch_size))
@@ -0,0 +1,92 @@
+"""
+Latency of pricing one order: per-item calls to the books service against
+the batched call used by create_order.
+
+    python bench_pricing.py                       # simulated books service
+    python bench_pricing.py --latency-ms 5        # slower simulated network
+    python bench_pricing.py --url http://localhost:8002
+                                                  # real books service; prices
+                                                  # the first --lines books
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+from app import pricing
+
+
+def simulated_books_service(latency: float):
+    async def handler(request: httpx.Request):
+        await asyncio.sleep(latency)
+        if request.url.path == "/api/v1/books:batch":
+            body = json.loads(request.content)
+            items = [{"id": i, "title": f"Book {i[:8]}", "price": 19.99} for i in body["ids"]]
+            return httpx.Response(200, json={"items": items, "missing": []})
+        book_id = request.url.path.rsplit("/", 1)[-1]
+        return httpx.Response(200, json={"id": book_id, "title": f"Book {book_id[:8]}", "price": 19.99})
+
+    return httpx.MockTransport(handler)
+
+
+async def per_item_sequential(client, book_ids):
+    for book_id in book_ids:
+        (await client.get(f"/api/v1/books/{book_id}")).json()
+
+
+async def per_item_concurrent(client, book_ids):
+    await asyncio.gather(*[client.get(f"/api/v1/books/{book_id}") for book_id in book_ids])
+
+
+async def batched(client, book_ids):
+    await pricing.fetch_quotes(book_ids)
+
+
+async def cached(client, book_ids):
+    await pricing.quote(book_ids)
+
+
+async def measure(fn, client, book_ids, rounds: int):
+    await fn(client, book_ids)  # warm the connection pool
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await fn(client, book_ids)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), sorted(timings)[int(len(timings) * 0.95) - 1]
+
+
+async def main(args):
+    if args.url:
+        pricing.client = httpx.AsyncClient(base_url=args.url, timeout=5)
+        listing = (await pricing.client.get("/api/v1/books", params={"limit": args.lines})).json()
+        book_ids = [uuid.UUID(book["id"]) for book in listing["items"]]
+    else:
+        pricing.client = httpx.AsyncClient(
+            base_url="http://books", transport=simulated_books_service(args.latency_ms / 1000)
+        )
+        book_ids = [uuid.uuid4() for _ in range(args.lines)]
+
+    print(f"{len(book_ids)} order lines, {args.rounds} rounds")
+    for name, fn in [
+        ("per-item, sequential", per_item_sequential),
+        ("per-item, concurrent", per_item_concurrent),
+        ("batched", batched),
+        ("batched, warm cache", cached),
+    ]:
+        p50, p95 = await measure(fn, pricing.client, book_ids, args.rounds)
+        print(f"  {name:<22} p50 {p50:7.2f} ms   p95 {p95:7.2f} ms")
+    await pricing.client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--url", default=None)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,33 @@
+"""
+Update the co-purchase counts and the "also bought" lookup rows behind
+GET /api/v1/orders/also-bought/{book_id}.
+
+    python build_also_bought.py           # orders created since the last run
+    python build_also_bought.py --full    # recount every live order
+
+Run it from cron. Each run only reads orders created since the previous
+one (minus ALSO_BOUGHT_SETTLE_SECONDS) and only rewrites the lookup rows
+of the books those orders contain.
+"""
+import argparse
+import asyncio
+import json
+
+from app.also_bought import build
+from app.database import async_session
+
+
+async def main(full: bool):
+    async with async_session() as session:
+        summary = await build(session, full)
+    if summary is None:
+        print("Also-bought build already running elsewhere; skipped")
+    else:
+        print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the also-bought recommendations")
+    parser.add_argument("--full", action="store_true", help="Rebuild from scratch")
+    args = parser.parse_args()
+    asyncio.run(main(args.full))
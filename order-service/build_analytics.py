@@ -0,0 +1,42 @@
+"""
+Refresh the sales analytics files read by GET /api/v1/orders/reports/sales.
+
+    python build_analytics.py                 # orders changed since the last run
+    python build_analytics.py --full          # re-extract every live order
+    python build_analytics.py --report --start 2026-01-01 --end 2026-01-31
+
+Run the refresh from cron. It streams orders out of ANALYTICS_DATABASE_URL
+(a replica, ideally) and never queries the live tables for reports.
+ANALYTICS_DIR must be shared with the service workers.
+"""
+import argparse
+import asyncio
+import json
+from datetime import date
+
+from app.analytics import SalesDataset, refresh
+from app.config import ANALYTICS_DIR
+
+
+def report(path: str, start, end, top: int):
+    dataset = SalesDataset(path)
+    dataset.reload()
+    if dataset.facts is None:
+        raise SystemExit("No analytics built yet; run without --report first")
+    return dataset.facts.report(start, end, top)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh or query the sales analytics files")
+    parser.add_argument("--path", default=ANALYTICS_DIR)
+    parser.add_argument("--full", action="store_true", help="Rebuild from scratch")
+    parser.add_argument("--report", action="store_true", help="Print a report instead of refreshing")
+    parser.add_argument("--start", type=date.fromisoformat, default=None)
+    parser.add_argument("--end", type=date.fromisoformat, default=None)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+    if args.report:
+        summary = report(args.path, args.start, args.end, args.top)
+    else:
+        summary = asyncio.run(refresh(args.path, args.full))
+    print(json.dumps(summary, indent=2))
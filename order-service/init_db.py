@@ -1,11 +1,36 @@
+from datetime import datetime
+
+from app import partitions
+from app.config import ORDER_PARTITION_MONTHS_AHEAD
 from app.models import Base
 from app.database import engine
 import asyncio
 
 async def init_db():
     async with engine.begin() as conn:
+        # Databases created before partitioning: convert in this transaction
+        index_names = [i.name for t in Base.metadata.sorted_tables for i in t.indexes]
+        legacy_from = await partitions.set_aside_legacy_tables(conn, index_names)
+
         await conn.run_sync(Base.metadata.create_all)
         print("Tables created successfully.")
 
+        this_month = partitions.month_start(datetime.utcnow())
+        created = await partitions.ensure_partitions(
+            conn, min(legacy_from or this_month, this_month),
+            partitions.add_months(this_month, ORDER_PARTITION_MONTHS_AHEAD),
+        )
+        print(f"Partitions created: {len(created)}")
+
+        if legacy_from is not None:
+            await partitions.copy_legacy_tables(conn)
+            print("Existing orders moved into the partitioned tables.")
+
+        # create_all skips the indexes of tables that already exist
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
+        print("Indexes created successfully.")
+
 if __name__ == "__main__":
     asyncio.run(init_db())
@@ -0,0 +1,30 @@
+"""
+Rebuild the user_order_stats rollup behind GET /api/v1/orders/stats from
+the orders tables, correcting any rows that drifted.
+
+    python rebuild_order_stats.py                  # every user
+    python rebuild_order_stats.py --user-id <uuid> # one user
+
+Run it once after creating the table on an existing database (init_db.py
+adds it) to backfill, and from cron afterwards if drift is a concern.
+Rollup writers wait while it runs.
+"""
+import argparse
+import asyncio
+import uuid
+
+from app.database import async_session
+from app.order_stats import rebuild
+
+
+async def main(user_id):
+    async with async_session() as session:
+        fixed = await rebuild(session, user_id)
+    print(f"User order stats rebuilt: {fixed} rows corrected")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild per-user order statistics")
+    parser.add_argument("--user-id", type=uuid.UUID, default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.user_id))